@@ -0,0 +1,173 @@
+# agents/fused_agent.py
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+from gen_client import PromptPrefix, generate, generation_failed, output_budget
+from agents.meal_agent import MealPlannerAgent
+from agents.shopping_agent import ShoppingAgent
+from agents.travel_agent import TravelAgent
+
+
+SECTION_MARKERS = {
+    "meal": "=== MEAL PLAN ===",
+    "shopping": "=== SHOPPING LIST ===",
+    "travel": "=== TRAVEL ITINERARY ===",
+}
+END_MARKER = "=== END ==="
+
+# Static instructions, served from the model's context cache (see gen_client)
+FUSED_PREFIX = PromptPrefix("fused", """
+You are LifePilot, an expert vegetarian-friendly meal planner, grocery list
+generator and travel planner. Answer ALL requested sections in one reply.
+
+Rules:
+- If the user is vegetarian or mentions veg, DO NOT include any meat or fish.
+- If user is lactose intolerant or dairy is in allergies, avoid milk, yogurt, cheese,
+  cream, paneer, butter, ghee, and all milk-based products.
+- Respect dislikes and allergies strictly.
+- Keep travel realistic and family-friendly; do not repeat the meal plan in it.
+""")
+
+
+class FusedPlannerAgent:
+    """
+    Produces several sections (meal / shopping / travel) in ONE model call,
+    using delimited sections, then splits them back apart.
+    Sections missing from the answer are reported so the caller can fall
+    back to the dedicated agent for them.
+    """
+
+    def __init__(
+        self,
+        meal_agent: MealPlannerAgent,
+        shopping_agent: ShoppingAgent,
+        travel_agent: TravelAgent,
+    ):
+        self.meal_agent = meal_agent
+        self.shopping_agent = shopping_agent
+        self.travel_agent = travel_agent
+
+    def _instructions(self, section: str, query: str) -> str:
+        if section == "meal":
+            days = self.meal_agent.infer_days(query)
+            if days == 1:
+                return (
+                    "A single meal (for tonight or one meal): a short, clear description.\n"
+                    "Plain text only. You may label it Breakfast / Lunch / Dinner."
+                )
+            return (
+                f"A {days}-day meal plan with clear 'Day 1', 'Day 2', etc.\n"
+                "Plain text only. You may label meals as Breakfast / Lunch / Dinner."
+            )
+        if section == "shopping":
+            return (
+                "A MINIMAL grocery list (AT MOST 30 items) covering the ingredients\n"
+                "of the meal plan above (or of the user's request if there is none).\n"
+                "Group items into categories (e.g. \"Vegetables\", \"Fruits\",\n"
+                "\"Grains & Pulses\", \"Dairy Alternatives\", \"Spices\", \"Staples\").\n"
+                "STRICT JSON ONLY, no backticks: an array of objects with keys\n"
+                "\"category\", \"item\", \"quantity\", \"notes\" (all strings)."
+            )
+        days = self.travel_agent.infer_days(query)
+        return (
+            f"Plan EXACTLY {days} days. Plain text only, no HTML, no JSON, no bullet lists.\n"
+            "Follow exactly this structure:\n\n"
+            "Day 1\n🌅 Morning: ...\n🌞 Afternoon: ...\n🌙 Evening: ...\n\n"
+            "Mention vegetarian / vegan-friendly restaurants only when relevant."
+        )
+
+    def build_prompt(
+        self,
+        query: str,
+        memory_context: List[str],
+        prefs: Dict[str, Any],
+        sections: List[str],
+    ) -> str:
+        blocks = "\n\n".join(
+            f"{SECTION_MARKERS[sec]}\n{self._instructions(sec, query)}"
+            for sec in sections
+        )
+        layout = "\n".join(f"{SECTION_MARKERS[sec]}\n<content>" for sec in sections)
+        context_snippets = "\n".join(memory_context or [])
+
+        # Dynamic part only; the rules live in FUSED_PREFIX
+        return f"""
+User Query:
+{query}
+
+User historical context:
+{context_snippets}
+
+User preferences:
+{json.dumps(prefs, indent=2)}
+
+Requested sections and their formats:
+
+{blocks}
+
+Output format (markers exactly as shown, each on its own line, nothing else):
+{layout}
+{END_MARKER}
+"""
+
+    def split(self, raw: str, sections: List[str]) -> Dict[str, str]:
+        """Cut a fused answer back into {section: text} (missing sections omitted)."""
+        positions = []
+        for sec in sections:
+            idx = raw.find(SECTION_MARKERS[sec])
+            if idx != -1:
+                positions.append((idx, sec))
+        positions.sort()
+
+        out: Dict[str, str] = {}
+        for n, (idx, sec) in enumerate(positions):
+            start = idx + len(SECTION_MARKERS[sec])
+            end = positions[n + 1][0] if n + 1 < len(positions) else len(raw)
+            body = raw[start:end]
+            body = body.split(END_MARKER, 1)[0]
+            body = re.sub(r"^```[a-z]*\s*|\s*```$", "", body.strip())
+            if body.strip():
+                out[sec] = body.strip()
+        return out
+
+    def output_budget(self, query: str, sections: List[str]) -> Optional[int]:
+        """Sum of the dedicated agents' budgets (None if any is uncapped)."""
+        budgets = []
+        for sec in sections:
+            if sec == "meal":
+                budgets.append(output_budget("meal", self.meal_agent.infer_days(query)))
+            elif sec == "travel":
+                budgets.append(output_budget("travel", self.travel_agent.infer_days(query)))
+            else:
+                budgets.append(output_budget(sec))
+        return None if None in budgets else sum(budgets)
+
+    def run(
+        self,
+        query: str,
+        memory_context: List[str],
+        prefs: Dict[str, Any],
+        sections: List[str],
+    ) -> Dict[str, Any]:
+        """
+        Returns {section: value} for every section that came back usable;
+        "shopping" is parsed into the structured item list.
+        """
+        raw = generate(
+            self.build_prompt(query, memory_context, prefs, sections),
+            max_output_tokens=self.output_budget(query, sections),
+            prefix=FUSED_PREFIX,
+        ).strip()
+        if generation_failed(raw):
+            return {}
+
+        parts: Dict[str, Any] = self.split(raw, sections)
+        if "shopping" in parts:
+            items = self.shopping_agent.parse(parts["shopping"])
+            if isinstance(items, list):
+                parts["shopping"] = items
+            else:
+                del parts["shopping"]  # let the dedicated agent retry
+        return parts
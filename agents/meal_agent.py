@@ -1,9 +1,46 @@
 # agents/meal_agent.py
 
 import re
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
-from gen_client import generate
+from gen_client import PromptPrefix, generate, generation_failed, output_budget
+from utils.plans import MealPlan
+
+
+# Static instructions, served from the model's context cache (see gen_client)
+MEAL_PREFIX = PromptPrefix("meal", """
+You are an expert vegetarian-friendly meal planner.
+
+Rules:
+- If the user is vegetarian or mentions veg, DO NOT include any meat or fish.
+- If user is lactose intolerant or dairy is in allergies, avoid milk, yogurt, cheese,
+  cream, paneer, butter, ghee, and all milk-based products.
+- Respect dislikes and allergies strictly.
+
+Format:
+- Plain text only.
+- No JSON, no code fences.
+- You may label meals as Breakfast / Lunch / Dinner if helpful.
+""")
+
+
+# Slot-level edits of an existing plan (only the changed slots are written)
+MEAL_EDIT_PREFIX = PromptPrefix("meal_edit", """
+You are an expert vegetarian-friendly meal planner revising single meals
+of an existing plan according to the user's request.
+
+Rules:
+- If the user is vegetarian or mentions veg, DO NOT include any meat or fish.
+- If user is lactose intolerant or dairy is in allergies, avoid milk, yogurt, cheese,
+  cream, paneer, butter, ghee, and all milk-based products.
+- Respect dislikes and allergies strictly.
+- Do not repeat a dish that is already on the same day.
+
+Return ONLY one line per requested slot, nothing else, exactly:
+Day N | Slot | new dish
+""")
+
+EDIT_LINE = re.compile(r"^\W*Day\s*(\d+)\s*\|\s*([A-Za-z]+)\s*\|\s*(.+)$", re.IGNORECASE)
 
 
 class MealPlannerAgent:
@@ -62,8 +99,6 @@ class MealPlannerAgent:
             days_instructions = f"Return a {num_days}-day meal plan with clear 'Day 1', 'Day 2', etc.\n"
 
         prompt = f"""
-You are an expert vegetarian-friendly meal planner.
-
 User Query:
 {query}
 
@@ -77,17 +112,63 @@ User preferences:
 - Allergies or intolerances: {allergies}
 - Preferred spice level: {spice}
 
-Rules:
-- If the user is vegetarian or mentions veg, DO NOT include any meat or fish.
-- If user is lactose intolerant or dairy is in allergies, avoid milk, yogurt, cheese,
-  cream, paneer, butter, ghee, and all milk-based products.
-- Respect dislikes and allergies strictly.
+{days_instructions}"""
 
-{days_instructions}
-Format:
-- Plain text only.
-- No JSON, no code fences.
-- You may label meals as Breakfast / Lunch / Dinner if helpful.
-"""
+        return generate(
+            prompt, max_output_tokens=output_budget("meal", num_days), prefix=MEAL_PREFIX
+        ).strip()
 
-        return generate(prompt).strip()
+    def edit(
+        self,
+        request: str,
+        plan: MealPlan,
+        targets: List[Tuple[int, str]],
+        prefs: Dict[str, Any],
+        use_cache: bool = True,
+    ) -> Dict[Tuple[int, str], str]:
+        """
+        Rewrite only `targets` ((day, slot) pairs) of `plan`; the prompt
+        carries just the affected days. Returns {(day, slot): new dish} for
+        the slots the model answered.
+        """
+        days = sorted({d for d, _ in targets})
+        current = "\n".join(
+            f"Day {d}: " + "; ".join(f"{slot}: {dish}" for slot, dish in plan.days[d].items())
+            for d in days
+        )
+        wanted = "\n".join(f"Day {d} | {slot}" for d, slot in targets)
+
+        prompt = f"""
+User request:
+{request}
+
+User preferences:
+- Diet type: {prefs.get("diet_type") or "Not specified"}
+- Dislikes: {", ".join(prefs.get("dislikes", [])) or "None"}
+- Allergies or intolerances: {", ".join(prefs.get("allergies", [])) or "None"}
+
+Current meals on the affected days:
+{current}
+
+Slots to rewrite:
+{wanted}
+"""
+        raw = generate(
+            prompt,
+            use_cache=use_cache,
+            max_output_tokens=output_budget("meal_edit", len(targets)),
+            prefix=MEAL_EDIT_PREFIX,
+        )
+        if generation_failed(raw):
+            return {}
+
+        wanted_set = set(targets)
+        out: Dict[Tuple[int, str], str] = {}
+        for line in raw.splitlines():
+            m = EDIT_LINE.match(line.strip())
+            if not m:
+                continue
+            key = (int(m.group(1)), m.group(2).capitalize())
+            if key in wanted_set:
+                out[key] = m.group(3).strip()
+        return out
@@ -2,14 +2,52 @@
 
 import json
 import ast
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Tuple, Union
 
-from gen_client import generate
+from gen_client import PromptPrefix, generate, output_budget
+from utils.plans import MealPlan
+
+
+# Static instructions, served from the model's context cache (see gen_client)
+SHOPPING_PREFIX = PromptPrefix("shopping", """
+You are a grocery list generator.
+
+Given the dishes of a meal plan (with how many times each is served),
+create a MINIMAL shopping list (covering required ingredients) with
+AT MOST 30 items.
+
+Rules:
+- Group items into categories (e.g., "Vegetables", "Fruits",
+  "Grains & Pulses", "Dairy Alternatives", "Spices", "Staples").
+- If the user is lactose intolerant, prefer dairy-free alternatives.
+- Return STRICT JSON ONLY.
+- DO NOT wrap in backticks.
+- Structure: a JSON array of objects, each with keys:
+  - "category": string
+  - "item": string
+  - "quantity": string
+  - "notes": string
+""")
+
+
+# Add / remove diff for an existing list after some dishes changed
+SHOPPING_DIFF_PREFIX = PromptPrefix("shopping_diff", """
+You are a grocery list generator updating an existing list after some
+dishes in a meal plan were replaced.
+
+Rules:
+- Add only ingredients the new dishes need that the list does not cover.
+- Remove only items that were needed just by the removed dishes.
+- If the user is lactose intolerant, prefer dairy-free alternatives.
+- Return STRICT JSON ONLY, no backticks, exactly:
+  {"add": [{"category": string, "item": string, "quantity": string, "notes": string}],
+   "remove": [item name as written in the current list]}
+""")
 
 
 class ShoppingAgent:
     """
-    Takes a meal plan text and produces a structured shopping list
+    Takes a parsed MealPlan and produces a structured shopping list
     as a list of dicts: [{category, item, quantity, notes}, ...]
     """
 
@@ -23,36 +61,34 @@ class ShoppingAgent:
 
     def run(
         self,
-        meal_plan_text: str,
+        plan: MealPlan,
         prefs: Dict[str, Any]
     ) -> Union[List[Dict[str, Any]], str]:
 
+        # Distinct dishes with counts instead of the whole plan text; an
+        # unstructured plan is sent as is
+        if plan.structured:
+            dishes = "\n".join(
+                f"- {dish}" + (f" (x{n})" if n > 1 else "") for dish, n in plan.dish_counts()
+            )
+        else:
+            dishes = plan.raw
         prompt = f"""
-You are a grocery list generator.
-
-Given the following meal plan, create a MINIMAL shopping list
-(covering required ingredients) with AT MOST 30 items.
-
-Meal plan:
-\"\"\"{meal_plan_text}\"\"\"
+Meal plan dishes:
+\"\"\"{dishes}\"\"\"
 
 User preferences (may affect ingredients):
 {json.dumps(prefs, indent=2)}
-
-Rules:
-- Group items into categories (e.g., "Vegetables", "Fruits",
-  "Grains & Pulses", "Dairy Alternatives", "Spices", "Staples").
-- If the user is lactose intolerant, prefer dairy-free alternatives.
-- Return STRICT JSON ONLY.
-- DO NOT wrap in backticks.
-- Structure: a JSON array of objects, each with keys:
-  - "category": string
-  - "item": string
-  - "quantity": string
-  - "notes": string
 """
 
-        raw = generate(prompt).strip()
+        raw = generate(
+            prompt, max_output_tokens=output_budget("shopping"), prefix=SHOPPING_PREFIX
+        ).strip()
+        return self.parse(raw)
+
+    def parse(self, raw: str) -> Union[List[Dict[str, Any]], str]:
+        """Parse a model answer into the item list (raw text if unparseable)."""
+        raw = raw.strip()
         candidate = self._extract_json_array(raw)
 
         # Try JSON directly
@@ -74,3 +110,59 @@ Rules:
 
         # Fallback: return raw text so UI still shows something
         return raw
+
+    # ---------------------------------------------------------
+    # INCREMENTAL UPDATE
+    # ---------------------------------------------------------
+    def diff(
+        self,
+        removed_dishes: List[str],
+        added_dishes: List[str],
+        items: List[Dict[str, Any]],
+        prefs: Dict[str, Any],
+    ) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """(items to add, item names to remove) for swapped dishes; ([], []) on failure."""
+        current = "\n".join(f"- {row.get('category', '')}: {row.get('item', '')}" for row in items)
+        prompt = f"""
+Removed dishes:
+{chr(10).join(f"- {d}" for d in removed_dishes) or "- none"}
+
+Added dishes:
+{chr(10).join(f"- {d}" for d in added_dishes) or "- none"}
+
+Current list:
+{current or "- (empty)"}
+
+User preferences (may affect ingredients):
+{json.dumps(prefs, indent=2)}
+"""
+        raw = generate(
+            prompt, max_output_tokens=output_budget("shopping_diff"), prefix=SHOPPING_DIFF_PREFIX
+        ).strip()
+        start, end = raw.find("{"), raw.rfind("}")
+        try:
+            data = json.loads(raw[start:end + 1]) if start != -1 else {}
+        except ValueError:
+            return [], []
+        if not isinstance(data, dict):
+            return [], []
+        add = [row for row in data.get("add") or [] if isinstance(row, dict) and row.get("item")]
+        remove = [str(name) for name in data.get("remove") or [] if name]
+        return add, remove
+
+    def apply_diff(
+        self,
+        items: List[Dict[str, Any]],
+        add: List[Dict[str, Any]],
+        remove: List[str],
+    ) -> List[Dict[str, Any]]:
+        """New list: `remove` dropped by item name, `add` appended (no duplicates), max 30."""
+        gone = {name.strip().lower() for name in remove}
+        out = [row for row in items if str(row.get("item", "")).strip().lower() not in gone]
+        have = {str(row.get("item", "")).strip().lower() for row in out}
+        for row in add:
+            name = str(row.get("item", "")).strip().lower()
+            if name not in have:
+                have.add(name)
+                out.append({k: str(row.get(k, "")) for k in ("category", "item", "quantity", "notes")})
+        return out[:30]
@@ -1,9 +1,61 @@
 # agents/travel_agent.py
 
+import contextvars
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 
-from gen_client import generate
+from gen_client import PromptPrefix, generate, generation_failed, output_budget
+
+
+# Static instructions, served from the model's context cache (see gen_client)
+TRAVEL_PREFIX = PromptPrefix("travel", """
+You are a friendly but precise travel planner.
+
+For each day, include:
+- 🌅 Morning:
+- 🌞 Afternoon:
+- 🌙 Evening:
+
+Rules:
+- Plain text only.
+- No HTML, no JSON, no bullet lists.
+- Follow exactly this structure:
+
+Day 1
+🌅 Morning: ...
+🌞 Afternoon: ...
+🌙 Evening: ...
+
+Day 2
+...
+
+Keep it realistic and family-friendly.
+Mention vegetarian / vegan-friendly restaurants only when relevant,
+but do not output a separate meal plan.
+""")
+
+# Planning call for long trips: one line per day, expanded in parallel later
+SKELETON_PREFIX = PromptPrefix("travel_skeleton", """
+You are a precise travel planner. Outline a trip before it is written out.
+
+Return ONLY one line per day, nothing else, exactly in this format:
+Day N | area or neighbourhood | theme | attraction 1, attraction 2
+
+Rules:
+- Every attraction appears on exactly one day.
+- Group nearby places on the same day; keep it realistic and family-friendly.
+""")
+
+SKELETON_LINE = re.compile(r"^\**\s*Day\s+(\d+)\s*\**\s*[|:]\s*([^|]+)\|\s*([^|]+)(?:\|\s*(.*))?$", re.IGNORECASE)
+DAY_HEADING = re.compile(r"^\s*\**\s*Day\s+\d+\b[^\n]*$", re.IGNORECASE | re.MULTILINE)
+
+# Expands day groups of long trips in parallel (shared by all users)
+_CHUNK_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TRAVEL_CHUNK_WORKERS", "4")),
+    thread_name_prefix="travel-chunk",
+)
 
 
 class TravelAgent:
@@ -69,14 +121,11 @@ class TravelAgent:
         # 6. Fallback
         return 1
 
-    def run(
-        self,
-        query: str,
-        memory_context: List[str],
-        prefs: Dict[str, Any]
-    ) -> str:
-        num_days = self.infer_days(query)
-
+    # ---------------------------------------------------------
+    # SINGLE CALL
+    # ---------------------------------------------------------
+    def _request_block(self, query: str, memory_context: List[str], prefs: Dict[str, Any]) -> str:
+        """Dynamic part shared by every travel prompt."""
         cuisines = ", ".join(prefs.get("cuisines", [])) or "Not specified"
         diet = prefs.get("diet_type") or "Not specified"
         allergies = ", ".join(prefs.get("allergies", [])) or "None"
@@ -84,9 +133,7 @@ class TravelAgent:
 
         context_snippets = "\n".join(memory_context or [])
 
-        prompt = f"""
-You are a friendly but precise travel planner.
-
+        return f"""
 User Query:
 {query}
 
@@ -99,30 +146,160 @@ User food preferences (for suggesting vegetarian-friendly places only):
 - Allergies: {allergies}
 
 User travel style (if any): {travel_style}
+"""
+
+    def run(
+        self,
+        query: str,
+        memory_context: List[str],
+        prefs: Dict[str, Any]
+    ) -> str:
+        num_days = self.infer_days(query)
+        if self.chunk_plan(num_days):
+            return self.run_chunked(query, memory_context, prefs, num_days)
+        return self._single(query, memory_context, prefs, num_days)
 
-Plan EXACTLY {num_days} days.
+    # ---------------------------------------------------------
+    # CHUNKED (long trips): skeleton → parallel expansion → stitch
+    # ---------------------------------------------------------
+    def chunk_plan(self, num_days: int) -> List[List[int]]:
+        """
+        Day groups expanded in parallel, or [] for a single call.
+        Trips of TRAVEL_CHUNK_MIN_DAYS+ days are split into groups of
+        TRAVEL_CHUNK_DAYS (0 disables chunking).
+        """
+        min_days = int(os.getenv("TRAVEL_CHUNK_MIN_DAYS", "5"))
+        size = int(os.getenv("TRAVEL_CHUNK_DAYS", "3"))
+        if min_days <= 0 or size <= 0 or num_days < min_days:
+            return []
+        days = list(range(1, num_days + 1))
+        return [days[i:i + size] for i in range(0, num_days, size)]
 
-For each day, include:
-- 🌅 Morning:
-- 🌞 Afternoon:
-- 🌙 Evening:
+    def skeleton(
+        self, query: str, memory_context: List[str], prefs: Dict[str, Any], num_days: int
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        One short call: {day: {"area", "theme", "attractions"}}. An attraction
+        listed on several days is kept on the first one only. {} if unusable.
+        """
+        prompt = self._request_block(query, memory_context, prefs) + f"\nTrip length: {num_days} days."
+        raw = generate(
+            prompt, max_output_tokens=output_budget("travel_skeleton", num_days), prefix=SKELETON_PREFIX
+        )
+        if generation_failed(raw):
+            return {}
 
-Rules:
-- Plain text only.
-- No HTML, no JSON, no bullet lists.
-- Follow exactly this structure:
+        plan: Dict[int, Dict[str, Any]] = {}
+        seen = set()
+        for line in raw.splitlines():
+            m = SKELETON_LINE.match(line.strip())
+            if not m:
+                continue
+            day = int(m.group(1))
+            if not 1 <= day <= num_days or day in plan:
+                continue
+            attractions = []
+            for name in (m.group(4) or "").split(","):
+                name = name.strip()
+                if name and _norm(name) not in seen:
+                    seen.add(_norm(name))
+                    attractions.append(name)
+            plan[day] = {"area": m.group(2).strip(), "theme": m.group(3).strip(), "attractions": attractions}
+        return plan if len(plan) == num_days else {}
 
-Day 1
-🌅 Morning: ...
-🌞 Afternoon: ...
-🌙 Evening: ...
+    def _expand(
+        self,
+        request: str,
+        plan: Dict[int, Dict[str, Any]],
+        days: List[int],
+        banned: List[str],
+    ) -> str:
+        outline = "\n".join(
+            f"Day {d}: {plan[d]['area']} — {plan[d]['theme']} ({', '.join(plan[d]['attractions']) or 'free choice'})"
+            for d in sorted(plan)
+        )
+        prompt = request + f"""
+Whole-trip outline (other days are planned separately):
+{outline}
 
-Day 2
-...
+Plan ONLY days {days[0]}-{days[-1]}, following the outline for those days.
+Number them Day {days[0]} to Day {days[-1]}.
+Do NOT mention these attractions (they belong to other days): {', '.join(banned) or 'none'}."""
+        return generate(
+            prompt, max_output_tokens=output_budget("travel", len(days)), prefix=TRAVEL_PREFIX
+        ).strip()
 
-Keep it realistic and family-friendly.
-Mention vegetarian / vegan-friendly restaurants only when relevant,
-but do not output a separate meal plan.
-"""
+    def run_chunked(
+        self,
+        query: str,
+        memory_context: List[str],
+        prefs: Dict[str, Any],
+        num_days: int,
+    ) -> str:
+        """
+        Long trips: a skeleton call, then each day group expanded in
+        parallel and stitched in Day order. Falls back to one call if
+        the skeleton or any group fails.
+        """
+        plan = self.skeleton(query, memory_context, prefs, num_days)
+        chunks = self.chunk_plan(num_days)
+        if not plan:
+            return self._single(query, memory_context, prefs, num_days)
+
+        request = self._request_block(query, memory_context, prefs)
+        owned = [{a for d in chunk for a in plan[d]["attractions"]} for chunk in chunks]
+        banned = [sorted(set().union(*owned[:i], *owned[i + 1:])) for i in range(len(chunks))]
+
+        texts = self._expand_all(request, plan, chunks, banned)
+        if any(generation_failed(t) for t in texts):
+            return self._single(query, memory_context, prefs, num_days)
+
+        # Duplicate check: regenerate (once) any group that used another group's attractions
+        repeat = [i for i, t in enumerate(texts) if _mentions(t, banned[i])]
+        if repeat:
+            redo = self._expand_all(request, plan, [chunks[i] for i in repeat], [banned[i] for i in repeat])
+            for i, text in zip(repeat, redo):
+                if not generation_failed(text) and not _mentions(text, banned[i]):
+                    texts[i] = text
 
-        return generate(prompt).strip()
+        return "\n\n".join(_stitch(text, chunk) for text, chunk in zip(texts, chunks))
+
+    def _expand_all(
+        self,
+        request: str,
+        plan: Dict[int, Dict[str, Any]],
+        chunks: List[List[int]],
+        banned: List[List[str]],
+    ) -> List[str]:
+        # Own context copy per task: keeps the request deadline and parent span
+        futures = [
+            _CHUNK_POOL.submit(contextvars.copy_context().run, self._expand, request, plan, chunk, ban)
+            for chunk, ban in zip(chunks, banned)
+        ]
+        return [f.result() for f in futures]
+
+    def _single(self, query: str, memory_context: List[str], prefs: Dict[str, Any], num_days: int) -> str:
+        prompt = self._request_block(query, memory_context, prefs) + f"\nPlan EXACTLY {num_days} days."
+        return generate(
+            prompt, max_output_tokens=output_budget("travel", num_days), prefix=TRAVEL_PREFIX
+        ).strip()
+
+
+def _norm(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+def _mentions(text: str, attractions: List[str]) -> bool:
+    t = _norm(text)
+    return any(_norm(a) and f" {_norm(a)} " in f" {t} " for a in attractions)
+
+
+def _stitch(text: str, days: List[int]) -> str:
+    """
+    Re-number a group's "Day N" blocks to its trip days (models sometimes
+    restart at Day 1); left as-is when the block count does not match.
+    """
+    blocks = [b.strip() for b in DAY_HEADING.split(text) if b.strip()]
+    if len(blocks) != len(days):
+        return text.strip()
+    return "\n\n".join(f"Day {d}\n{body}" for d, body in zip(days, blocks))
@@ -0,0 +1,282 @@
+# batch.py
+"""
+Offline batch mode: run a JSONL file of queries through the Orchestrator.
+
+Input lines look like:
+    {"id": "q1", "user_id": "alice", "query": "Plan a 3-day vegetarian meal plan."}
+
+- Different users run concurrently on a worker pool; each user gets an
+  isolated Orchestrator (own VectorMemory) and their queries run in file order.
+- Model calls are throttled process-wide with --rpm (gen_client.set_rate_limit)
+  and run at "batch" priority, so a server / UI in the same process keeps
+  its share of --max-in-flight call slots.
+- The output JSONL doubles as the checkpoint: items already written with
+  status "ok" are skipped when the same command is re-run. Their queries
+  are still added to the user's memory (in order, no model call besides
+  the embedding), and their meal plan becomes the one follow-up edits
+  apply to, so later queries see the same memory and last plan as in an
+  uninterrupted run. Preferences are re-extracted from that memory.
+- A user's Orchestrator is dropped once their last item is done.
+
+Usage:
+    python batch.py queries.jsonl -o results.jsonl --workers 4 --rpm 60
+"""
+
+import argparse
+import collections
+import json
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, Iterator, Optional, Set
+
+import gen_client
+from orchestrator import Orchestrator
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    try:
+        return float(str(value).rstrip("s"))
+    except ValueError:
+        return None
+
+
+def _checkpoint_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Records finished successfully in a previous run."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # partial last line from an interrupted run
+                if rec.get("status") == "ok":
+                    yield rec
+    except FileNotFoundError:
+        return
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Ids of items already finished successfully in a previous run."""
+    return {str(rec.get("id")) for rec in _checkpoint_records(path)}
+
+
+def load_checkpoint_plans(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    id -> {"meal_plan", "shopping"} of finished items that produced a
+    structured meal plan (restored as the user's last plan on resume).
+    """
+    plans: Dict[str, Dict[str, Any]] = {}
+    for rec in _checkpoint_records(path):
+        results = rec.get("results")
+        if isinstance(results, dict) and results.get("meal_plan", {}).get("days"):
+            plans[str(rec.get("id"))] = {"meal_plan": results["meal_plan"], "shopping": results.get("shopping")}
+    return plans
+
+
+def read_items(
+    path: str, id_field: str, user_field: str, query_field: str, warn: bool = True
+) -> Iterator[Dict[str, Any]]:
+    """Stream items from the input JSONL without loading the whole file."""
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                if warn:
+                    print(f"[batch] skipping malformed line {lineno}", file=sys.stderr)
+                continue
+            yield {
+                "id": str(rec.get(id_field) or f"line-{lineno}"),
+                "user_id": str(rec.get(user_field) or "default"),
+                "query": rec.get(query_field) or "",
+            }
+
+
+class BatchRunner:
+    """
+    Per-user FIFO chains on a shared thread pool.
+    At most `max_pending` items are buffered, so huge inputs stream through.
+    """
+
+    def __init__(
+        self,
+        out_path: str,
+        workers: int = 4,
+        max_pending: int = 0,
+        timeout_s: Optional[float] = None,
+        items_per_user: Optional[Dict[str, int]] = None,
+    ):
+        self.out_path = out_path
+        self.workers = workers
+        self.timeout_s = timeout_s
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        self._pending: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._active: Set[str] = set()
+        self._orchestrators: Dict[str, Orchestrator] = {}
+        # user -> items not processed yet; at 0 the Orchestrator is released
+        self._remaining: Dict[str, int] = dict(items_per_user or {})
+        self._out = open(out_path, "a", encoding="utf-8")
+        self.counts = {"ok": 0, "error": 0}
+
+    def submit(self, item: Dict[str, Any]) -> None:
+        self._slots.acquire()
+        user = item["user_id"]
+        with self._lock:
+            self._pending.setdefault(user, deque()).append(item)
+            if user in self._active:
+                return  # the running chain for this user will pick it up
+            self._active.add(user)
+        self._pool.submit(self._drain_user, user)
+
+    def _drain_user(self, user: str) -> None:
+        while True:
+            with self._lock:
+                queue = self._pending.get(user)
+                if not queue:
+                    self._active.discard(user)
+                    self._pending.pop(user, None)
+                    return
+                item = queue.popleft()
+            try:
+                if item.get("replay"):
+                    self._replay(item)
+                else:
+                    self._write(self._process(item))
+            finally:
+                self._slots.release()
+                self._done(user)
+
+    def _done(self, user: str) -> None:
+        with self._lock:
+            left = self._remaining.get(user)
+            if left is None:
+                return  # no per-user counts: keep the Orchestrator
+            if left > 1:
+                self._remaining[user] = left - 1
+                return
+            del self._remaining[user]
+            self._orchestrators.pop(user, None)
+
+    def _replay(self, item: Dict[str, Any]) -> None:
+        """Checkpointed item: restore its query into memory and its meal plan as the last plan."""
+        try:
+            orc = self._orchestrator(item["user_id"])
+            with gen_client.priority_scope("batch"):
+                orc.memory.add(item["query"])
+            if item.get("plan"):
+                orc.restore_last_plan(item["plan"])
+        except Exception as e:
+            print(f"[batch] could not restore memory for {item['id']}: {e}", file=sys.stderr)
+
+    def _orchestrator(self, user: str) -> Orchestrator:
+        # Only the user's own chain creates / uses its Orchestrator
+        with self._lock:
+            orc = self._orchestrators.get(user)
+            if orc is None:
+                orc = self._orchestrators[user] = Orchestrator(user_id=user)
+        return orc
+
+    def _process(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        record: Dict[str, Any] = dict(item)
+        t0 = time.perf_counter()
+        try:
+            with gen_client.priority_scope("batch"):
+                results, logs = self._orchestrator(item["user_id"]).handle(
+                    item["query"], return_logs=True, timeout_s=self.timeout_s
+                )
+            record["status"] = "ok"
+            record["results"] = results
+            record["timing"] = {
+                "agents": {l["agent"]: _parse_duration(l.get("duration", "")) for l in logs},
+            }
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+            record["timing"] = {}
+        record["timing"]["total_s"] = round(time.perf_counter() - t0, 3)
+        return record
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._write_lock:
+            self._out.write(line + "\n")
+            self._out.flush()
+            self.counts[record["status"]] += 1
+
+    def cancel_pending(self) -> None:
+        """Drop queued (not yet started) items; they stay out of the checkpoint."""
+        with self._lock:
+            dropped = sum(len(q) for q in self._pending.values())
+            for q in self._pending.values():
+                q.clear()
+        for _ in range(dropped):
+            self._slots.release()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        self._out.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run a JSONL of queries through LifePilot.")
+    parser.add_argument("input", help="input JSONL file")
+    parser.add_argument("-o", "--output", required=True, help="output JSONL (also the checkpoint)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=0, help="max model calls per minute (0 = unlimited)")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="max concurrent model calls (default GEN_MAX_IN_FLIGHT, 0 = unlimited)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="per-item deadline in seconds (default REQUEST_TIMEOUT_S, 0 = none)")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--user-field", default="user_id")
+    parser.add_argument("--query-field", default="query")
+    args = parser.parse_args()
+
+    if args.rpm:
+        gen_client.set_rate_limit(args.rpm)
+    if args.max_in_flight is not None:
+        gen_client.set_max_in_flight(args.max_in_flight)
+
+    done = load_checkpoint(args.output)
+    plans = load_checkpoint_plans(args.output)
+    # First pass (ids / users only) so each user's Orchestrator can be
+    # released after their last item
+    per_user = collections.Counter(
+        item["user_id"]
+        for item in read_items(args.input, args.id_field, args.user_field, args.query_field, warn=False)
+    )
+    runner = BatchRunner(args.output, workers=args.workers, timeout_s=args.timeout, items_per_user=per_user)
+    skipped = 0
+    t0 = time.perf_counter()
+    try:
+        for item in read_items(args.input, args.id_field, args.user_field, args.query_field):
+            if item["id"] in done:
+                skipped += 1
+                item["replay"] = True
+                item["plan"] = plans.get(item["id"])
+            runner.submit(item)
+    except KeyboardInterrupt:
+        print("[batch] interrupted; finishing in-flight items (re-run to resume)", file=sys.stderr)
+        runner.cancel_pending()
+    finally:
+        runner.close()
+
+    print(
+        f"[batch] ok={runner.counts['ok']} error={runner.counts['error']} "
+        f"skipped={skipped} elapsed={time.perf_counter() - t0:.1f}s",
+        file=sys.stderr,
+    )
+    return 0 if runner.counts["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# benchmark.py
+"""
+End-to-end benchmark of Orchestrator.handle against the local fake backend.
+
+Runs the scenarios from test_cases.md and reports, per scenario:
+  - p50 / p95 / p99 latency of handle()
+  - LLM and embed calls per request
+  - generation cache hit rate
+  - input / output tokens per request (cached prefix tokens in --json)
+  - hedged requests fired / won (with --hedge)
+
+Usage:
+    python benchmark.py --iterations 20 --latency "lognormal:0.4,0.5" --error-rate 0.05
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from typing import Dict, List
+
+# The fake backend needs no API key; set before gen_client is imported.
+os.environ.setdefault("GEN_BACKEND", "fake")
+
+import gen_client
+from fake_backend import FakeBackend
+from orchestrator import Orchestrator
+
+
+# Each scenario is a list of queries sent, in order, to one fresh Orchestrator.
+SCENARIOS: Dict[str, List[str]] = {
+    "meal_multi_day": ["Plan a 4-day vegetarian South Indian meal plan."],
+    "meal_single": ["What should I cook tonight?"],
+    "shopping_only": [
+        "Make a shopping list for this:\nDay 1: Veggie fried rice\nDay 2: Paneer tikka and roti"
+    ],
+    "travel_restaurants": ["Plan a 2-day trip to Dallas with vegetarian restaurants."],
+    "travel_one_day": ["Plan a one day trip to Austin."],
+    "multi_intent": ["Plan next week: meals, groceries, and a 1-day trip to Austin."],
+    "preference_memory": ["I am allergic to peanuts.", "Plan meals for 2 days."],
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (pct in 0–100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def run_scenario(queries: List[str], iterations: int, cold: bool) -> Dict[str, float]:
+    latencies: List[float] = []
+    totals = {k: 0 for k in gen_client.get_stats()}
+    requests = 0
+
+    for _ in range(iterations):
+        if cold:
+            gen_client.clear_cache()
+        orc = Orchestrator()
+        for q in queries:
+            gen_client.reset_stats()
+            t0 = time.perf_counter()
+            orc.handle(q)
+            latencies.append(time.perf_counter() - t0)
+            requests += 1
+            for k, v in gen_client.get_stats().items():
+                totals[k] += v
+
+    lookups = totals["cache_hits"] + totals["cache_misses"]
+    return {
+        "requests": requests,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "llm_calls_per_req": totals["llm_calls"] / max(1, requests),
+        "embed_calls_per_req": totals["embed_calls"] / max(1, requests),
+        "cache_hit_rate": totals["cache_hits"] / lookups if lookups else 0.0,
+        "rate_limited": totals["rate_limited"],
+        "input_tokens_per_req": totals["input_tokens"] / max(1, requests),
+        "output_tokens_per_req": totals["output_tokens"] / max(1, requests),
+        "cached_tokens_per_req": totals["cached_tokens"] / max(1, requests),
+        "hedges_fired": totals["hedges_fired"],
+        "hedges_won": totals["hedges_won"],
+    }
+
+
+def print_table(report: Dict[str, Dict[str, float]]) -> None:
+    header = f"{'scenario':<20} {'reqs':>5} {'p50':>7} {'p95':>7} {'p99':>7} {'llm/req':>8} {'emb/req':>8} {'in_tok':>7} {'out_tok':>7} {'hit%':>6} {'429s':>5} {'hedge':>5} {'won':>5}"
+    print(header)
+    print("-" * len(header))
+    for name, r in report.items():
+        print(
+            f"{name:<20} {r['requests']:>5} {r['p50_s']:>7.3f} {r['p95_s']:>7.3f} {r['p99_s']:>7.3f} "
+            f"{r['llm_calls_per_req']:>8.2f} {r['embed_calls_per_req']:>8.2f} "
+            f"{r['input_tokens_per_req']:>7.0f} {r['output_tokens_per_req']:>7.0f} "
+            f"{100 * r['cache_hit_rate']:>6.1f} {r['rate_limited']:>5} "
+            f"{r['hedges_fired']:>5} {r['hedges_won']:>5}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="LifePilot end-to-end benchmark (fake backend).")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--latency", default="lognormal:0.4,0.5", help="generate() latency spec")
+    parser.add_argument("--embed-latency", default="const:0.05", help="embed() latency spec")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="injected 429 rate (0–1)")
+    parser.add_argument("--slots", type=int, default=1, help="number of fake API key slots")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply all fake latencies")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--scenario", action="append", help="run only these scenarios")
+    parser.add_argument("--cold", action="store_true", help="clear the generation cache every iteration")
+    parser.add_argument("--hedge", action="store_true", help="enable hedged requests (GEN_HEDGE)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.hedge:
+        gen_client.set_hedging(True)
+
+    gen_client.set_backend(FakeBackend(
+        latency=args.latency,
+        embed_latency=args.embed_latency,
+        error_rate=args.error_rate,
+        num_slots=args.slots,
+        seed=args.seed,
+        time_scale=args.time_scale,
+    ))
+
+    names = args.scenario or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenario(s): {', '.join(unknown)}")
+        return 1
+
+    report = {n: run_scenario(SCENARIOS[n], args.iterations, args.cold) for n in names}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+# cassette.py
+"""
+Record / replay of model traffic ("cassettes").
+
+RecordingBackend wraps any backend (gen_client.GeminiBackend, FakeBackend)
+and appends one JSON line per call to a cassette file:
+  - "request":  user, query, timeout_s (Orchestrator.handle, so the same
+                traffic can be re-run with replay.py)
+  - "generate": model, full prompt (a context-cached prefix is expanded),
+                max_output_tokens, latency_s, text + usage or the error
+  - "embed":    model, texts, dim, latency_s, vectors (base64 float32)
+                or the error
+A ".gz" suffix writes the file gzip-compressed.
+
+ReplayBackend serves a cassette with no network: generate calls are
+matched on (model, prompt), embeddings per (model, text, dim). Calls with
+the same key get the recorded answers in recorded order (errors included,
+so retries replay too); once those run out, the last one repeats.
+timing=True also sleeps the recorded latency (x time_scale). Unmatched
+calls go to `fallback` (e.g. a FakeBackend) or fail with a non-retryable
+error; they are counted in `calls["misses"]`.
+
+    GEN_RECORD=traffic.jsonl.gz streamlit run ui/app.py     # record
+    GEN_BACKEND=replay GEN_REPLAY=traffic.jsonl.gz ...       # replay
+    python replay.py traffic.jsonl.gz --timing               # re-run requests
+"""
+
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+CASSETTE_VERSION = 1
+USAGE_FIELDS = (
+    "prompt_token_count", "candidates_token_count", "thoughts_token_count", "cached_content_token_count",
+)
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack(values) -> str:
+    return base64.b64encode(np.asarray(values, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _unpack(data: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).tolist()
+
+
+def read_cassette(path: str) -> Iterator[Dict[str, Any]]:
+    with _open(path, "r") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # partial last line of an interrupted recording
+        except EOFError:
+            return  # gzip stream of a process that was killed mid-recording
+
+
+# ==========================================================
+# RECORD
+# ==========================================================
+class RecordingBackend:
+    """Pass-through backend that writes every call to a cassette."""
+
+    def __init__(self, inner, path: str):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+        self._caches: Dict[str, str] = {}  # cache name -> prefix text
+        self._file = _open(path, "a")
+        atexit.register(self.close)  # ends the gzip stream cleanly
+        self._write({
+            "type": "header", "version": CASSETTE_VERSION, "created": time.time(),
+            "backend": type(inner).__name__, "num_slots": self.num_slots,
+        })
+
+    @property
+    def num_slots(self) -> int:
+        return self.inner.num_slots
+
+    def __getattr__(self, name: str):
+        # connect() etc. of the wrapped backend
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def _elapsed(self) -> float:
+        return round(time.monotonic() - self._t0, 4)
+
+    def record_request(self, user: str, query: str, timeout_s: Optional[float] = None) -> None:
+        self._write({"type": "request", "t": self._elapsed(), "user": user, "query": query, "timeout_s": timeout_s})
+
+    def generate_content(
+        self,
+        model: str,
+        prompt: str,
+        slot: int = 0,
+        timeout: Optional[float] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_content: Optional[str] = None,
+    ):
+        record: Dict[str, Any] = {
+            "type": "generate", "t": self._elapsed(), "model": model, "slot": slot,
+            "max_output_tokens": max_output_tokens,
+        }
+        full_prompt = prompt
+        if cached_content is not None:
+            with self._lock:
+                prefix = self._caches.get(cached_content)
+            # What the replayed run sends inline (PromptPrefix.render)
+            full_prompt = f"{prefix}\n\n{prompt.strip()}" if prefix is not None else prompt
+            record["cached"] = True
+        record["prompt"] = full_prompt
+        t0 = time.perf_counter()
+        try:
+            if cached_content is not None:
+                resp = self.inner.generate_content(
+                    model, prompt, slot=slot, timeout=timeout,
+                    max_output_tokens=max_output_tokens, cached_content=cached_content,
+                )
+            else:
+                resp = self.inner.generate_content(
+                    model, prompt, slot=slot, timeout=timeout, max_output_tokens=max_output_tokens
+                )
+        except Exception as e:
+            record.update(latency_s=round(time.perf_counter() - t0, 4), error=str(e)[:500])
+            self._write(record)
+            raise
+        record["latency_s"] = round(time.perf_counter() - t0, 4)
+        record["text"] = _response_text(resp)
+        meta = getattr(resp, "usage_metadata", None)
+        if meta is not None:
+            record["usage"] = {f: getattr(meta, f, None) for f in USAGE_FIELDS}
+        self._write(record)
+        return resp
+
+    def create_cache(self, model: str, text: str, ttl_s: int, slot: int = 0, display_name: str = "") -> str:
+        create = getattr(self.inner, "create_cache", None)
+        if create is None:
+            raise NotImplementedError(f"{type(self.inner).__name__} has no context caching")
+        name = create(model, text, ttl_s=ttl_s, slot=slot, display_name=display_name)
+        with self._lock:
+            self._caches[name] = text
+        return name
+
+    def embed_content(
+        self,
+        model: str,
+        text: Union[str, List[str]],
+        slot: int = 0,
+        timeout: Optional[float] = None,
+        output_dimensionality: Optional[int] = None,
+    ):
+        texts = [text] if isinstance(text, str) else list(text)
+        record: Dict[str, Any] = {
+            "type": "embed", "t": self._elapsed(), "model": model, "slot": slot,
+            "texts": texts, "dim": output_dimensionality,
+        }
+        t0 = time.perf_counter()
+        try:
+            if output_dimensionality is not None:
+                resp = self.inner.embed_content(
+                    model, text, slot=slot, timeout=timeout, output_dimensionality=output_dimensionality
+                )
+            else:
+                resp = self.inner.embed_content(model, text, slot=slot, timeout=timeout)
+        except Exception as e:
+            record.update(latency_s=round(time.perf_counter() - t0, 4), error=str(e)[:500])
+            self._write(record)
+            raise
+        record["latency_s"] = round(time.perf_counter() - t0, 4)
+        record["vectors"] = [_pack(e.values) for e in (getattr(resp, "embeddings", None) or [])]
+        self._write(record)
+        return resp
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def _response_text(resp) -> str:
+    """Same text gen_client extracts (.text, else the first candidate part)."""
+    try:
+        if getattr(resp, "text", None):
+            return resp.text
+        candidates = getattr(resp, "candidates", None)
+        if candidates:
+            parts = candidates[0].content.parts
+            if parts and hasattr(parts[0], "text"):
+                return parts[0].text or ""
+    except Exception:
+        pass
+    return ""
+
+
+# ==========================================================
+# REPLAY
+# ==========================================================
+class ReplayBackend:
+    """Serves recorded responses; see the module docstring."""
+
+    def __init__(
+        self,
+        path: str,
+        timing: bool = False,
+        time_scale: float = 1.0,
+        fallback=None,
+    ):
+        self.path = path
+        self.timing = timing
+        self.time_scale = time_scale
+        self.fallback = fallback
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {"generate": 0, "embed": 0, "misses": 0}
+        self.requests: List[Dict[str, Any]] = []
+        self._num_slots = 1
+        # key -> recorded answers in order, and how many were served
+        self._generate: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._embed: Dict[Tuple[str, str, Optional[int]], List[Dict[str, Any]]] = {}
+        self._served: Dict[tuple, int] = {}
+        for rec in read_cassette(path):
+            kind = rec.get("type")
+            if kind == "header":
+                self._num_slots = max(self._num_slots, int(rec.get("num_slots") or 1))
+            elif kind == "request":
+                self.requests.append(rec)
+            elif kind == "generate":
+                self._generate.setdefault((rec["model"], _key(rec["prompt"])), []).append(rec)
+            elif kind == "embed":
+                vectors = rec.get("vectors") or []
+                for i, text in enumerate(rec.get("texts") or []):
+                    answer = {"latency_s": rec.get("latency_s", 0.0)}
+                    if "error" in rec:
+                        answer["error"] = rec["error"]
+                    elif i < len(vectors):
+                        answer["vector"] = vectors[i]
+                    else:
+                        continue
+                    self._embed.setdefault((rec["model"], _key(text), rec.get("dim")), []).append(answer)
+
+    @classmethod
+    def from_env(cls) -> "ReplayBackend":
+        path = os.getenv("GEN_REPLAY")
+        if not path:
+            raise RuntimeError("GEN_BACKEND=replay needs GEN_REPLAY=<cassette file>")
+        fallback = None
+        if os.getenv("GEN_REPLAY_FALLBACK", "").lower() == "fake":
+            from fake_backend import FakeBackend
+            fallback = FakeBackend.from_env()
+        return cls(
+            path,
+            timing=os.getenv("GEN_REPLAY_TIMING", "0") == "1",
+            time_scale=float(os.getenv("GEN_REPLAY_TIME_SCALE", "1")),
+            fallback=fallback,
+        )
+
+    @property
+    def num_slots(self) -> int:
+        return self._num_slots
+
+    def _next(self, table: Dict[tuple, List[Dict[str, Any]]], key: tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            answers = table.get(key)
+            if not answers:
+                return None
+            n = self._served.get(key, 0)
+            self._served[key] = n + 1
+            return answers[min(n, len(answers) - 1)]
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.calls["misses"] += 1
+
+    def _wait(self, latency_s: float, timeout: Optional[float]) -> None:
+        if not self.timing:
+            return
+        delay = latency_s * self.time_scale
+        if timeout is not None and delay > timeout:
+            time.sleep(max(0.0, timeout))
+            raise TimeoutError(f"replayed call timed out after {timeout:.2f}s")
+        time.sleep(delay)
+
+    def generate_content(
+        self,
+        model: str,
+        prompt: str,
+        slot: int = 0,
+        timeout: Optional[float] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_content: Optional[str] = None,
+    ):
+        with self._lock:
+            self.calls["generate"] += 1
+        rec = self._next(self._generate, (model, _key(prompt)))
+        if rec is None:
+            self._miss()
+            if self.fallback is not None:
+                return self.fallback.generate_content(
+                    model, prompt, slot=slot, timeout=timeout, max_output_tokens=max_output_tokens
+                )
+            raise LookupError(f"cassette miss: no recorded generate for {model} and this prompt")
+        self._wait(rec.get("latency_s", 0.0), timeout)
+        if "error" in rec:
+            raise RuntimeError(rec["error"])
+        usage = rec.get("usage")
+        return SimpleNamespace(
+            text=rec.get("text", ""),
+            candidates=None,
+            usage_metadata=SimpleNamespace(**usage) if usage else None,
+        )
+
+    def embed_content(
+        self,
+        model: str,
+        text: Union[str, List[str]],
+        slot: int = 0,
+        timeout: Optional[float] = None,
+        output_dimensionality: Optional[int] = None,
+    ):
+        texts = [text] if isinstance(text, str) else list(text)
+        with self._lock:
+            self.calls["embed"] += 1
+        answers = [self._next(self._embed, (model, _key(t), output_dimensionality)) for t in texts]
+        if any(a is None for a in answers):
+            self._miss()
+            if self.fallback is not None:
+                if output_dimensionality is not None:
+                    return self.fallback.embed_content(
+                        model, text, slot=slot, timeout=timeout, output_dimensionality=output_dimensionality
+                    )
+                return self.fallback.embed_content(model, text, slot=slot, timeout=timeout)
+            raise LookupError(f"cassette miss: no recorded embedding for {len(texts)} text(s)")
+        # One call for the batch: as slow as its slowest recorded text
+        self._wait(max(a.get("latency_s", 0.0) for a in answers), timeout)
+        for a in answers:
+            if "error" in a:
+                raise RuntimeError(a["error"])
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=_unpack(a["vector"])) for a in answers])
@@ -0,0 +1,284 @@
+# fake_backend.py
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+
+class LatencyModel:
+    """
+    Samples simulated call latencies (seconds) from a small spec string:
+      - "const:0.3"
+      - "uniform:0.1,0.6"
+      - "normal:0.5,0.1"        (mean, stddev; clipped at 0)
+      - "lognormal:0.4,0.6"     (median, sigma → long tail)
+    """
+
+    def __init__(self, spec: str = "const:0", rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, args = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.args = [float(a) for a in args.split(",") if a.strip()]
+        if self.kind not in ("const", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec!r}")
+
+    def sample(self) -> float:
+        a = self.args
+        if self.kind == "const":
+            return a[0] if a else 0.0
+        if self.kind == "uniform":
+            return self.rng.uniform(a[0], a[1])
+        if self.kind == "normal":
+            return max(0.0, self.rng.gauss(a[0], a[1]))
+        return a[0] * math.exp(self.rng.gauss(0.0, a[1]))
+
+
+class FakeBackend:
+    """
+    Local stand-in for the Gemini API (same interface as
+    gen_client.GeminiBackend).
+
+    - configurable latency per generate / embed call
+    - injected 429 RESOURCE_EXHAUSTED errors at a given rate
+    - canned outputs shaped like what each agent expects
+    - deterministic bag-of-words embeddings so memory search still ranks
+    - context caches (create_cache / cached_content) that expire after their TTL
+    """
+
+    EMBED_DIM = 768
+
+    def __init__(
+        self,
+        latency: str = "lognormal:0.4,0.5",
+        embed_latency: str = "const:0.05",
+        error_rate: float = 0.0,
+        num_slots: int = 1,
+        seed: Optional[int] = None,
+        time_scale: float = 1.0,
+        responder: Optional[Callable[[str, str], str]] = None,
+    ):
+        self.rng = random.Random(seed)
+        self.latency = LatencyModel(latency, self.rng)
+        self.embed_latency = LatencyModel(embed_latency, self.rng)
+        self.error_rate = error_rate
+        self.num_slots = num_slots
+        self.time_scale = time_scale
+        self.responder = responder or canned_response
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {"generate": 0, "embed": 0, "errors": 0, "caches": 0}
+        self._caches: Dict[str, Tuple[str, float]] = {}  # name -> (text, expires_at)
+
+    @classmethod
+    def from_env(cls) -> "FakeBackend":
+        seed = os.getenv("FAKE_SEED")
+        return cls(
+            latency=os.getenv("FAKE_LATENCY", "lognormal:0.4,0.5"),
+            embed_latency=os.getenv("FAKE_EMBED_LATENCY", "const:0.05"),
+            error_rate=float(os.getenv("FAKE_ERROR_RATE", "0")),
+            num_slots=int(os.getenv("FAKE_NUM_SLOTS", "1")),
+            seed=int(seed) if seed else None,
+        )
+
+    def _simulate(self, kind: str, model: LatencyModel, timeout: Optional[float] = None) -> None:
+        with self._lock:
+            self.calls[kind] += 1
+            delay = model.sample() * self.time_scale
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.calls["errors"] += 1
+        if timeout is not None and delay > timeout:
+            time.sleep(max(0.0, timeout))
+            raise TimeoutError(f"fake {kind} call timed out after {timeout:.2f}s")
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError(
+                "429 RESOURCE_EXHAUSTED. You exceeded your current quota (fake backend)."
+            )
+
+    def generate_content(
+        self,
+        model: str,
+        prompt: str,
+        slot: int = 0,
+        timeout: Optional[float] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_content: Optional[str] = None,
+    ):
+        cached_tokens = None
+        if cached_content is not None:
+            with self._lock:
+                cached = self._caches.get(cached_content)
+            if cached is None or cached[1] <= time.monotonic():
+                raise RuntimeError(f"404 NOT_FOUND: cached content {cached_content} (fake backend)")
+            cached_tokens = len(cached[0]) // 4
+            prompt = f"{cached[0]}\n\n{prompt}"
+        self._simulate("generate", self.latency, timeout)
+        text = self.responder(model, prompt)
+        # ~4 chars per token; a cap truncates like a MAX_TOKENS finish
+        if max_output_tokens is not None and len(text) > max_output_tokens * 4:
+            text = text[: max_output_tokens * 4]
+        usage = SimpleNamespace(
+            prompt_token_count=len(prompt) // 4,
+            candidates_token_count=len(text) // 4,
+            thoughts_token_count=None,
+            cached_content_token_count=cached_tokens,
+        )
+        return SimpleNamespace(text=text, candidates=None, usage_metadata=usage)
+
+    def create_cache(self, model: str, text: str, ttl_s: int, slot: int = 0, display_name: str = "") -> str:
+        with self._lock:
+            self.calls["caches"] += 1
+            name = f"cachedContents/fake-{self.calls['caches']}"
+            self._caches[name] = (text, time.monotonic() + ttl_s)
+        return name
+
+    def embed_content(
+        self,
+        model: str,
+        text: Union[str, List[str]],
+        slot: int = 0,
+        timeout: Optional[float] = None,
+        output_dimensionality: Optional[int] = None,
+    ):
+        self._simulate("embed", self.embed_latency, timeout)
+        texts = [text] if isinstance(text, str) else list(text)
+        dim = output_dimensionality or self.EMBED_DIM
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=hashed_embedding(t, dim)) for t in texts])
+
+
+# ==========================================================
+# CANNED OUTPUTS
+# ==========================================================
+def hashed_embedding(text: str, dim: int = 768) -> List[float]:
+    """Feature-hashed bag of words, L2-normalised."""
+    vec = [0.0] * dim
+    for tok in re.findall(r"[a-z0-9]+", (text or "").lower()):
+        h = int(hashlib.md5(tok.encode("utf-8")).hexdigest(), 16)
+        vec[h % dim] += 1.0 if (h >> 20) & 1 else -1.0
+    norm = sum(x * x for x in vec) ** 0.5
+    if norm == 0:
+        vec[0] = 1.0
+        return vec
+    return [x / norm for x in vec]
+
+
+def _fake_prefs(text: str) -> Dict:
+    t = text.lower()
+    prefs = {
+        "cuisines": [c for c in ("south indian", "italian", "mexican", "thai") if c in t],
+        "diet_type": "veg" if ("vegetarian" in t or " veg" in t) else "",
+        "dislikes": [],
+        "allergies": re.findall(r"allergic to (\w+)", t),
+        "spice_level": "",
+        "travel_style": "family" if "kid" in t else "",
+        "likes": [],
+    }
+    return prefs
+
+
+def _fake_days(prompt: str, pattern: str, default: int) -> int:
+    m = re.search(pattern, prompt)
+    return int(m.group(1)) if m else default
+
+
+def canned_response(model: str, prompt: str) -> str:
+    """Return an output shaped like what the calling agent parses."""
+    if "extracts structured user preferences" in prompt and "For EACH numbered message" in prompt:
+        msgs = re.findall(r"^\[(\d+)\] (.+)$", prompt, flags=re.MULTILINE)
+        return json.dumps([
+            {"index": int(i), **_fake_prefs(json.loads(t))} for i, t in msgs
+        ])
+
+    if "extracts structured user preferences" in prompt:
+        m = re.search(r'"""(.*?)"""', prompt, flags=re.DOTALL)
+        return json.dumps(_fake_prefs(m.group(1) if m else prompt))
+
+    if "compress a user's past messages" in prompt:
+        msgs = re.findall(r"^- (.+)$", prompt, flags=re.MULTILINE)
+        return "Earlier the user said: " + "; ".join(msgs)[:400]
+
+    if "revising single meals" in prompt:
+        slots = re.findall(r"^Day (\d+) \| (\w+)$", prompt, flags=re.MULTILINE)
+        return "\n".join(f"Day {d} | {s} | Vegetable pulao with mint chutney" for d, s in slots)
+
+    if "updating an existing list" in prompt:
+        return json.dumps({
+            "add": [{"category": "Spices", "item": "Mint", "quantity": "1 bunch", "notes": ""}],
+            "remove": ["Toor dal"],
+        })
+
+    if "=== END ===" in prompt:
+        # Fused multi-section request (agents/fused_agent.py)
+        sections = []
+        for marker, fn in (
+            ("=== MEAL PLAN ===", _fake_meal),
+            ("=== SHOPPING LIST ===", _fake_shopping),
+            ("=== TRAVEL ITINERARY ===", _fake_travel),
+        ):
+            if marker in prompt:
+                sections.append(f"{marker}\n{fn(prompt)}")
+        return "\n\n".join(sections) + "\n=== END ==="
+
+    if "grocery list generator" in prompt:
+        return _fake_shopping(prompt)
+
+    if "Outline a trip" in prompt:
+        days = _fake_days(prompt, r"Trip length: (\d+) days", 1)
+        return "\n".join(
+            f"Day {d} | District {d} | Sights | Museum {d}, Park {d}" for d in range(1, days + 1)
+        )
+
+    if "travel planner" in prompt:
+        return _fake_travel(prompt)
+
+    if "meal plan" in prompt.lower() or "meal planner" in prompt:
+        return _fake_meal(prompt)
+
+    return "OK"
+
+
+def _fake_shopping(prompt: str) -> str:
+    items = [
+        {"category": "Vegetables", "item": "Onion", "quantity": "1 kg", "notes": ""},
+        {"category": "Vegetables", "item": "Tomato", "quantity": "1 kg", "notes": ""},
+        {"category": "Grains & Pulses", "item": "Rice", "quantity": "2 kg", "notes": ""},
+        {"category": "Grains & Pulses", "item": "Toor dal", "quantity": "500 g", "notes": ""},
+        {"category": "Spices", "item": "Mustard seeds", "quantity": "100 g", "notes": ""},
+    ]
+    return json.dumps(items)
+
+
+def _fake_travel(prompt: str) -> str:
+    m = re.search(r"Plan ONLY days (\d+)-(\d+)", prompt)
+    if m:  # one day group of a chunked itinerary
+        first, last = int(m.group(1)), int(m.group(2))
+    else:
+        first, last = 1, _fake_days(prompt, r"Plan EXACTLY (\d+) days", 1)
+    return "\n\n".join(
+        f"Day {d}\n"
+        f"🌅 Morning: Visit Museum {d}.\n"
+        f"🌞 Afternoon: Lunch at a vegetarian cafe and a walk in Park {d}.\n"
+        f"🌙 Evening: Dinner downtown."
+        for d in range(first, last + 1)
+    )
+
+
+def _fake_meal(prompt: str) -> str:
+    days = _fake_days(prompt, r"(\d+)-day meal plan", 1)
+    if days == 1:
+        return "Dinner: Vegetable khichdi with cucumber raita."
+    return "\n\n".join(
+        f"Day {d}\n"
+        f"Breakfast: Idli with sambar\n"
+        f"Lunch: Lemon rice with beans poriyal\n"
+        f"Dinner: Chapati with mixed vegetable kurma"
+        for d in range(1, days + 1)
+    )
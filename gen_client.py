@@ -2,29 +2,287 @@
 
 import os
 import time
+import bisect
+import heapq
 import hashlib
-from typing import Dict, List
+import itertools
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional, Tuple, Union
 
-from google.genai import Client
 from dotenv import load_dotenv
 load_dotenv()
 
+from tracing import REGISTRY, Span, current_span, span
+
+# ==========================================================
+# SHARED STATE LOCKS
+# ==========================================================
+# Upper bounds (seconds) of the acquire() wait histogram; the last is +Inf
+LOCK_WAIT_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, float("inf"))
+
+
+class TrackedLock:
+    """
+    threading.Lock that also records how long every acquire() took: total,
+    maximum and a histogram (LOCK_WAIT_BUCKETS). The wait is timed around
+    the blocking acquire, so it includes waiting for the GIL to come back,
+    which is what a caller actually pays. Every lock guarding module state
+    in gen_client is one of these, so load_test.py can report lock waits
+    per lock name.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.wait_buckets = [0] * len(LOCK_WAIT_BUCKETS)
+        with _LOCKS_GUARD:
+            _LOCKS.append(self)
+
+    def acquire(self) -> bool:
+        t0 = time.perf_counter()
+        self._lock.acquire()
+        waited = time.perf_counter() - t0
+        # Counters are only touched while holding the lock
+        self.acquisitions += 1
+        self.wait_s += waited
+        if waited > self.max_wait_s:
+            self.max_wait_s = waited
+        self.wait_buckets[bisect.bisect_left(LOCK_WAIT_BUCKETS, waited)] += 1
+        return True
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def __enter__(self) -> "TrackedLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._lock.release()
+
+
+_LOCKS_GUARD = threading.Lock()
+_LOCKS: List[TrackedLock] = []
+
+
+def lock_wait_quantile(buckets: List[int], q: float) -> float:
+    """Upper bound of the LOCK_WAIT_BUCKETS bucket holding quantile q."""
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    seen = 0
+    for bound, count in zip(LOCK_WAIT_BUCKETS, buckets):
+        seen += count
+        if seen >= q * total:
+            return bound
+    return LOCK_WAIT_BUCKETS[-1]
+
+
+def lock_stats() -> Dict[str, Dict[str, object]]:
+    """
+    {lock name: acquisitions / wait_s / max_wait_s / p99_wait_s / buckets},
+    summed over locks sharing a name. p99_wait_s is the upper bound of its
+    histogram bucket (the +Inf bucket reports max_wait_s).
+    """
+    out: Dict[str, Dict[str, object]] = {}
+    with _LOCKS_GUARD:
+        locks = list(_LOCKS)
+    for lock in locks:
+        row = out.setdefault(lock.name, {
+            "acquisitions": 0, "wait_s": 0.0, "max_wait_s": 0.0, "buckets": [0] * len(LOCK_WAIT_BUCKETS),
+        })
+        row["acquisitions"] += lock.acquisitions
+        row["wait_s"] += lock.wait_s
+        row["max_wait_s"] = max(row["max_wait_s"], lock.max_wait_s)
+        row["buckets"] = [a + b for a, b in zip(row["buckets"], lock.wait_buckets)]
+    for row in out.values():
+        row["p99_wait_s"] = min(lock_wait_quantile(row["buckets"], 0.99), row["max_wait_s"])
+    return out
+
+
+def reset_lock_stats() -> None:
+    with _LOCKS_GUARD:
+        locks = list(_LOCKS)
+    for lock in locks:
+        with lock:
+            lock.acquisitions = 0
+            lock.wait_s = lock.max_wait_s = 0.0
+            lock.wait_buckets = [0] * len(LOCK_WAIT_BUCKETS)
+
+
 # ==========================================================
 # API KEY HANDLING
 # ==========================================================
-API_KEY = (
-    os.getenv("PRIMARY_GEN_API_KEY")
-    or os.getenv("BACKUP_GEN_API_KEY")
-    or os.getenv("THIRD_GEN_API_KEY")
-)
+API_KEYS: List[str] = [
+    k for k in (
+        os.getenv("PRIMARY_GEN_API_KEY"),
+        os.getenv("BACKUP_GEN_API_KEY"),
+        os.getenv("THIRD_GEN_API_KEY"),
+    ) if k
+]
+API_KEY = API_KEYS[0] if API_KEYS else None
 
+# "gemini" talks to the real API, "fake" uses the local stub in fake_backend.py
+BACKEND_NAME = os.getenv("GEN_BACKEND", "gemini").lower()
 
-if not API_KEY:
-    raise RuntimeError(
-        "❌ No API keys provided. Set PRIMARY_GEN_API_KEY (optionally BACKUP_GEN_API_KEY / THIRD_GEN_API_KEY)."
-    )
 
-client = Client(api_key=API_KEY)
+# ==========================================================
+# BACKENDS
+# ==========================================================
+class GeminiBackend:
+    """
+    Real Gemini backend.
+    Holds one SDK client per configured API key ("key slot").
+
+    Any object with the same three members can be plugged in via
+    set_backend():
+      - num_slots
+      - generate_content(model, prompt, slot=0, timeout=None, max_output_tokens=None,
+        cached_content=None) -> response with .text (and optionally .usage_metadata)
+      - embed_content(model, text, slot=0, timeout=None, output_dimensionality=None)
+        -> response with .embeddings; `text` is a str or a list of str (one
+        embedding each); output_dimensionality only passed when set
+    `timeout` is in seconds; the call should give up (raise) after it.
+    Optional: create_cache(model, text, ttl_s, slot=0, display_name="") -> cache
+    name usable as cached_content (context caching of static prefixes).
+    """
+
+    def __init__(self, api_keys: List[str]):
+        if not api_keys:
+            raise RuntimeError(
+                "❌ No API keys provided. Set PRIMARY_GEN_API_KEY (optionally BACKUP_GEN_API_KEY / THIRD_GEN_API_KEY)."
+            )
+        self.api_keys = list(api_keys)
+        self._clients: Dict[int, object] = {}
+        self._lock = TrackedLock("backend_clients")
+
+    @property
+    def num_slots(self) -> int:
+        return len(self.api_keys)
+
+    def client(self, slot: int = 0):
+        client = self._clients.get(slot)
+        if client is None:
+            # Sessions share one client per key: build it exactly once
+            with self._lock:
+                client = self._clients.get(slot)
+                if client is None:
+                    from google.genai import Client
+                    client = self._clients[slot] = Client(api_key=self.api_keys[slot])
+        return client
+
+    def connect(self, slot: int = 0) -> None:
+        """Build the client and open its connection (metadata GET, no tokens spent)."""
+        self.client(slot).models.get(model=PRIMARY_MODEL)
+
+    @staticmethod
+    def _http_options(timeout: Optional[float]):
+        if not timeout:
+            return None
+        from google.genai import types
+        return types.HttpOptions(timeout=max(1, int(timeout * 1000)))
+
+    def generate_content(
+        self,
+        model: str,
+        prompt: str,
+        slot: int = 0,
+        timeout: Optional[float] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_content: Optional[str] = None,
+    ):
+        config = None
+        if timeout or max_output_tokens or cached_content:
+            from google.genai import types
+            config = types.GenerateContentConfig(
+                http_options=self._http_options(timeout),
+                max_output_tokens=max_output_tokens,
+                cached_content=cached_content,
+            )
+        return self.client(slot).models.generate_content(
+            model=model,
+            contents=prompt,
+            config=config,
+        )
+
+    def create_cache(self, model: str, text: str, ttl_s: int, slot: int = 0, display_name: str = "") -> str:
+        from google.genai import types
+        cache = self.client(slot).caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=text,
+                ttl=f"{int(ttl_s)}s",
+                display_name=display_name or None,
+            ),
+        )
+        return cache.name
+
+    def embed_content(
+        self,
+        model: str,
+        text: Union[str, List[str]],
+        slot: int = 0,
+        timeout: Optional[float] = None,
+        output_dimensionality: Optional[int] = None,
+    ):
+        config = None
+        if timeout or output_dimensionality:
+            from google.genai import types
+            config = types.EmbedContentConfig(
+                http_options=self._http_options(timeout),
+                output_dimensionality=output_dimensionality,
+            )
+        return self.client(slot).models.embed_content(
+            model=model,
+            contents=text,
+            config=config,
+        )
+
+
+def _default_backend():
+    if BACKEND_NAME == "fake":
+        from fake_backend import FakeBackend
+        backend = FakeBackend.from_env()
+    elif BACKEND_NAME == "replay":
+        from cassette import ReplayBackend
+        backend = ReplayBackend.from_env()
+    else:
+        backend = GeminiBackend(API_KEYS)
+    # GEN_RECORD=<file> appends every call to a cassette (see cassette.py)
+    record = os.getenv("GEN_RECORD")
+    if record:
+        from cassette import RecordingBackend
+        backend = RecordingBackend(backend, record)
+    return backend
+
+
+_BACKEND = _default_backend()
+_BACKEND_LOCK = TrackedLock("backend")
+
+
+def set_backend(backend) -> None:
+    """
+    Swap the model backend (e.g. a FakeBackend for benchmarks). Calls
+    already running finish on the old one; context caches registered on
+    it are forgotten.
+    """
+    global _BACKEND
+    with _BACKEND_LOCK:
+        _BACKEND = backend
+    with _PREFIX_LOCK:
+        _PREFIX_CACHES.clear()
+
+
+def get_backend():
+    return _BACKEND
+
 
 # ==========================================================
 # MODEL CONFIG
@@ -39,20 +297,703 @@ FALLBACK_MODELS = [
 ]
 
 EMBED_MODEL = "models/text-embedding-004"
+NATIVE_EMBED_DIM = 768
+
+# Requested embedding size (EMBED_DIM, default: the model's native 768).
+# Smaller sizes are asked from the API and, should a backend ignore that,
+# truncated + re-normalised here (text-embedding-004 is trained so that
+# leading dimensions carry the most information).
+EMBED_DIM = int(os.getenv("EMBED_DIM", "0")) or NATIVE_EMBED_DIM
 
 # ==========================================================
 # PERFORMANCE SETTINGS
 # ==========================================================
-ENABLE_LOGS = False
 ENABLE_CACHE = True
 
+# Streamlit runs every session in its own thread and server.py / batch.py
+# use worker pools, so the cache and counters below are only touched under
+# their locks and never rebound.
+_CACHE_LOCK = TrackedLock("generate_cache")
 _CACHE: Dict[str, str] = {}  # prompt-hash -> output text
 
+# Cheap call counters, read by benchmark.py
+_STATS_LOCK = TrackedLock("stats")
+_STATS: Dict[str, int] = {
+    "llm_calls": 0,
+    "embed_calls": 0,
+    "embed_short_circuits": 0,
+    "cache_hits": 0,
+    "cache_misses": 0,
+    "rate_limited": 0,
+    "hedges_fired": 0,
+    "hedges_won": 0,
+    "hedges_orphaned": 0,
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "cached_tokens": 0,
+}
+
+
+def _bump(name: str, n: int = 1) -> None:
+    with _STATS_LOCK:
+        _STATS[name] += n
+
+# ==========================================================
+# DEADLINES
+# ==========================================================
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before a usable answer arrived."""
+
+
+# Absolute time.monotonic() deadline of the current request (None = no limit).
+# Set by Orchestrator.handle; generate()/embed() fall back to it when no
+# explicit deadline is passed.
+_DEADLINE: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "lifepilot_deadline", default=None
+)
+
+
+def deadline_in(seconds: Optional[float]) -> Optional[float]:
+    """Absolute deadline `seconds` from now (None / <= 0 → no deadline)."""
+    return time.monotonic() + seconds if seconds and seconds > 0 else None
+
+
+def current_deadline() -> Optional[float]:
+    return _DEADLINE.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]) -> Iterator[None]:
+    token = _DEADLINE.set(deadline)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left before `deadline` (None if unbounded)."""
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _check_deadline(deadline: Optional[float], what: str) -> Optional[float]:
+    left = remaining(deadline)
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"deadline exceeded before {what}")
+    return left
+
+
+# ==========================================================
+# CLIENT-SIDE RATE LIMIT
+# ==========================================================
+class RateLimiter:
+    """
+    Token bucket shared by every thread in the process.
+    rpm <= 0 disables limiting.
+    """
+
+    def __init__(self, rpm: float = 0.0, burst: int = 1):
+        self._lock = TrackedLock("rate_limiter")
+        self.configure(rpm, burst)
+
+    def configure(self, rpm: float, burst: int = 1) -> None:
+        with self._lock:
+            self.rpm = rpm
+            self.burst = max(1, burst)
+            self._tokens = float(self.burst)
+            self._last = time.monotonic()
+
+    def acquire(self, deadline: Optional[float] = None) -> None:
+        if self.rpm <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                rate = self.rpm / 60.0
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / rate
+            left = remaining(deadline)
+            if left is not None and left < wait:
+                raise DeadlineExceeded("deadline exceeded waiting for rate limit")
+            time.sleep(wait)
+
+
+# Applies to generate and embed calls alike (both count against quota)
+_RATE_LIMITER = RateLimiter(float(os.getenv("GEN_MAX_RPM", "0")))
+
+
+def set_rate_limit(rpm: float, burst: int = 1) -> None:
+    """Cap model + embed calls per minute for this process (0 = unlimited)."""
+    _RATE_LIMITER.configure(rpm, burst)
+
+
+# ==========================================================
+# REQUEST SCHEDULER (priorities + per-user fair queuing)
+# ==========================================================
+# Priority class of the calls made in the current context. User-facing
+# agents run as "interactive"; preference extraction, memory compaction and
+# background embeddings as "background"; batch.py as "batch".
+PRIORITIES = ("interactive", "background", "batch")
+_PRIORITY: contextvars.ContextVar[str] = contextvars.ContextVar("lifepilot_priority", default="interactive")
+
+
+def current_priority() -> str:
+    return _PRIORITY.get()
+
+
+@contextmanager
+def priority_scope(priority: str) -> Iterator[None]:
+    """
+    Run the block's model / embed calls at `priority`. Scopes only ever
+    lower the priority: background work inside a batch item stays "batch".
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority!r} (expected one of {PRIORITIES})")
+    current = _PRIORITY.get()
+    token = _PRIORITY.set(max(priority, current, key=PRIORITIES.index))
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    weights = {"interactive": 16.0, "background": 4.0, "batch": 1.0}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        if name.strip() in weights and value:
+            weights[name.strip()] = max(0.01, float(value))
+    return weights
+
+
+class _Ticket:
+    __slots__ = ("priority", "event", "granted", "cancelled")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class FairScheduler:
+    """
+    Global cap on concurrent backend calls (generate and embed attempts),
+    shared by every thread in the process. limit <= 0 disables it.
+
+    Waiting calls are served by start-time fair queuing over flows
+    (priority class, user): each call is tagged
+        start = max(virtual time, the flow's last finish tag)
+        finish = start + 1 / weight(priority)
+    and the smallest start tag goes next. With the default weights an
+    interactive flow gets 16 slots for every 4 of a background and 1 of
+    a batch flow, users within a class share equally, and no class
+    starves. Only the network call holds a slot (not backoff sleeps).
+    """
+
+    def __init__(self, limit: int = 0, weights: Optional[Dict[str, float]] = None):
+        self._lock = TrackedLock("scheduler")
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._vtime = 0.0
+        self._finish: Dict[Tuple[str, str], float] = {}
+        self._heap: List[Tuple[float, int, _Ticket]] = []
+        self._queued = {p: 0 for p in PRIORITIES}
+        self.configure(limit, weights)
+
+    def configure(self, limit: int, weights: Optional[Dict[str, float]] = None) -> None:
+        """New limit / weights (waiters are re-dispatched) and fresh wait stats."""
+        with self._lock:
+            self.limit = limit
+            self.weights = weights or _parse_weights("")
+            self._reset_waits()
+            self._dispatch()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._reset_waits()
+
+    def _reset_waits(self) -> None:
+        self._waits = {p: {"calls": 0, "queued": 0, "wait_s": 0.0, "max_wait_s": 0.0} for p in PRIORITIES}
+        self._recent: Dict[str, Deque[float]] = {p: deque(maxlen=500) for p in PRIORITIES}
+
+    @contextmanager
+    def slot(self, deadline: Optional[float] = None) -> Iterator[float]:
+        """Hold one in-flight slot for the block; yields the queue wait in seconds."""
+        if self.limit <= 0:
+            yield 0.0
+            return
+        priority = _PRIORITY.get()
+        parent = current_span()
+        user = str(parent.attrs.get("user") or "unknown") if parent else "unknown"
+        ticket = _Ticket(priority)
+        t0 = time.monotonic()
+        with self._lock:
+            flow = (priority, user)
+            start = max(self._vtime, self._finish.get(flow, 0.0))
+            self._finish[flow] = start + 1.0 / self.weights[priority]
+            if self._in_flight < self.limit and not self._heap:
+                self._in_flight += 1
+                self._vtime = start
+                ticket.granted = True
+            else:
+                heapq.heappush(self._heap, (start, next(self._seq), ticket))
+                self._queued[priority] += 1
+
+        queued = not ticket.granted
+        if queued:
+            ticket.event.wait(remaining(deadline))
+            with self._lock:
+                if not ticket.granted:
+                    ticket.cancelled = True  # dropped lazily when it reaches the head
+                    self._queued[priority] -= 1
+                    self._record_wait(priority, time.monotonic() - t0, queued)
+                    raise DeadlineExceeded("deadline exceeded waiting for a model call slot")
+
+        wait_s = time.monotonic() - t0
+        with self._lock:
+            self._record_wait(priority, wait_s, queued)
+        SCHEDULER_WAIT_SECONDS.observe(wait_s, priority=priority)
+        try:
+            yield wait_s
+        finally:
+            self._release()
+
+    def _record_wait(self, priority: str, wait_s: float, queued: bool) -> None:
+        row = self._waits[priority]
+        row["calls"] += 1
+        row["queued"] += int(queued)
+        row["wait_s"] += wait_s
+        row["max_wait_s"] = max(row["max_wait_s"], wait_s)
+        self._recent[priority].append(wait_s)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant slots to queued calls in tag order (all of them once the cap is off). Lock held."""
+        while self._heap and (self.limit <= 0 or self._in_flight < self.limit):
+            start, _, ticket = heapq.heappop(self._heap)
+            if ticket.cancelled:
+                continue
+            self._queued[ticket.priority] -= 1
+            self._in_flight += 1
+            self._vtime = start
+            ticket.granted = True
+            ticket.event.set()
+        if len(self._finish) > 10000:
+            # Flows at or behind virtual time carry no history worth keeping
+            self._finish = {f: t for f, t in self._finish.items() if t > self._vtime}
+
+    def stats(self) -> Dict[str, object]:
+        """In-flight / limit, queue depth per priority and wait times (since configure / reset_stats)."""
+        with self._lock:
+            waits = {}
+            for p in PRIORITIES:
+                row = dict(self._waits[p])
+                recent = sorted(self._recent[p])
+                row["mean_wait_s"] = row["wait_s"] / row["calls"] if row["calls"] else 0.0
+                row["p95_wait_s"] = recent[min(len(recent) - 1, int(0.95 * len(recent)))] if recent else 0.0
+                waits[p] = row
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "queued": dict(self._queued),
+                "waits": waits,
+            }
+
+
+SCHEDULER_WAIT_SECONDS = REGISTRY.histogram(
+    "lifepilot_scheduler_wait_seconds", "Time model / embed calls waited for an in-flight slot, by priority."
+)
+
+# GEN_MAX_IN_FLIGHT caps concurrent backend calls process-wide (0 = no cap);
+# GEN_SCHED_WEIGHTS="interactive=16,background=4,batch=1" sets the class shares.
+_SCHEDULER = FairScheduler(
+    int(os.getenv("GEN_MAX_IN_FLIGHT", "0")),
+    _parse_weights(os.getenv("GEN_SCHED_WEIGHTS", "")),
+)
+
+
+def set_max_in_flight(limit: int, weights: Optional[Dict[str, float]] = None) -> None:
+    """Cap concurrent model + embed calls for this process (0 = no cap); resets scheduler stats."""
+    _SCHEDULER.configure(limit, weights or _SCHEDULER.weights)
+
+
+def scheduler_stats() -> Dict[str, object]:
+    return _SCHEDULER.stats()
+
+
+def reset_scheduler_stats() -> None:
+    _SCHEDULER.reset_stats()
+
+
+# ==========================================================
+# PER-MODEL LATENCY STATS
+# ==========================================================
+class ModelStats:
+    """
+    Rolling window of successful calls for one model:
+    (latency seconds, response bytes). Used by cost models to predict
+    latency as  base + per_byte * response_bytes.
+    """
+
+    # Used until a model has a few measurements of its own
+    PRIOR_BASE_S = 0.8
+    PRIOR_PER_BYTE_S = 0.0015
+
+    def __init__(self, window: int = 200):
+        self._lock = TrackedLock("model_stats")
+        self._samples: Deque[Tuple[float, int]] = deque(maxlen=window)
+
+    def record(self, latency: float, response_bytes: int) -> None:
+        with self._lock:
+            self._samples.append((latency, response_bytes))
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        """Latency quantile over the window (None until min_samples calls)."""
+        with self._lock:
+            latencies = sorted(l for l, _ in self._samples)
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def fit(self) -> Tuple[float, float]:
+        """Least-squares (base_s, per_byte_s) over the window, with priors as fallback."""
+        with self._lock:
+            samples = list(self._samples)
+        n = len(samples)
+        if n < 5:
+            return self.PRIOR_BASE_S, self.PRIOR_PER_BYTE_S
+        mx = sum(b for _, b in samples) / n
+        my = sum(l for l, _ in samples) / n
+        var = sum((b - mx) ** 2 for _, b in samples)
+        if var <= 0:
+            return max(0.0, my - self.PRIOR_PER_BYTE_S * mx), self.PRIOR_PER_BYTE_S
+        slope = sum((b - mx) * (l - my) for l, b in samples) / var
+        slope = max(0.0, slope)
+        return max(0.0, my - slope * mx), slope
+
+    def estimate(self, response_bytes: int) -> float:
+        base, per_byte = self.fit()
+        return base + per_byte * response_bytes
+
+
+_MODEL_STATS: Dict[str, ModelStats] = {}
+_MODEL_STATS_LOCK = TrackedLock("model_stats_registry")
+
+
+def model_stats(model: Optional[str] = None) -> ModelStats:
+    model = model or PRIMARY_MODEL
+    with _MODEL_STATS_LOCK:
+        stats = _MODEL_STATS.get(model)
+        if stats is None:
+            stats = _MODEL_STATS[model] = ModelStats()
+        return stats
+
+
+# Models that answered 429 recently are skipped as hedge targets
+_HEALTH_LOCK = TrackedLock("health")
+_UNHEALTHY_UNTIL: Dict[str, float] = {}
+UNHEALTHY_COOLDOWN_S = 30.0
+
+
+def _mark_unhealthy(model: str, slot: int) -> None:
+    with _HEALTH_LOCK:
+        _UNHEALTHY_UNTIL[f"{model}#{slot}"] = time.monotonic() + UNHEALTHY_COOLDOWN_S
+
+
+def _healthy(model: str, slot: int) -> bool:
+    with _HEALTH_LOCK:
+        until = _UNHEALTHY_UNTIL.get(f"{model}#{slot}", 0.0)
+    return until <= time.monotonic()
+
+
+# ==========================================================
+# TOKEN BUDGETS (max_output_tokens per agent)
+# ==========================================================
+# kind -> (base tokens, tokens per unit); units are days for meal / travel,
+# texts for batch preference extraction. Override one with
+# TOKEN_BUDGET_<KIND>="base,per_unit"; TOKEN_BUDGET_SCALE multiplies all
+# of them. Off by default (scale 0): on thinking models the cap also covers
+# thought tokens, and these sizes only fit the visible answer, so small
+# caps come back empty or cut off. Measure against the model before
+# turning them on.
+OUTPUT_BUDGETS: Dict[str, Tuple[int, int]] = {
+    "meal": (400, 350),
+    "travel": (300, 300),
+    "travel_skeleton": (100, 40),
+    "shopping": (1500, 0),
+    "meal_edit": (60, 60),
+    "shopping_diff": (400, 0),
+    "preferences": (400, 0),
+    "preferences_batch": (200, 150),
+    "summary": (300, 0),
+}
+TOKEN_BUDGET_SCALE = float(os.getenv("TOKEN_BUDGET_SCALE", "0"))
+
+
+def output_budget(kind: str, units: int = 1) -> Optional[int]:
+    """max_output_tokens for one call of `kind` (None = uncapped)."""
+    if TOKEN_BUDGET_SCALE <= 0:
+        return None
+    base, per_unit = OUTPUT_BUDGETS.get(kind, (0, 0))
+    override = os.getenv(f"TOKEN_BUDGET_{kind.upper()}")
+    if override:
+        base, _, per = override.partition(",")
+        base, per_unit = int(base), int(per or 0)
+    total = base + per_unit * max(1, units)
+    return int(total * TOKEN_BUDGET_SCALE) if total > 0 else None
+
+
+# ==========================================================
+# TOKEN USAGE ACCOUNTING
+# ==========================================================
+_USAGE_LOCK = TrackedLock("token_usage")
+# (agent, model, user) -> {"calls", "input_tokens", "output_tokens"}
+_USAGE: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+
+
+def _usage(resp, prompt: str, out: str) -> Tuple[int, int, bool]:
+    """
+    (input_tokens, output_tokens, exact) from the response's usage_metadata;
+    falls back to a ~4 bytes/token estimate when the backend reports none.
+    Output includes thought tokens (they are billed as output).
+    """
+    meta = getattr(resp, "usage_metadata", None)
+    if meta is not None and getattr(meta, "prompt_token_count", None) is not None:
+        output = (getattr(meta, "candidates_token_count", None) or 0) + (
+            getattr(meta, "thoughts_token_count", None) or 0
+        )
+        return meta.prompt_token_count, output, True
+    return len(prompt.encode("utf-8")) // 4, len(out.encode("utf-8")) // 4, False
+
+
+def _record_usage(model: str, input_tokens: int, output_tokens: int) -> None:
+    attrs = current_span().attrs if current_span() else {}
+    agent = attrs.get("agent") or "unknown"
+    user = str(attrs.get("user") or "unknown")
+    with _STATS_LOCK:
+        _STATS["input_tokens"] += input_tokens
+        _STATS["output_tokens"] += output_tokens
+    # No user label: one series per user would grow without bound; per-user
+    # numbers live in _USAGE (token_usage(), /v1/usage)
+    TOKENS.inc(input_tokens, agent=agent, model=model, kind="input")
+    TOKENS.inc(output_tokens, agent=agent, model=model, kind="output")
+    with _USAGE_LOCK:
+        row = _USAGE.setdefault((agent, model, user), {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+        row["calls"] += 1
+        row["input_tokens"] += input_tokens
+        row["output_tokens"] += output_tokens
+
+
+def token_usage(by: Tuple[str, ...] = ("agent", "model", "user")) -> List[Dict[str, object]]:
+    """
+    Aggregated token usage since start / reset_token_usage(), grouped by
+    any subset of ("agent", "model", "user"), largest total first.
+    """
+    fields = ("agent", "model", "user")
+    grouped: Dict[Tuple[str, ...], Dict[str, int]] = {}
+    with _USAGE_LOCK:
+        for key, row in _USAGE.items():
+            gkey = tuple(v for f, v in zip(fields, key) if f in by)
+            agg = grouped.setdefault(gkey, {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+            for k, v in row.items():
+                agg[k] += v
+    out = [
+        {**dict(zip([f for f in fields if f in by], gkey)), **agg}
+        for gkey, agg in grouped.items()
+    ]
+    out.sort(key=lambda r: r["input_tokens"] + r["output_tokens"], reverse=True)
+    return out
+
+
+def reset_token_usage() -> None:
+    with _USAGE_LOCK:
+        _USAGE.clear()
+
+
+# ==========================================================
+# CONTEXT CACHING (static prompt prefixes)
+# ==========================================================
+class PromptPrefix:
+    """
+    Static instructions shared by every call of one agent. Registered
+    once per (model, key slot) as cached content; each call then sends only
+    the dynamic part. Bump `version` whenever the text changes.
+
+    The shipped agent prefixes are ~85-150 tokens, far below the API's
+    minimum (1024 / 4096), so with default settings none is cached and every
+    call sends its prefix inline; caching only takes effect for prefixes that
+    grow past the minimum (or a lowered GEN_CONTEXT_CACHE_MIN_TOKENS).
+    """
+
+    def __init__(self, name: str, text: str, version: int = 1):
+        self.name = name
+        self.version = version
+        self.text = text.strip()
+        self.key = f"{name}-v{version}-{_hash(self.text)[:8]}"
+
+    def render(self, dynamic: str) -> str:
+        """Full prompt for backends / models without a cache."""
+        return f"{self.text}\n\n{dynamic.strip()}"
+
+
+CONTEXT_CACHE = os.getenv("GEN_CONTEXT_CACHE", "1") == "1"
+CONTEXT_CACHE_TTL_S = int(os.getenv("GEN_CONTEXT_CACHE_TTL_S", "3600"))
+# Smallest prefix (tokens) the API accepts as cached content; checked
+# locally so undersized prefixes never cost a create call. 0 = per model.
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEN_CONTEXT_CACHE_MIN_TOKENS", "0"))
+_CACHE_REFRESH_MARGIN_S = 60.0
+
+_PREFIX_LOCK = TrackedLock("context_cache")
+# (prefix key, model, slot) -> (cache name, or None = not cacheable there; expires_at)
+_PREFIX_CACHES: Dict[Tuple[str, str, int], Tuple[Optional[str], float]] = {}
+
+
+def set_context_cache(enabled: bool) -> None:
+    """Turn prefix caching on/off (GEN_CONTEXT_CACHE=0 starts with it off)."""
+    global CONTEXT_CACHE
+    CONTEXT_CACHE = enabled
+    with _PREFIX_LOCK:
+        _PREFIX_CACHES.clear()
+
+
+def _min_cache_tokens(model: str) -> int:
+    if CONTEXT_CACHE_MIN_TOKENS > 0:
+        return CONTEXT_CACHE_MIN_TOKENS
+    return 4096 if "pro" in model else 1024
+
+
+def _cacheable(prefix: PromptPrefix, model: str) -> bool:
+    # Same ~4 bytes/token estimate as _usage()
+    return len(prefix.text.encode("utf-8")) // 4 >= _min_cache_tokens(model)
+
+
+def _cached_prefix(prefix: PromptPrefix, model: str, slot: int) -> Optional[str]:
+    """
+    Cache name for `prefix` on (model, slot), registering it when missing
+    or about to expire. None → send the prefix inline. Prefixes below the
+    model's minimum cacheable size (currently all shipped ones, see
+    PromptPrefix) are skipped without a call; a failed
+    registration (unsupported backend / model) is remembered for one TTL
+    so it is not retried on every call.
+    """
+    create = getattr(_BACKEND, "create_cache", None)
+    if not CONTEXT_CACHE or create is None or not _cacheable(prefix, model):
+        return None
+    key = (prefix.key, model, slot)
+    now = time.monotonic()
+    with _PREFIX_LOCK:
+        entry = _PREFIX_CACHES.get(key)
+    if entry is not None and entry[1] - _CACHE_REFRESH_MARGIN_S > now:
+        return entry[0]
+
+    with span("context_cache", prefix=prefix.key, model=model, slot=slot) as s:
+        try:
+            name: Optional[str] = create(
+                model, prefix.text, ttl_s=CONTEXT_CACHE_TTL_S, slot=slot, display_name=prefix.key
+            )
+            s.set(outcome="refreshed" if entry and entry[0] else "created")
+        except Exception as e:
+            name = None
+            s.set(outcome="unsupported", error=str(e)[:200])
+    CONTEXT_CACHE_OPS.inc(model=model, outcome="created" if name else "unsupported")
+    with _PREFIX_LOCK:
+        _PREFIX_CACHES[key] = (name, now + CONTEXT_CACHE_TTL_S)
+    return name
+
+
+def _is_cache_error(msg: str) -> bool:
+    """The cached content is gone (expired / evicted / deleted), not the call."""
+    msg = msg.lower()
+    return "cachedcontent" in msg or "cached content" in msg or "cached_content" in msg
+
+
+def _invalidate_prefix(prefix: PromptPrefix, model: str, slot: int) -> None:
+    with _PREFIX_LOCK:
+        _PREFIX_CACHES.pop((prefix.key, model, slot), None)
+
+
+# ==========================================================
+# METRICS (Prometheus text via tracing.start_metrics_server)
+# ==========================================================
+MODEL_CALLS = REGISTRY.counter(
+    "lifepilot_model_calls_total", "Model attempts by model, key slot and outcome."
+)
+MODEL_SECONDS = REGISTRY.histogram(
+    "lifepilot_model_call_seconds", "Latency of single model attempts."
+)
+PROMPT_BYTES = REGISTRY.counter(
+    "lifepilot_prompt_bytes_total", "Prompt bytes sent per model."
+)
+RESPONSE_BYTES = REGISTRY.counter(
+    "lifepilot_response_bytes_total", "Response bytes received per model."
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "lifepilot_cache_lookups_total", "Generation cache lookups by outcome."
+)
+RETRIES = REGISTRY.counter(
+    "lifepilot_retries_total", "Retries / fallbacks by model and reason."
+)
+EMBED_CALLS = REGISTRY.counter(
+    "lifepilot_embed_calls_total", "Embedding attempts by outcome."
+)
+EMBED_SECONDS = REGISTRY.histogram(
+    "lifepilot_embed_seconds", "Latency of single embedding attempts."
+)
+TOKENS = REGISTRY.counter(
+    "lifepilot_tokens_total", "Model tokens by agent, model and kind (input / output)."
+)
+CONTEXT_CACHE_OPS = REGISTRY.counter(
+    "lifepilot_context_cache_total", "Prefix cache registrations by model and outcome."
+)
+HEDGES = REGISTRY.counter(
+    "lifepilot_hedges_total", "Hedged generate requests by target model and outcome (won / lost / skipped)."
+)
+
 
 def clear_cache():
     """Clear in-memory generation cache (useful for testing)."""
-    global _CACHE
-    _CACHE = {}
+    # Cleared in place: other threads keep using the same dict
+    with _CACHE_LOCK:
+        _CACHE.clear()
+
+
+def get_stats() -> Dict[str, int]:
+    """Snapshot of the call counters since the last reset_stats()."""
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+
+def reset_stats() -> None:
+    with _STATS_LOCK:
+        for k in _STATS:
+            _STATS[k] = 0
+
+
+FAILED_MESSAGE = (
+    "❌ All available models failed due to quota or API issues.\n"
+    "Please try again later or configure a different API key."
+)
+
+
+def generation_failed(text: str) -> bool:
+    """True if generate() gave up and returned its failure message."""
+    return text == FAILED_MESSAGE
+
+
+def _is_rate_limit(msg: str) -> bool:
+    return "429" in msg or "RESOURCE_EXHAUSTED" in msg
 
 
 def _hash(text: str) -> str:
@@ -80,95 +1021,649 @@ def _retry_delay(attempt: int) -> float:
     return min(2 ** attempt, 8.0)
 
 
-def _call_model(model: str, prompt: str) -> str:
-    if ENABLE_LOGS:
-        print(f"[MODEL CALL] {model}, len={len(prompt)}")
+def _backoff(model: str, attempt: int, deadline: Optional[float] = None) -> None:
+    delay = _retry_delay(attempt)
+    left = remaining(deadline)
+    if left is not None and left <= delay:
+        # Sleeping would burn the rest of the budget for nothing
+        RETRIES.inc(model=model, reason="deadline")
+        raise DeadlineExceeded(f"deadline exceeded during backoff on {model}")
+    with span("retry", model=model, reason="rate_limit", delay_s=delay):
+        time.sleep(delay)
+
+
+def _call_model(
+    model: str,
+    prompt: str,
+    slot: int = 0,
+    deadline: Optional[float] = None,
+    max_output_tokens: Optional[int] = None,
+    prefix: Optional[PromptPrefix] = None,
+) -> str:
+    """One model call; `prompt` is only the dynamic part when a prefix is given."""
+    if prefix is None:
+        return _attempt(model, prompt, slot, deadline, max_output_tokens)
+    cached = _cached_prefix(prefix, model, slot)
+    if cached:
+        try:
+            return _attempt(model, prompt, slot, deadline, max_output_tokens, cached)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            # Only a missing cache is worth an inline resend; timeouts, 429s
+            # etc. go to the caller's retry loop like any other failure
+            if not _is_cache_error(str(e)):
+                raise
+            # Cache expired / evicted early → re-register next time, answer inline now
+            _invalidate_prefix(prefix, model, slot)
+            RETRIES.inc(model=model, reason="context_cache")
+    return _attempt(model, prefix.render(prompt), slot, deadline, max_output_tokens)
+
 
+def _attempt(
+    model: str,
+    prompt: str,
+    slot: int = 0,
+    deadline: Optional[float] = None,
+    max_output_tokens: Optional[int] = None,
+    cached_content: Optional[str] = None,
+) -> str:
     # Hard trim for safety
     MAX_LEN = 8000
     if len(prompt) > MAX_LEN:
         prompt = prompt[:MAX_LEN]
 
-    resp = client.models.generate_content(
-        model=model,
-        contents=prompt,
-    )
-    return _extract_text(resp).strip()
+    prompt_bytes = len(prompt.encode("utf-8"))
+    _bump("llm_calls")
+    PROMPT_BYTES.inc(prompt_bytes, model=model)
+
+    _RATE_LIMITER.acquire(deadline)
+    _check_deadline(deadline, f"calling {model}")
+    with _SCHEDULER.slot(deadline) as queue_wait_s, span(
+        "model_attempt", model=model, slot=slot, prompt_bytes=prompt_bytes,
+        cached_prefix=bool(cached_content), priority=_PRIORITY.get(), queue_wait_s=round(queue_wait_s, 4),
+    ) as s:
+        timeout = _check_deadline(deadline, f"calling {model}")
+        started = _ATTEMPT_STARTED.get()
+        if started is not None:
+            started.set()
+        try:
+            # Only pass cached_content when used, so backends without caching still work
+            if cached_content:
+                resp = _BACKEND.generate_content(
+                    model, prompt, slot=slot, timeout=timeout,
+                    max_output_tokens=max_output_tokens, cached_content=cached_content,
+                )
+            else:
+                resp = _BACKEND.generate_content(
+                    model, prompt, slot=slot, timeout=timeout, max_output_tokens=max_output_tokens
+                )
+        except Exception as e:
+            outcome = "rate_limited" if _is_rate_limit(str(e)) else "error"
+            if outcome == "rate_limited":
+                _mark_unhealthy(model, slot)
+            s.set(outcome=outcome)
+            MODEL_CALLS.inc(model=model, slot=slot, outcome=outcome)
+            MODEL_SECONDS.observe(s.duration, model=model)
+            raise
+        out = _extract_text(resp).strip()
+        response_bytes = len(out.encode("utf-8"))
+        outcome = "ok" if out else "empty"
+        input_tokens, output_tokens, exact = _usage(resp, prompt, out)
+        _record_usage(model, input_tokens, output_tokens)
+        cached_tokens = getattr(getattr(resp, "usage_metadata", None), "cached_content_token_count", None) or 0
+        _bump("cached_tokens", cached_tokens)
+        s.set(
+            outcome=outcome, response_bytes=response_bytes,
+            input_tokens=input_tokens, output_tokens=output_tokens, tokens_exact=exact,
+            cached_tokens=cached_tokens,
+        )
+        MODEL_CALLS.inc(model=model, slot=slot, outcome=outcome)
+        MODEL_SECONDS.observe(s.duration, model=model)
+        RESPONSE_BYTES.inc(response_bytes, model=model)
+        if out:
+            model_stats(model).record(s.duration, response_bytes)
+        return out
+
+
+# ==========================================================
+# HEDGED REQUESTS (tail latency)
+# ==========================================================
+class HedgePolicy:
+    """
+    When to send a second, hedged request for a slow primary call.
+
+    - delay: rolling `quantile` (p90) of the primary model's latency,
+      never below min_delay_s; no hedging until enough samples exist
+    - spend cap: at most `max_ratio` of the last `window` primary calls
+      may fire a hedge, and no new hedge fires while `max_orphans` losing
+      attempts (which keep their scheduler slot and quota until they
+      finish) are still running
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        quantile: float = 0.9,
+        min_delay_s: float = 0.25,
+        max_ratio: float = 0.1,
+        window: int = 100,
+        max_orphans: int = 4,
+    ):
+        self._lock = TrackedLock("hedge_policy")
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_delay_s = min_delay_s
+        self.max_ratio = max_ratio
+        self.max_orphans = max_orphans
+        self._fired: Deque[bool] = deque(maxlen=window)
+        self._orphans = 0
+
+    def delay(self, model: str) -> Optional[float]:
+        if not self.enabled:
+            return None
+        q = model_stats(model).quantile(self.quantile)
+        return None if q is None else max(self.min_delay_s, q)
+
+    def record_call(self) -> None:
+        with self._lock:
+            self._fired.append(False)
+
+    def try_fire(self) -> bool:
+        """Reserve a hedge within the spend cap (marks the latest call as hedged)."""
+        with self._lock:
+            if sum(self._fired) + 1 > self.max_ratio * self._fired.maxlen:
+                return False
+            if self._orphans >= self.max_orphans:
+                return False
+            if self._fired:
+                self._fired[-1] = True
+            else:
+                self._fired.append(True)
+            return True
+
+    def orphan(self, fut: Future) -> None:
+        """Count `fut` (a losing attempt still running) until it finishes."""
+        with self._lock:
+            self._orphans += 1
+        _bump("hedges_orphaned")
+        fut.add_done_callback(self._orphan_done)
+
+    def _orphan_done(self, _fut: Future) -> None:
+        with self._lock:
+            self._orphans -= 1
+
+    @property
+    def orphans(self) -> int:
+        with self._lock:
+            return self._orphans
+
+
+_HEDGE = HedgePolicy(
+    enabled=os.getenv("GEN_HEDGE", "0") == "1",
+    quantile=float(os.getenv("GEN_HEDGE_QUANTILE", "0.9")),
+    max_ratio=float(os.getenv("GEN_HEDGE_MAX_RATIO", "0.1")),
+    max_orphans=int(os.getenv("GEN_HEDGE_MAX_ORPHANS", "4")),
+)
+
+# Set by _attempt when its request actually goes out (after the rate limiter
+# and scheduler slot), so the hedge delay does not count queueing time
+_ATTEMPT_STARTED: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    "lifepilot_attempt_started", default=None
+)
+
+
+def set_hedging(enabled: bool, quantile: Optional[float] = None, max_ratio: Optional[float] = None) -> None:
+    """Turn hedged requests on/off for this process (GEN_HEDGE=1 does the same)."""
+    _HEDGE.enabled = enabled
+    if quantile is not None:
+        _HEDGE.quantile = quantile
+    if max_ratio is not None:
+        _HEDGE.max_ratio = max_ratio
+
+
+def _hedge_target(model: str, slot: int, num_slots: int) -> Optional[Tuple[str, int]]:
+    """Next healthy key for the same model, else the next healthy fallback model."""
+    for other in range(1, num_slots):
+        candidate = (slot + other) % num_slots
+        if _healthy(model, candidate):
+            return model, candidate
+    for fallback in FALLBACK_MODELS:
+        if fallback != model and _healthy(fallback, slot):
+            return fallback, slot
+    return None
+
+
+def _start(
+    model: str,
+    prompt: str,
+    slot: int,
+    deadline: Optional[float],
+    max_output_tokens: Optional[int],
+    prefix: Optional[PromptPrefix],
+    started: threading.Event,
+) -> Future:
+    """
+    _call_model on its own thread (not a pool: a bounded pool would queue
+    attempts and cap concurrency behind the scheduler's back). `started` is
+    set when the request goes out, or when the attempt ends without one.
+    """
+    fut: Future = Future()
+    fut.set_running_or_notify_cancel()
+    # Own context copy per attempt: keeps the deadline, priority and parent span
+    ctx = contextvars.copy_context()
+
+    def run() -> None:
+        _ATTEMPT_STARTED.set(started)
+        try:
+            fut.set_result(_call_model(model, prompt, slot, deadline, max_output_tokens, prefix))
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            started.set()
+
+    threading.Thread(target=ctx.run, args=(run,), name=f"hedge-{model}#{slot}", daemon=True).start()
+    return fut
+
+
+def _hedged_call(
+    model: str,
+    prompt: str,
+    slot: int,
+    num_slots: int,
+    deadline: Optional[float],
+    max_output_tokens: Optional[int] = None,
+    prefix: Optional[PromptPrefix] = None,
+) -> Tuple[str, str, int]:
+    """
+    _call_model with a hedge: if `model` is still running after the hedge
+    delay, the same prompt also goes to another key / model and the first
+    non-empty answer wins. Returns (text, model, slot); raises the primary's
+    error when neither attempt produced anything.
+    """
+    _HEDGE.record_call()
+    delay = _HEDGE.delay(model)
+    left = remaining(deadline)
+    if delay is None or (left is not None and left <= delay):
+        return _call_model(model, prompt, slot, deadline, max_output_tokens, prefix), model, slot
+
+    # The delay runs from when the primary's request goes out; time spent
+    # waiting for the rate limiter or a scheduler slot is not "slow"
+    started = threading.Event()
+    primary = _start(model, prompt, slot, deadline, max_output_tokens, prefix, started)
+    started.wait(remaining(deadline))
+    left = remaining(deadline)
+    if wait([primary], timeout=delay if left is None else min(delay, left)).done:
+        return primary.result(), model, slot
+
+    target = _hedge_target(model, slot, num_slots)
+    if target is None or not _HEDGE.try_fire():
+        HEDGES.inc(model=model, outcome="skipped")
+        return primary.result(), model, slot
+
+    _bump("hedges_fired")
+    hedge_model, hedge_slot = target
+    with span("hedge", model=hedge_model, slot=hedge_slot, after_s=round(delay, 3)) as hs:
+        hedge = _start(hedge_model, prompt, hedge_slot, deadline, max_output_tokens, prefix, threading.Event())
+        owners = {primary: (model, slot), hedge: (hedge_model, hedge_slot)}
+        pending = {primary, hedge}
+        fallback: Optional[Tuple[str, str, int]] = None
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    out = fut.result()
+                except Exception as e:
+                    if fut is primary or error is None:
+                        error = e
+                    continue
+                won_model, won_slot = owners[fut]
+                if out:
+                    # The loser cannot be interrupted: it keeps its slot and
+                    # quota until it ends, so it counts against the spend cap
+                    for other in pending:
+                        _HEDGE.orphan(other)
+                    won = fut is hedge
+                    if won:
+                        _bump("hedges_won")
+                    HEDGES.inc(model=hedge_model, outcome="won" if won else "lost")
+                    hs.set(won=won)
+                    return out, won_model, won_slot
+                fallback = fallback or (out, won_model, won_slot)
+        HEDGES.inc(model=hedge_model, outcome="lost")
+        hs.set(won=False)
+        if fallback is not None:
+            return fallback
+        raise error  # type: ignore[misc]
+
+
+# ==========================================================
+# WARM-UP HELPERS (see warmup.py)
+# ==========================================================
+def connect_clients() -> Dict[int, str]:
+    """Open a connection per key slot. Returns {slot: "ok" | error}."""
+    out: Dict[int, str] = {}
+    connect = getattr(_BACKEND, "connect", None)
+    for slot in range(max(1, _BACKEND.num_slots)):
+        if connect is None:
+            out[slot] = "ok"  # backend needs no connection (e.g. fake)
+            continue
+        with span("connect", slot=slot) as s:
+            try:
+                connect(slot)
+                out[slot] = "ok"
+            except Exception as e:
+                out[slot] = f"{type(e).__name__}: {e}"
+            s.set(outcome="ok" if out[slot] == "ok" else "error")
+    return out
+
+
+def probe_models(models: Optional[List[str]] = None, slot: int = 0) -> Dict[str, str]:
+    """
+    One tiny generate per model, so ModelStats and the 429 health state
+    start from real measurements. Returns {model: "ok" | error}.
+    """
+    def probe(model: str) -> str:
+        try:
+            _call_model(model, "Reply with OK.", slot)
+            return "ok"
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+
+    models = models or [PRIMARY_MODEL] + FALLBACK_MODELS
+    with ThreadPoolExecutor(max_workers=len(models), thread_name_prefix="probe") as pool:
+        return dict(zip(models, pool.map(probe, models)))
 
 
 # ==========================================================
 # PUBLIC: GENERATE
 # ==========================================================
-def generate(prompt: str) -> str:
+def generate(
+    prompt: str,
+    use_cache: bool = True,
+    deadline: Optional[float] = None,
+    max_output_tokens: Optional[int] = None,
+    prefix: Optional[PromptPrefix] = None,
+) -> str:
     """
     Robust generation:
-      - in-memory cache
+      - in-memory cache (use_cache=False forces a fresh call, e.g. to
+        retry after an unparseable answer)
       - multiple retries
       - model fallback chain
       - rate-limit backoff
+      - optional hedging (GEN_HEDGE=1): a primary call slower than its
+        rolling p90 races a second request on another key / model
+      - deadline (absolute time.monotonic(); defaults to the request's
+        deadline_scope): each attempt gets the remaining budget as its
+        timeout, and DeadlineExceeded is raised once it is used up
+      - max_output_tokens (see output_budget) caps the answer via the
+        generation config; token usage is recorded per agent / model / user
+      - prefix: the caller's static instructions (PromptPrefix); `prompt`
+        is then only the dynamic part and the prefix is served from the
+        model's context cache when possible (GEN_CONTEXT_CACHE)
     """
+    if deadline is None:
+        deadline = _DEADLINE.get()
+    with span(
+        "generate", prompt_bytes=len(prompt.encode("utf-8")), max_output_tokens=max_output_tokens,
+        prefix=prefix.key if prefix else None,
+    ) as s:
+        out = _generate(prompt, s, use_cache, deadline, max_output_tokens, prefix)
+        s.set(response_bytes=len(out.encode("utf-8")))
+        return out
+
 
-    key = _hash(prompt)
-    if ENABLE_CACHE and key in _CACHE:
-        if ENABLE_LOGS:
-            print("[CACHE HIT]")
-        return _CACHE[key]
+def _generate(
+    prompt: str,
+    s: Span,
+    use_cache: bool = True,
+    deadline: Optional[float] = None,
+    max_output_tokens: Optional[int] = None,
+    prefix: Optional[PromptPrefix] = None,
+) -> str:
+    # A different cap can give a different (truncated) answer
+    key = _hash(
+        (f"{max_output_tokens}\0" if max_output_tokens is not None else "")
+        + (f"{prefix.key}\0" if prefix else "")
+        + prompt
+    )
+    if ENABLE_CACHE and use_cache:
+        with _CACHE_LOCK:
+            cached = _CACHE.get(key)
+        if cached is not None:
+            _bump("cache_hits")
+            CACHE_LOOKUPS.inc(outcome="hit")
+            s.set(cache="hit")
+            return cached
+    _bump("cache_misses")
+    CACHE_LOOKUPS.inc(outcome="miss")
+    s.set(cache="miss")
 
     models: List[str] = [PRIMARY_MODEL] + FALLBACK_MODELS
+    num_slots = max(1, _BACKEND.num_slots)
+    slot = 0
 
     for model in models:
+        tried_slots = {slot}
         for attempt in range(3):
+            _check_deadline(deadline, f"attempt {attempt + 1} on {model}")
             try:
-                out = _call_model(model, prompt)
+                if _HEDGE.enabled and attempt == 0 and model == PRIMARY_MODEL:
+                    out, used_model, used_slot = _hedged_call(
+                        model, prompt, slot, num_slots, deadline, max_output_tokens, prefix
+                    )
+                else:
+                    out = _call_model(model, prompt, slot, deadline, max_output_tokens, prefix)
+                    used_model, used_slot = model, slot
                 if out:
                     if ENABLE_CACHE:
-                        _CACHE[key] = out
+                        with _CACHE_LOCK:
+                            _CACHE[key] = out
+                    s.set(model=used_model, slot=used_slot)
                     return out
                 # Empty output → try same model once more
+                RETRIES.inc(model=model, reason="empty")
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 msg = str(e)
-                if "429" in msg or "RESOURCE_EXHAUSTED" in msg:
-                    delay = _retry_delay(attempt)
-                    if ENABLE_LOGS:
-                        print(f"[RATE LIMIT] {model}, retry in {delay}s...")
-                    time.sleep(delay)
+                if _is_rate_limit(msg):
+                    _bump("rate_limited")
+                    # Another key may still have quota → switch without sleeping
+                    if len(tried_slots) < num_slots:
+                        slot = (slot + 1) % num_slots
+                        tried_slots.add(slot)
+                        RETRIES.inc(model=model, reason="key_switch")
+                        continue
+                    RETRIES.inc(model=model, reason="rate_limit")
+                    _backoff(model, attempt, deadline)
                     continue
-                if ENABLE_LOGS:
-                    print(f"[ERROR] {model}: {msg}")
+                RETRIES.inc(model=model, reason="fallback")
                 break  # switch to next model
 
     # All models failed
-    return (
-        "❌ All available models failed due to quota or API issues.\n"
-        "Please try again later or configure a different API key."
-    )
+    s.set(outcome="failed")
+    return FAILED_MESSAGE
 
 
 # ==========================================================
 # PUBLIC: EMBEDDINGS (robust)
 # ==========================================================
-def embed(text: str) -> List[float]:
+class EmbeddingFailed(Exception):
+    """No vector could be obtained (errors / 429s on every attempt, or the circuit is open)."""
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a dependency is down:
+      - closed: calls go through; `threshold` consecutive failures open it
+      - open: calls are refused for `cooldown_s` (no network round trip)
+      - half_open: after the cooldown one probe call goes through; its
+        success closes the circuit, its failure re-opens it
+    A probe that neither succeeds nor fails (e.g. deadline hit) is
+    replaced by a new one after another cooldown.
+    """
+
+    def __init__(self, name: str, threshold: int, cooldown_s: float):
+        self.name = name
+        self.threshold = max(1, threshold)
+        self.cooldown_s = cooldown_s
+        self._lock = TrackedLock(f"circuit_{name}")
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "open" if now - self._opened_at < self.cooldown_s else "half_open"
+
+    def allow(self) -> bool:
+        """True if a call may go out now (the half-open probe included)."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state == "closed":
+                return True
+            if state == "open":
+                return False
+            if self._probe_at is not None and now - self._probe_at < self.cooldown_s:
+                return False  # a probe is already out
+            self._probe_at = now
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_at = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probe_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._probe_at = None
+
+
+# EMBED_CIRCUIT_THRESHOLD consecutive failed embed() / embed_batch() calls
+# open the circuit; for EMBED_CIRCUIT_COOLDOWN_S seconds embeddings then fail
+# fast and VectorMemory falls back to lexical search.
+_EMBED_CIRCUIT = CircuitBreaker(
+    "embed",
+    threshold=int(os.getenv("EMBED_CIRCUIT_THRESHOLD", "3")),
+    cooldown_s=float(os.getenv("EMBED_CIRCUIT_COOLDOWN_S", "30")),
+)
+
+
+def embed_circuit_open() -> bool:
+    """True while embeddings are failing fast (no probe due yet)."""
+    return _EMBED_CIRCUIT.state == "open"
+
+
+def embed_circuit_state() -> str:
+    return _EMBED_CIRCUIT.state
+
+
+def embed(text: str, deadline: Optional[float] = None, strict: bool = False) -> List[float]:
     """
     Robust embedding:
       - retries with backoff on 429
-      - returns zero-vector fallback instead of crashing
+      - returns zero-vector fallback instead of crashing; strict=True
+        raises EmbeddingFailed instead (callers that retry later)
+      - raises DeadlineExceeded once the (request) deadline is used up
+      - fails fast (no call) while the embedding circuit is open
+      - vectors have EMBED_DIM dimensions
     """
     if not text:
-        return [0.0] * 768
+        return [0.0] * EMBED_DIM
+    try:
+        return _embed_contents([text], deadline)[0]
+    except EmbeddingFailed:
+        if strict:
+            raise
+        return [0.0] * EMBED_DIM
+
+
+def embed_batch(texts: List[str], deadline: Optional[float] = None) -> List[List[float]]:
+    """
+    One embedding request for several texts (same retries as embed()).
+    Raises EmbeddingFailed rather than returning zero vectors.
+    """
+    if not texts:
+        return []
+    return _embed_contents(list(texts), deadline)
+
+
+def _embed_contents(texts: List[str], deadline: Optional[float]) -> List[List[float]]:
+    if deadline is None:
+        deadline = _DEADLINE.get()
+    # A single text goes out as a plain string, as before; batches as a list
+    contents = texts[0] if len(texts) == 1 else texts
+
+    if not _EMBED_CIRCUIT.allow():
+        _bump("embed_short_circuits")
+        EMBED_CALLS.inc(outcome="circuit_open")
+        raise EmbeddingFailed(f"embedding circuit open ({len(texts)} text(s) not sent)")
+
+    num_slots = max(1, _BACKEND.num_slots)
+    slot = 0
+    with span(
+        "embed", model=EMBED_MODEL, texts=len(texts), text_bytes=sum(len(t.encode("utf-8")) for t in texts),
+    ) as s:
+        for attempt in range(3):
+            _RATE_LIMITER.acquire(deadline)
+            _check_deadline(deadline, "embedding")
+            t0 = time.perf_counter()
+            try:
+                _bump("embed_calls")
+                with _SCHEDULER.slot(deadline):
+                    timeout = _check_deadline(deadline, "embedding")
+                    t0 = time.perf_counter()  # latency without the queue wait
+                    if EMBED_DIM != NATIVE_EMBED_DIM:
+                        resp = _BACKEND.embed_content(
+                            EMBED_MODEL, contents, slot=slot, timeout=timeout, output_dimensionality=EMBED_DIM
+                        )
+                    else:
+                        resp = _BACKEND.embed_content(EMBED_MODEL, contents, slot=slot, timeout=timeout)
+                EMBED_SECONDS.observe(time.perf_counter() - t0)
+                if hasattr(resp, "embeddings") and resp.embeddings and len(resp.embeddings) == len(texts):
+                    EMBED_CALLS.inc(outcome="ok")
+                    s.set(slot=slot, outcome="ok", attempts=attempt + 1)
+                    _EMBED_CIRCUIT.success()
+                    return [_fit_dim(list(e.values)) for e in resp.embeddings]
+                EMBED_CALLS.inc(outcome="empty")
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                EMBED_SECONDS.observe(time.perf_counter() - t0)
+                msg = str(e)
+                if _is_rate_limit(msg):
+                    EMBED_CALLS.inc(outcome="rate_limited")
+                    _bump("rate_limited")
+                    if num_slots > 1:
+                        slot = (slot + 1) % num_slots
+                    _backoff(EMBED_MODEL, attempt, deadline)
+                    continue
+                EMBED_CALLS.inc(outcome="error")
+                break
+
+        s.set(outcome="failed")
+    _EMBED_CIRCUIT.failure()
+    raise EmbeddingFailed(f"embedding failed for {len(texts)} text(s)")
 
-    for attempt in range(3):
-        try:
-            resp = client.models.embed_content(
-                model=EMBED_MODEL,
-                contents=text
-            )
-            if hasattr(resp, "embeddings") and resp.embeddings:
-                return resp.embeddings[0].values
-        except Exception as e:
-            msg = str(e)
-            if "429" in msg or "RESOURCE_EXHAUSTED" in msg:
-                time.sleep(_retry_delay(attempt))
-                continue
-            break
 
-    return [0.0] * 768
+def _fit_dim(values: List[float]) -> List[float]:
+    """Truncate to EMBED_DIM and re-normalise (no-op when sizes already match)."""
+    if len(values) <= EMBED_DIM:
+        return values
+    values = values[:EMBED_DIM]
+    norm = sum(x * x for x in values) ** 0.5
+    return [x / norm for x in values] if norm else values
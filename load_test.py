@@ -0,0 +1,191 @@
+# load_test.py
+"""
+Concurrency load test: N simulated users (one thread and one Orchestrator
+each, like Streamlit sessions) drive Orchestrator.handle against the local
+fake backend at the same time.
+
+For every N in --users it reports:
+  - throughput (requests / second) and p50 / p95 / p99 latency
+  - failed requests (exceptions raised by handle)
+  - lock waits in gen_client, timed around every blocking acquire():
+    p99 and max wait per acquisition, total wait, and the lock with the
+    most total wait
+  - with --max-in-flight: mean / p95 wait for a model call slot per
+    priority class; --batch-users adds sessions running at "batch"
+    priority next to the interactive ones (their requests are not counted
+    in the latency columns)
+
+Usage:
+    python load_test.py --users 1,4,16,32 --requests 10 --latency "lognormal:0.2,0.5"
+    python load_test.py --users 8 --batch-users 8 --max-in-flight 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+# The fake backend needs no API key; set before gen_client is imported.
+os.environ.setdefault("GEN_BACKEND", "fake")
+
+import gen_client
+from benchmark import SCENARIOS, percentile
+from fake_backend import FakeBackend
+from orchestrator import Orchestrator
+
+
+def run_users(users: int, requests: int, shared_queries: bool, batch_users: int = 0) -> Dict[str, Any]:
+    queries = [q for qs in SCENARIOS.values() for q in qs]
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    start = threading.Barrier(users + batch_users)
+    interactive_done = threading.Event()
+
+    def session(n: int) -> None:
+        orc = Orchestrator(user_id=f"load-{n}")
+        start.wait()  # all users begin together
+        for i in range(requests):
+            q = queries[(n + i) % len(queries)]
+            if not shared_queries:
+                q = f"{q} (session {n}, request {i})"  # defeat the shared generation cache
+            t0 = time.perf_counter()
+            try:
+                orc.handle(q)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    def batch_session(n: int) -> None:
+        # Keeps the model busy until the interactive users are done
+        orc = Orchestrator(user_id=f"batch-{n}")
+        start.wait()
+        i = 0
+        with gen_client.priority_scope("batch"):
+            while not interactive_done.is_set():
+                try:
+                    orc.handle(f"{queries[(n + i) % len(queries)]} (batch {n}, item {i})")
+                except Exception:
+                    pass
+                i += 1
+
+    gen_client.clear_cache()
+    gen_client.reset_stats()
+    gen_client.reset_lock_stats()
+    gen_client.reset_scheduler_stats()
+    threads = [threading.Thread(target=session, args=(n,), name=f"user-{n}") for n in range(users)]
+    batch_threads = [
+        threading.Thread(target=batch_session, args=(n,), name=f"batch-{n}") for n in range(batch_users)
+    ]
+    t0 = time.perf_counter()
+    for t in threads + batch_threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    interactive_done.set()
+    for t in batch_threads:
+        t.join()
+    scheduler = gen_client.scheduler_stats()
+
+    locks = gen_client.lock_stats()
+    acquisitions = sum(r["acquisitions"] for r in locks.values())
+    buckets = [sum(counts) for counts in zip(*(r["buckets"] for r in locks.values()))]
+    max_wait = max((r["max_wait_s"] for r in locks.values()), default=0.0)
+    hottest = max(locks.items(), key=lambda kv: kv[1]["wait_s"], default=("-", {"wait_s": 0.0}))
+    if not hottest[1]["wait_s"]:
+        hottest = ("-", {"wait_s": 0.0})
+    return {
+        "users": users,
+        "batch_users": batch_users,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "llm_calls": gen_client.get_stats()["llm_calls"],
+        "lock_acquisitions": acquisitions,
+        "lock_wait_p99_us": 1e6 * min(gen_client.lock_wait_quantile(buckets, 0.99), max_wait),
+        "lock_wait_max_ms": 1000.0 * max_wait,
+        "lock_wait_ms": 1000.0 * sum(r["wait_s"] for r in locks.values()),
+        "hottest_lock": hottest[0],
+        "hottest_lock_wait_ms": 1000.0 * hottest[1]["wait_s"],
+        "locks": locks,
+        "slot_wait_ms": {
+            p: {"mean": 1000.0 * w["mean_wait_s"], "p95": 1000.0 * w["p95_wait_s"], "calls": w["calls"]}
+            for p, w in scheduler["waits"].items()
+        },
+    }
+
+
+def print_table(report: List[Dict[str, Any]]) -> None:
+    header = (
+        f"{'users':>5} {'reqs':>5} {'err':>4} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} "
+        f"{'lock acq':>9} {'p99 us':>7} {'max ms':>7} {'wait ms':>8}  "
+        f"{'slot wait p95 ms (int/bg/batch)':<32} hottest lock"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in report:
+        slot_waits = "/".join(f"{w['p95']:.0f}" for w in r["slot_wait_ms"].values())
+        print(
+            f"{r['users']:>5} {r['requests']:>5} {r['errors']:>4} {r['throughput_rps']:>7.2f} "
+            f"{r['p50_s']:>7.3f} {r['p95_s']:>7.3f} {r['p99_s']:>7.3f} "
+            f"{r['lock_acquisitions']:>9} {r['lock_wait_p99_us']:>7.0f} {r['lock_wait_max_ms']:>7.2f} "
+            f"{r['lock_wait_ms']:>8.2f}  "
+            f"{slot_waits:<32} "
+            f"{r['hottest_lock']} ({r['hottest_lock_wait_ms']:.2f} ms)"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="LifePilot concurrent-users load test (fake backend).")
+    parser.add_argument("--users", default="1,2,4,8,16,32", help="comma-separated concurrent user counts")
+    parser.add_argument("--requests", type=int, default=5, help="requests per user")
+    parser.add_argument("--latency", default="lognormal:0.2,0.5", help="generate() latency spec")
+    parser.add_argument("--embed-latency", default="const:0.02", help="embed() latency spec")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="injected 429 rate (0–1)")
+    parser.add_argument("--slots", type=int, default=1, help="number of fake API key slots")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply all fake latencies")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--shared-queries", action="store_true",
+                        help="let users send identical queries (exercises generation cache hits)")
+    parser.add_argument("--max-in-flight", type=int, default=0,
+                        help="global cap on concurrent model calls (gen_client scheduler, 0 = none)")
+    parser.add_argument("--batch-users", type=int, default=0,
+                        help="extra sessions at batch priority competing for the same slots")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    gen_client.set_backend(FakeBackend(
+        latency=args.latency,
+        embed_latency=args.embed_latency,
+        error_rate=args.error_rate,
+        num_slots=args.slots,
+        seed=args.seed,
+        time_scale=args.time_scale,
+    ))
+    gen_client.set_max_in_flight(args.max_in_flight)
+
+    report = [
+        run_users(int(n), args.requests, args.shared_queries, args.batch_users)
+        for n in args.users.split(",") if n.strip()
+    ]
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+    return 1 if any(r["errors"] for r in report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,160 @@
 # app/logs.py
 import datetime
+import json
+import os
+import queue
 import threading
-from typing import List, Dict
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional
+
+
+class JsonlSink:
+    """
+    Background writer that batches log entries to a rotating JSONL file.
+    add() never blocks: when the queue is full the entry is dropped and
+    counted in `dropped`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 10 * 1024 * 1024,
+        backups: int = 3,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="agentlog-jsonl", daemon=True)
+        self._thread.start()
+
+    def put(self, entry: Dict) -> None:
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush what is queued and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _rotate(self) -> None:
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _write(self, batch: List[Dict]) -> None:
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, default=str) + "\n" for e in batch))
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch: List[Dict] = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+                while len(batch) < self.batch_size and not stop:
+                    item = self._queue.get_nowait()
+                    if item is None:
+                        stop = True
+                    else:
+                        batch.append(item)
+            except queue.Empty:
+                pass
+            if batch:
+                try:
+                    self._write(batch)
+                except OSError:
+                    self.dropped += len(batch)
+
 
 class AgentLog:
-    def __init__(self):
+    """
+    Fixed-capacity ring buffer of log entries.
+    Appends take one short lock; the oldest entries fall off the end.
+    Per-agent reads filter the same ring (newest first, stopping after n
+    matches), so retention stays at `capacity` entries in total.
+    """
+
+    def __init__(self, capacity: int = 5000, sink: Optional[JsonlSink] = None):
         self._lock = threading.Lock()
-        self.entries: List[Dict] = []
+        self.capacity = capacity
+        self.entries: Deque[Dict] = deque(maxlen=capacity)
+        self.sink = sink
 
     def add(self, agent_name: str, message: str, level="INFO", meta=None):
+        entry = {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "agent": agent_name,
+            "level": level,
+            "message": message,
+            "meta": meta or {}
+        }
         with self._lock:
-            self.entries.append({
-                "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
-                "agent": agent_name,
-                "level": level,
-                "message": message,
-                "meta": meta or {}
-            })
+            self.entries.append(entry)
+        if self.sink is not None:
+            self.sink.put(entry)
+
+    def tail(self, n: int = 100, agent: Optional[str] = None) -> List[Dict]:
+        """Last n entries (oldest first), optionally only for one agent."""
+        with self._lock:
+            newest = reversed(self.entries)
+            if agent is not None:
+                newest = (e for e in newest if e["agent"] == agent)
+            out = list(islice(newest, n))
+        out.reverse()
+        return out
+
+    def by_agent(self, agent: str, n: Optional[int] = None) -> List[Dict]:
+        return self.tail(n if n is not None else self.capacity, agent=agent)
+
+    def agents(self) -> List[str]:
+        with self._lock:
+            return list(dict.fromkeys(e["agent"] for e in self.entries))
 
     def all(self):
         with self._lock:
             return list(self.entries)
 
-GLOBAL_LOG = AgentLog()
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def _sink_from_env() -> Optional[JsonlSink]:
+    path = os.getenv("AGENT_LOG_JSONL")
+    if not path:
+        return None
+    return JsonlSink(
+        path,
+        max_bytes=int(os.getenv("AGENT_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backups=int(os.getenv("AGENT_LOG_BACKUPS", "3")),
+    )
+
+
+GLOBAL_LOG = AgentLog(
+    capacity=int(os.getenv("AGENT_LOG_CAPACITY", "5000")),
+    sink=_sink_from_env(),
+)
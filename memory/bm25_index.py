@@ -0,0 +1,93 @@
+# memory/bm25_index.py
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Words that say nothing about a preference; kept out of the index
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from i im in is it its me my of on or "
+    "our please so that the this to us was we with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [w for w in _WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Inverted index with Okapi BM25 scoring, updated one document at a time
+    (add / remove), so it can sit next to a store that changes on every
+    request. Documents are keyed by caller-chosen ints.
+
+    - postings: term -> {doc: term frequency}
+    - idf uses the current document count, so scores of a document shift
+      slightly as others come and go (no rebuild needed).
+    - scores() only touches the postings of the query terms.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: Dict[int, int] = {}
+        self._terms: Dict[int, List[str]] = {}  # doc -> its distinct terms, for remove()
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    @property
+    def terms(self) -> int:
+        return len(self._postings)
+
+    def __contains__(self, doc: int) -> bool:
+        return doc in self._lengths
+
+    def add(self, doc: int, text: str) -> None:
+        if doc in self._lengths:
+            self.remove(doc)
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc] = tf
+        length = sum(terms.values())
+        self._lengths[doc] = length
+        self._terms[doc] = list(terms)
+        self._total_length += length
+
+    def remove(self, doc: int) -> None:
+        length = self._lengths.pop(doc, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._terms.pop(doc):
+            docs = self._postings[term]
+            del docs[doc]
+            if not docs:
+                del self._postings[term]
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """BM25 score of every document sharing a term with `query` (others score 0)."""
+        n = len(self._lengths)
+        if not n:
+            return {}
+        avg_length = self._total_length / n or 1.0
+        out: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            docs = self._postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1.0 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc, tf in docs.items():
+                norm = self.k1 * (1.0 - self.b + self.b * self._lengths[doc] / avg_length)
+                out[doc] = out.get(doc, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+        return out
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._lengths.clear()
+        self._terms.clear()
+        self._total_length = 0
@@ -0,0 +1,155 @@
+# memory/embedding_store.py
+
+import os
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+
+
+def default_precision() -> str:
+    precision = os.getenv("MEMORY_EMBED_PRECISION", "float32").lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown MEMORY_EMBED_PRECISION: {precision!r} (expected one of {PRECISIONS})")
+    return precision
+
+
+def _fit(vec: Sequence[float], dim: int) -> np.ndarray:
+    """float32 copy of `vec` truncated / zero-padded to `dim`, L2-normalised."""
+    out = np.zeros(dim, dtype=np.float32)
+    values = np.asarray(vec, dtype=np.float32)[:dim]
+    out[: len(values)] = values
+    norm = float(np.linalg.norm(out))
+    if norm > 0:
+        out /= norm
+    return out
+
+
+class EmbeddingStore:
+    """
+    Embeddings as one contiguous numpy matrix (a row per memory entry)
+    instead of lists of boxed Python floats.
+
+    - Rows are L2-normalised on insert, so cosine similarity is a dot product.
+    - precision "float32" (4 B/dim), "float16" (2 B/dim) or "int8"
+      (1 B/dim + one float32 scale per row: row ≈ int8 * scale).
+    - Quantized rows are scored directly (one matrix-vector product, the
+      int8 scale applied per row afterwards), never expanded to lists.
+    - The dimension is fixed by the first vector (or `dim`); other sizes
+      are truncated / zero-padded to it.
+    """
+
+    def __init__(self, precision: str = "float32", dim: Optional[int] = None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision!r} (expected one of {PRECISIONS})")
+        self.precision = precision
+        self.dim = dim
+        self._n = 0
+        self._rows = np.zeros((0, dim or 0), dtype=np.dtype(precision))
+        self._scales = np.zeros(0, dtype=np.float32)  # int8 only
+
+    @classmethod
+    def from_vectors(
+        cls,
+        vectors: Iterable[Sequence[float]],
+        precision: str = "float32",
+        dim: Optional[int] = None,
+    ) -> "EmbeddingStore":
+        """Build a store from plain float vectors (e.g. a list-of-lists store)."""
+        store = cls(precision, dim)
+        for vec in vectors:
+            store.append(vec)
+        return store
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the stored rows (and scales), excluding spare capacity."""
+        per_row = self._rows.itemsize * (self.dim or 0) + (4 if self.precision == "int8" else 0)
+        return per_row * self._n
+
+    def _grow(self) -> None:
+        size = max(16, 2 * len(self._rows))
+        rows = np.zeros((size, self.dim), dtype=self._rows.dtype)
+        rows[: self._n] = self._rows[: self._n]
+        self._rows = rows
+        if self.precision == "int8":
+            scales = np.zeros(size, dtype=np.float32)
+            scales[: self._n] = self._scales[: self._n]
+            self._scales = scales
+
+    def append(self, vec: Sequence[float]) -> None:
+        if self.dim is None:
+            self.dim = len(vec)
+            self._rows = np.zeros((0, self.dim), dtype=self._rows.dtype)
+        if self._n == len(self._rows):
+            self._grow()
+        self._write(self._n, vec)
+        self._n += 1
+
+    def __setitem__(self, i: int, vec: Sequence[float]) -> None:
+        """Replace row `i` (e.g. a placeholder whose embedding arrived later)."""
+        if not -self._n <= i < self._n:
+            raise IndexError(i)
+        self._write(i % self._n, vec)
+
+    def _write(self, i: int, vec: Sequence[float]) -> None:
+        row = _fit(vec, self.dim)
+        if self.precision == "int8":
+            peak = float(np.abs(row).max()) if self.dim else 0.0
+            scale = peak / 127.0 if peak > 0 else 0.0
+            self._rows[i] = np.round(row / scale) if scale else 0
+            self._scales[i] = scale
+        else:
+            self._rows[i] = row
+
+    def __delitem__(self, i: int) -> None:
+        if not -self._n <= i < self._n:
+            raise IndexError(i)
+        i %= self._n
+        self._rows[i : self._n - 1] = self._rows[i + 1 : self._n]
+        if self.precision == "int8":
+            self._scales[i : self._n - 1] = self._scales[i + 1 : self._n]
+        self._n -= 1
+
+    def vector(self, i: int) -> np.ndarray:
+        """Row `i` as float32 (dequantized)."""
+        row = self._rows[i].astype(np.float32)
+        if self.precision == "int8":
+            row *= self._scales[i]
+        return row
+
+    def vectors(self) -> List[np.ndarray]:
+        return [self.vector(i) for i in range(self._n)]
+
+    def scores(self, query: Sequence[float]) -> np.ndarray:
+        """Cosine similarity of `query` with every row (0 for zero vectors)."""
+        if not self._n:
+            return np.zeros(0, dtype=np.float32)
+        q = _fit(query, self.dim)
+        rows = self._rows[: self._n]
+        if self.precision == "float32":
+            return rows @ q
+        out = rows.astype(np.float32) @ q
+        if self.precision == "int8":
+            out *= self._scales[: self._n]
+        return out
+
+    def converted(self, precision: Optional[str] = None, dim: Optional[int] = None) -> "EmbeddingStore":
+        """
+        Copy in another precision and / or a smaller dimension (leading
+        dimensions kept, rows re-normalised). Growing the dimension needs
+        fresh embeddings; see VectorMemory.reindex(reembed=True).
+        """
+        dim = dim or self.dim
+        if self.dim and dim > self.dim:
+            raise ValueError(f"Cannot grow embeddings from {self.dim} to {dim} dimensions without re-embedding")
+        return EmbeddingStore.from_vectors(self.vectors(), precision or self.precision, dim)
+
+    def clear(self) -> None:
+        self._n = 0
+        self._rows = np.zeros((0, self.dim or 0), dtype=self._rows.dtype)
+        self._scales = np.zeros(0, dtype=np.float32)
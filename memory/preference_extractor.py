@@ -2,9 +2,9 @@
 
 import json
 import re
-from typing import Dict, Any
+from typing import Any, Dict, List, Optional
 
-from gen_client import generate
+from gen_client import PromptPrefix, generate, generation_failed, output_budget
 
 
 DEFAULT_PREFS = {
@@ -18,25 +18,14 @@ DEFAULT_PREFS = {
 }
 
 
-def extract_preferences(text: str) -> Dict[str, Any]:
-    """
-    Extracts structured user preferences from a free-text message
-    using the LLM, but with strong JSON validation + safe fallback.
-    """
-
-    if not text:
-        return DEFAULT_PREFS.copy()
-
-    prompt = f"""
+# Static instructions + schemas, served from the model's context cache
+PREFS_PREFIX = PromptPrefix("preferences", """
 You are a system that extracts structured user preferences.
 
-From this text:
-\"\"\"{text}\"\"\"
-
+Extract food + travel preferences from the text you are given and
+return STRICT JSON ONLY:
 
-Extract food + travel preferences and return STRICT JSON ONLY:
-
-{{
+{
   "cuisines": [string],
   "diet_type": "veg" | "non-veg" | "vegan" | "" | "lacto-veg" | "ovo-veg",
   "dislikes": [string],
@@ -44,10 +33,52 @@ Extract food + travel preferences and return STRICT JSON ONLY:
   "spice_level": "mild" | "medium" | "hot" | "",
   "travel_style": "relaxed" | "adventurous" | "family" | "" | "budget",
   "likes": [string]
-}}
+}
+""")
+
+PREFS_BATCH_PREFIX = PromptPrefix("preferences_batch", """
+You are a system that extracts structured user preferences.
+
+For EACH numbered message you are given, extract food + travel preferences.
+
+Return STRICT JSON ONLY: an array with one object per message, in any order:
+
+[
+  {
+    "index": int,
+    "cuisines": [string],
+    "diet_type": "veg" | "non-veg" | "vegan" | "" | "lacto-veg" | "ovo-veg",
+    "dislikes": [string],
+    "allergies": [string],
+    "spice_level": "mild" | "medium" | "hot" | "",
+    "travel_style": "relaxed" | "adventurous" | "family" | "" | "budget",
+    "likes": [string]
+  }
+]
+""")
+
+
+def extract_preferences(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Extracts structured user preferences from a free-text message
+    using the LLM, with strong JSON validation. None when generation
+    failed or the answer was not JSON, so callers retry later instead of
+    remembering "no preferences" for the message.
+    """
+
+    if not text:
+        return DEFAULT_PREFS.copy()
+
+    prompt = f"""
+From this text:
+\"\"\"{text}\"\"\"
 """
 
-    raw = generate(prompt).strip()
+    raw = generate(
+        prompt, max_output_tokens=output_budget("preferences"), prefix=PREFS_PREFIX
+    ).strip()
+    if generation_failed(raw):
+        return None
 
     # Try direct JSON
     try:
@@ -59,10 +90,16 @@ Extract food + travel preferences and return STRICT JSON ONLY:
             if match:
                 data = json.loads(match.group(0))
             else:
-                return DEFAULT_PREFS.copy()
+                return None
         except Exception:
-            return DEFAULT_PREFS.copy()
+            return None
+    if not isinstance(data, dict):
+        return None
+
+    return _normalize(data)
 
+
+def _normalize(data: Dict[str, Any]) -> Dict[str, Any]:
     out = DEFAULT_PREFS.copy()
     out["cuisines"] = list(data.get("cuisines", []))
     out["diet_type"] = str(data.get("diet_type", "")).strip()
@@ -73,3 +110,116 @@ Extract food + travel preferences and return STRICT JSON ONLY:
     out["likes"] = list(data.get("likes", []))
 
     return out
+
+
+# ==========================================================
+# BATCH EXTRACTION
+# ==========================================================
+LIST_FIELDS = ("cuisines", "dislikes", "allergies", "likes")
+STR_FIELDS = ("diet_type", "spice_level", "travel_style")
+
+
+def _validate_element(item: Any, n: int) -> Optional[int]:
+    """Index of a well-formed batch element, or None if it must be retried."""
+    if not isinstance(item, dict):
+        return None
+    idx = item.get("index")
+    if isinstance(idx, str) and idx.isdigit():
+        idx = int(idx)
+    if not isinstance(idx, int) or not 0 <= idx < n:
+        return None
+    for k in LIST_FIELDS:
+        if not isinstance(item.get(k, []), list):
+            return None
+    for k in STR_FIELDS:
+        if not isinstance(item.get(k, ""), (str, type(None))):
+            return None
+    return idx
+
+
+def _parse_batch(raw: str, n: int) -> Dict[int, Dict[str, Any]]:
+    start, end = raw.find("["), raw.rfind("]")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        data = json.loads(raw[start : end + 1])
+    except Exception:
+        return {}
+    if not isinstance(data, list):
+        return {}
+
+    parsed: Dict[int, Dict[str, Any]] = {}
+    for item in data:
+        idx = _validate_element(item, n)
+        if idx is not None and idx not in parsed:
+            parsed[idx] = _normalize({k: v for k, v in item.items() if v is not None})
+    return parsed
+
+
+def _batch_prompt(texts: List[str]) -> str:
+    """Dynamic part of a batch request (instructions are in PREFS_BATCH_PREFIX)."""
+    numbered = "\n".join(f"[{i}] {json.dumps(t, ensure_ascii=False)}" for i, t in enumerate(texts))
+    return f"""
+Messages:
+{numbered}
+"""
+
+
+def _chunks(indices: List[int], texts: List[str], batch_size: int, max_chars: int) -> List[List[int]]:
+    """Split indices into batches bounded by count and prompt characters."""
+    out: List[List[int]] = []
+    cur: List[int] = []
+    size = 0
+    for i in indices:
+        n = len(texts[i]) + 8
+        if cur and (len(cur) >= batch_size or size + n > max_chars):
+            out.append(cur)
+            cur, size = [], 0
+        cur.append(i)
+        size += n
+    if cur:
+        out.append(cur)
+    return out
+
+
+def extract_preferences_batch(
+    texts: List[str],
+    batch_size: int = 25,
+    max_retries: int = 2,
+    max_chars: int = 6000,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Batched variant of extract_preferences(): one LLM call per
+    `batch_size` texts (fewer if they exceed max_chars, so the prompt
+    stays under gen_client's hard trim). Each array element is validated on its own and
+    only the elements that failed are re-sent (up to max_retries times);
+    anything still missing is None (like a failed extract_preferences()).
+    Results are returned in the same order as `texts`.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+    pending = [i for i, t in enumerate(texts) if t]
+    for i, t in enumerate(texts):
+        if not t:
+            results[i] = DEFAULT_PREFS.copy()
+
+    for attempt in range(1 + max_retries):
+        if not pending:
+            break
+        failed: List[int] = []
+        for chunk in _chunks(pending, texts, batch_size, max_chars):
+            # A cached bad answer would just fail again → fresh call on retries
+            raw = generate(
+                _batch_prompt([texts[i] for i in chunk]),
+                use_cache=attempt == 0,
+                max_output_tokens=output_budget("preferences_batch", len(chunk)),
+                prefix=PREFS_BATCH_PREFIX,
+            ).strip()
+            parsed = _parse_batch(raw, len(chunk))
+            for local, global_idx in enumerate(chunk):
+                if local in parsed:
+                    results[global_idx] = parsed[local]
+                else:
+                    failed.append(global_idx)
+        pending = failed
+
+    return results
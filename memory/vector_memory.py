@@ -1,48 +1,597 @@
 # memory/vector_memory.py
 
-from typing import List
-from gen_client import embed
+import contextvars
+import itertools
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from gen_client import (
+    EMBED_DIM,
+    EmbeddingFailed,
+    deadline_scope,
+    embed,
+    embed_batch,
+    generate,
+    generation_failed,
+    output_budget,
+    priority_scope,
+)
+from memory.bm25_index import BM25Index, tokenize
+from memory.embedding_store import EmbeddingStore, default_precision
+from tracing import span
+
+
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+# Rank offset of reciprocal rank fusion (60 is the usual choice)
+RRF_K = 60
 
 
 class VectorMemory:
     """
     Simple in-memory vector store.
     Stores user texts and their embeddings.
+
+    - Near-duplicate inserts (cosine >= dedup_threshold, or the same text)
+      are merged into the existing entry and bump its hit counter.
+    - At most `capacity` entries are kept; the entry with the lowest
+      recency x usefulness score is evicted first.
+    - search() can weight similarity by age (half_life_days).
+    - Two tiers: the `keep_recent` newest entries stay raw; older ones are
+      compacted (in the background) into "summary" entries with their own
+      embeddings. search() and `texts` cover both tiers.
+    - Embeddings live in an EmbeddingStore (numpy rows, float32 / float16 /
+      int8 via MEMORY_EMBED_PRECISION); reindex() migrates an existing
+      store to another precision or dimension.
+    - Entries whose embedding is not there yet (MEMORY_EMBED_ASYNC=1, or
+      the embed call failed) are stored "pending" with a zero row and
+      handed to a shared background worker that embeds them in batches,
+      retrying failures with backoff. search() scores pending entries with
+      a lexical (word overlap) cosine until their vector arrives.
+    - A BM25 inverted index over the texts is updated on every insert /
+      delete. search(mode=...) ranks by "vector" similarity, "lexical"
+      BM25 (no embedding call at all) or "hybrid" (default,
+      MEMORY_SEARCH_MODE): reciprocal rank fusion of both rankings.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        capacity: Optional[int] = None,
+        dedup_threshold: Optional[float] = None,
+        half_life_days: Optional[float] = None,
+        keep_recent: Optional[int] = None,
+        compact_group: Optional[int] = None,
+        precision: Optional[str] = None,
+        async_embed: Optional[bool] = None,
+        search_mode: Optional[str] = None,
+    ):
+        self.capacity = capacity or int(os.getenv("MEMORY_CAPACITY", "200"))
+        self.dedup_threshold = (
+            dedup_threshold if dedup_threshold is not None
+            else float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.95"))
+        )
+        # Default time-decay for search(); None disables it
+        env_half_life = os.getenv("MEMORY_HALF_LIFE_DAYS")
+        self.half_life_days = half_life_days or (float(env_half_life) if env_half_life else None)
+        self.keep_recent = keep_recent or int(os.getenv("MEMORY_KEEP_RECENT", "20"))
+        self.compact_group = compact_group or int(os.getenv("MEMORY_COMPACT_GROUP", "10"))
+        # add() returns without waiting for the embedding (background worker)
+        self.async_embed = (
+            async_embed if async_embed is not None
+            else os.getenv("MEMORY_EMBED_ASYNC", "0") == "1"
+        )
+
+        self.search_mode = search_mode or os.getenv("MEMORY_SEARCH_MODE", "hybrid").lower()
+        if self.search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {self.search_mode!r} (expected one of {SEARCH_MODES})")
+
+        self._lock = threading.RLock()
+        self._compacting = False
+
         self.texts: List[str] = []
-        self.embeddings: List[List[float]] = []
+        self.embeddings = EmbeddingStore(precision or default_precision())
+        # Parallel to texts: created / last_seen timestamps, hits (merged
+        # duplicates), retrievals (times returned by search), tier
+        # ("raw" | "summary"), how many raw messages an entry stands for and,
+        # while its vector is missing, pending / embed_failures
+        self.meta: List[Dict[str, float]] = []
+        # BM25 over the same texts, keyed by each entry's meta["doc"]
+        self._index = BM25Index()
+        self._doc_ids = itertools.count()
 
     def add(self, text: str):
         if not text:
             return
-        vec = embed(text)
+        now = time.time()
+
+        # Exact repeat → no embedding call needed
+        norm = text.strip().lower()
+        with self._lock:
+            for i, t in enumerate(self.texts):
+                if t.strip().lower() == norm:
+                    self._merge(i, now)
+                    return
+
+        meta = {
+            "created": now, "last_seen": now, "hits": 1, "retrievals": 0,
+            "tier": "raw", "count": 1,
+        }
+        vec = None
+        if not self.async_embed:
+            try:
+                vec = embed(text, strict=True)
+            except EmbeddingFailed:
+                pass  # stored pending; the background worker retries
+
+        with self._lock:
+            # Near-duplicate by embedding similarity
+            if vec is not None:
+                scores = self.embeddings.scores(vec)
+                if len(scores):
+                    best_i = int(np.argmax(scores))
+                    if scores[best_i] >= self.dedup_threshold:
+                        self._merge(best_i, now)
+                        return
+
+            self._append(text, vec, meta)
+
+    def _append(self, text: str, vec: Optional[List[float]], meta: Dict) -> None:
+        """Add an entry; vec=None stores it pending and queues the embedding."""
+        if vec is None:
+            meta.update(pending=True, embed_failures=0)
+            vec = [0.0] * (self.embeddings.dim or EMBED_DIM)
+        meta["doc"] = next(self._doc_ids)
         self.texts.append(text)
         self.embeddings.append(vec)
+        self.meta.append(meta)
+        self._index.add(meta["doc"], text)
+        while len(self.texts) > self.capacity:
+            self._evict(meta["last_seen"])
+        if meta.get("pending") and self._position(meta) >= 0:
+            _EMBED_QUEUE.put(self, meta)
+
+    def _merge(self, i: int, now: float) -> None:
+        self.meta[i]["hits"] += 1
+        self.meta[i]["last_seen"] = now
+
+    def _embedded(self, meta: Dict, vec: List[float]) -> None:
+        """Background embedding of a pending entry arrived: store it or merge it."""
+        with self._lock:
+            i = self._position(meta)
+            if i < 0:
+                return  # evicted / compacted / cleared meanwhile
+            scores = self.embeddings.scores(vec)
+            scores[i] = -1.0
+            best_i = int(np.argmax(scores))
+            if scores[best_i] >= self.dedup_threshold:
+                kept = self.meta[best_i]
+                kept["hits"] += meta["hits"]
+                kept["retrievals"] += meta["retrievals"]
+                kept["last_seen"] = max(kept["last_seen"], meta["last_seen"])
+                self._delete(i)
+                return
+            self.embeddings[i] = vec
+            meta.pop("pending", None)
+            meta.pop("embed_failures", None)
+
+    def _embed_failed(self, meta: Dict) -> int:
+        with self._lock:
+            meta["embed_failures"] = meta.get("embed_failures", 0) + 1
+            return meta["embed_failures"]
 
-    def _cosine(self, a: List[float], b: List[float]) -> float:
-        if not a or not b:
-            return 0.0
-        dot = sum(x * y for x, y in zip(a, b))
-        na = sum(x * x for x in a) ** 0.5
-        nb = sum(x * x for x in b) ** 0.5
-        if na == 0 or nb == 0:
-            return 0.0
-        return dot / (na * nb + 1e-9)
-
-    def search(self, query: str, k: int = 5) -> List[str]:
-        if not self.texts:
+    def _pending_text(self, meta: Dict) -> Optional[str]:
+        with self._lock:
+            i = self._position(meta)
+            return self.texts[i] if i >= 0 else None
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(1 for m in self.meta if m.get("pending"))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Retry this memory's pending embeddings now and wait for them.
+        True once none is pending; False when an entry failed again (one
+        retry each, no waiting out the backoff) or `timeout` ran out first
+        (default MEMORY_EMBED_FLUSH_TIMEOUT_S).
+        """
+        return _EMBED_QUEUE.flush(self, timeout)
+
+    def _retention_score(self, i: int, now: float) -> float:
+        """Recency (1-week half-life) x usefulness (log of hits + retrievals)."""
+        m = self.meta[i]
+        age_days = (now - m["last_seen"]) / 86400.0
+        recency = 0.5 ** (age_days / 7.0)
+        usefulness = 1.0 + math.log1p(m["hits"] - 1 + m["retrievals"])
+        return recency * usefulness
+
+    def _evict(self, now: float) -> None:
+        victim = min(range(len(self.texts)), key=lambda i: self._retention_score(i, now))
+        self._delete(victim)
+
+    def _delete(self, i: int) -> None:
+        self._index.remove(self.meta[i]["doc"])
+        del self.texts[i]
+        del self.embeddings[i]
+        del self.meta[i]
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        half_life_days: Optional[float] = None,
+        mode: Optional[str] = None,
+    ) -> List[str]:
+        """
+        Top-k texts for `query`; `mode` overrides the instance search_mode:
+          - "vector": cosine similarity; pending entries (no vector yet) get
+            a lexical cosine instead, and so does everything when the query
+            itself cannot be embedded
+          - "lexical": BM25 only, no embedding call; entries sharing no
+            word with the query are not returned
+          - "hybrid": reciprocal rank fusion of the vector ranking (embedded
+            entries) and the BM25 ranking (entries sharing a word); BM25
+            alone when the query cannot be embedded
+        With a half-life (argument or instance default) each score is
+        multiplied by 0.5 ** (age / half_life).
+        """
+        mode = (mode or self.search_mode).lower()
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode!r} (expected one of {SEARCH_MODES})")
+        with self._lock:
+            if not self.texts:
+                return []
+            need_vector = mode != "lexical" and any(not m.get("pending") for m in self.meta)
+        qv = None
+        if need_vector:
+            try:
+                qv = embed(query, strict=True)
+            except EmbeddingFailed:
+                pass
+        half_life = half_life_days or self.half_life_days
+        now = time.time()
+
+        with self._lock:
+            if mode == "vector":
+                scores = self._vector_scores(query, qv)
+            else:
+                bm25 = self._index.scores(query)
+                lexical = np.array([bm25.get(m["doc"], 0.0) for m in self.meta], dtype=np.float32)
+                if qv is None:
+                    scores = lexical
+                else:
+                    embedded = np.array([not m.get("pending") for m in self.meta])
+                    scores = _rrf([(self.embeddings.scores(qv), embedded), (lexical, lexical > 0)])
+            if half_life:
+                age_days = (now - np.array([m["last_seen"] for m in self.meta])) / 86400.0
+                scores = scores * 0.5 ** (age_days / half_life)
+            # Stable sort on -score keeps insertion order among ties
+            top = np.argsort(-scores, kind="stable")[:k]
+            if mode != "vector":
+                top = [i for i in top if scores[i] > 0]
+            for i in top:
+                self.meta[i]["retrievals"] += 1
+            return [self.texts[i] for i in top]
+
+    def _vector_scores(self, query: str, qv: Optional[List[float]]) -> np.ndarray:
+        if qv is not None:
+            scores = self.embeddings.scores(qv)
+        else:
+            scores = np.zeros(len(self.texts), dtype=np.float32)
+        lexical = [i for i, m in enumerate(self.meta) if qv is None or m.get("pending")]
+        if lexical:
+            q_words = _words(query)
+            for i in lexical:
+                scores[i] = _lexical_score(q_words, self.texts[i])
+        return scores
+
+    # ---------------------------------------------------------
+    # TIERED COMPACTION
+    # ---------------------------------------------------------
+    def _compaction_candidates(self) -> List[Dict]:
+        """Oldest raw entries beyond the keep_recent window, one group's worth."""
+        raw = [m for m in self.meta if m["tier"] == "raw"]
+        if len(raw) < self.keep_recent + self.compact_group:
             return []
-        qv = embed(query)
-        scores = [
-            (self._cosine(qv, ev), txt)
-            for txt, ev in zip(self.texts, self.embeddings)
-        ]
-        scores.sort(key=lambda x: x[0], reverse=True)
-        return [t for _, t in scores[:k]]
+        raw.sort(key=lambda m: m["created"])
+        return raw[: self.compact_group]
+
+    def _position(self, meta: Dict) -> int:
+        """Index of an entry by identity of its meta dict (-1 if gone)."""
+        for i, m in enumerate(self.meta):
+            if m is meta:
+                return i
+        return -1
+
+    def compact(self) -> int:
+        """
+        Summarize old raw entries into summary entries until only the
+        keep_recent newest stay raw. Returns the number of summaries made.
+        The LLM / embed calls run without holding the lock.
+        """
+        made = 0
+        while True:
+            with self._lock:
+                group = self._compaction_candidates()
+                texts = [self.texts[self._position(m)] for m in group]
+            if not group:
+                return made
+
+            summary = _summarize(texts)
+            if not summary:
+                return made  # model unavailable; retry on a later request
+            try:
+                vec = embed(summary, strict=True)
+            except EmbeddingFailed:
+                vec = None  # stored pending, embedded in the background
+
+            with self._lock:
+                # Entries may have moved (merges / evictions) meanwhile
+                alive = [m for m in group if self._position(m) >= 0]
+                if not alive:
+                    continue
+                for m in alive:
+                    self._delete(self._position(m))
+                self._append(summary, vec, {
+                    "created": min(m["created"] for m in alive),
+                    "last_seen": max(m["last_seen"] for m in alive),
+                    "hits": sum(m["hits"] for m in alive),
+                    "retrievals": sum(m["retrievals"] for m in alive),
+                    "tier": "summary",
+                    "count": sum(m["count"] for m in alive),
+                })
+                made += 1
+
+    def maybe_compact(self, background: bool = True) -> None:
+        """Start compaction if enough old raw entries piled up."""
+        with self._lock:
+            if self._compacting or not self._compaction_candidates():
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                # Not bound by the triggering request, and yields to user-facing calls
+                with deadline_scope(None), priority_scope("background"):
+                    self.compact()
+            finally:
+                with self._lock:
+                    self._compacting = False
+
+        if background:
+            # Copy the context so summaries are attributed to the same user
+            ctx = contextvars.copy_context()
+            threading.Thread(target=ctx.run, args=(run,), name="memory-compact", daemon=True).start()
+        else:
+            run()
+
+    def tier_counts(self) -> Dict[str, int]:
+        with self._lock:
+            out = {"raw": 0, "summary": 0}
+            for m in self.meta:
+                out[m["tier"]] += 1
+            return out
+
+    # ---------------------------------------------------------
+    # RE-INDEX / MIGRATION
+    # ---------------------------------------------------------
+    def reindex(
+        self,
+        precision: Optional[str] = None,
+        dim: Optional[int] = None,
+        reembed: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Move the stored vectors to another precision and / or dimension.
+        By default existing vectors are converted in place (dequantized,
+        truncated to `dim`, re-quantized). reembed=True fetches fresh
+        embeddings for every text first (needed to grow the dimension or
+        after switching the embedding model); those calls run without the
+        lock and entries added meanwhile, or whose embedding fails, keep
+        their current vector.
+        """
+        precision = precision or self.embeddings.precision
+        if reembed:
+            with self._lock:
+                todo = list(zip(self.texts, self.meta))
+            fresh = {}
+            for text, m in todo:
+                try:
+                    fresh[id(m)] = embed(text, strict=True)
+                except EmbeddingFailed:
+                    pass
+            with self._lock:
+                vectors = [fresh.get(id(m), self.embeddings.vector(i)) for i, m in enumerate(self.meta)]
+                self.embeddings = EmbeddingStore.from_vectors(vectors, precision, dim)
+                for m in self.meta:
+                    if id(m) in fresh:
+                        m.pop("pending", None)
+                        m.pop("embed_failures", None)
+        else:
+            with self._lock:
+                self.embeddings = self.embeddings.converted(precision, dim)
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self.texts),
+                "pending": sum(1 for m in self.meta if m.get("pending")),
+                "indexed_terms": self._index.terms,
+                "precision": self.embeddings.precision,
+                "dim": self.embeddings.dim,
+                "embedding_bytes": self.embeddings.nbytes,
+                "text_bytes": sum(len(t.encode("utf-8")) for t in self.texts),
+            }
 
     def clear(self):
         """Clear all stored texts and embeddings."""
-        self.texts = []
-        self.embeddings = []
+        with self._lock:
+            self.texts = []
+            self.embeddings.clear()
+            self.meta = []
+            self._index.clear()
+
+
+# =========================================================
+# LEXICAL SCORES / RANK FUSION
+# =========================================================
+def _words(text: str) -> Set[str]:
+    return set(tokenize(text))
+
+
+def _lexical_score(q_words: Set[str], text: str) -> float:
+    """Cosine of binary bag-of-words vectors (shared words / sqrt(|q| * |t|))."""
+    t_words = _words(text)
+    if not q_words or not t_words:
+        return 0.0
+    return len(q_words & t_words) / math.sqrt(len(q_words) * len(t_words))
+
+
+def _rrf(rankings: List[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+    """
+    Reciprocal rank fusion: sum of 1 / (RRF_K + rank) over the rankings an
+    entry takes part in. Each ranking is (scores, mask of ranked entries).
+    """
+    fused = np.zeros(len(rankings[0][0]), dtype=np.float32)
+    for scores, mask in rankings:
+        ranked = np.flatnonzero(mask)
+        order = ranked[np.argsort(-scores[ranked], kind="stable")]
+        fused[order] += 1.0 / (RRF_K + np.arange(1, len(order) + 1))
+    return fused
+
+
+# =========================================================
+# BACKGROUND EMBEDDING QUEUE
+# =========================================================
+class _Job:
+    __slots__ = ("memory", "meta", "next_try")
+
+    def __init__(self, memory: "VectorMemory", meta: Dict):
+        self.memory = memory
+        self.meta = meta
+        self.next_try = time.time()
+
+
+class _EmbedQueue:
+    """
+    One daemon thread shared by every VectorMemory: embeds pending entries
+    in batches of up to MEMORY_EMBED_BATCH texts (one embed_batch call,
+    across users), outside any request deadline. A failed batch is retried
+    after min(2 ** failures, MEMORY_EMBED_MAX_BACKOFF_S) seconds; entries
+    evicted or cleared meanwhile are dropped. flush() gives up after one
+    retry, so it never hangs while the embedding API is down.
+    """
+
+    def __init__(self):
+        self.batch_size = max(1, int(os.getenv("MEMORY_EMBED_BATCH", "16")))
+        self.max_backoff_s = float(os.getenv("MEMORY_EMBED_MAX_BACKOFF_S", "60"))
+        self.flush_timeout_s = float(os.getenv("MEMORY_EMBED_FLUSH_TIMEOUT_S", "30"))
+        self._cond = threading.Condition()
+        self._items: List[_Job] = []
+        self._in_flight: List[_Job] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, memory: "VectorMemory", meta: Dict) -> None:
+        with self._cond:
+            self._items.append(_Job(memory, meta))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="memory-embed", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, memory: "VectorMemory", timeout: Optional[float]) -> bool:
+        end = time.time() + (self.flush_timeout_s if timeout is None else timeout)
+        with self._cond:
+            now = time.time()
+            for item in self._items:
+                if item.memory is memory:
+                    item.next_try = now
+            self._cond.notify_all()
+            while True:
+                if not self._busy(memory):
+                    now = time.time()
+                    # Entries still queued but not due have failed again since
+                    # the flush began: waiting out their backoff could take
+                    # forever while the embedding API is down
+                    if not any(item.memory is memory and item.next_try <= now for item in self._items):
+                        break
+                remaining = end - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return memory.pending_count() == 0
+
+    def _busy(self, memory: "VectorMemory") -> bool:
+        return any(item.memory is memory for item in self._in_flight)
+
+    def _take(self) -> List[_Job]:
+        """Block until entries are due; remove and return up to batch_size of them."""
+        with self._cond:
+            while True:
+                now = time.time()
+                due = [item for item in self._items if item.next_try <= now][: self.batch_size]
+                if due:
+                    for item in due:
+                        self._items.remove(item)
+                        self._in_flight.append(item)
+                    return due
+                wake = min((item.next_try for item in self._items), default=None)
+                self._cond.wait(None if wake is None else wake - now)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take()
+            try:
+                self._embed(batch)
+            finally:
+                with self._cond:
+                    for item in batch:
+                        self._in_flight.remove(item)
+                    self._cond.notify_all()
+
+    def _embed(self, batch: List[_Job]) -> None:
+        live: List[Tuple[_Job, str]] = []
+        for item in batch:
+            text = item.memory._pending_text(item.meta)
+            if text is not None:
+                live.append((item, text))
+        if not live:
+            return
+        try:
+            with deadline_scope(None), priority_scope("background"), span("memory_embed", texts=len(live)):
+                vectors = embed_batch([text for _, text in live])
+        except Exception:
+            # Memory locks are never taken while holding the queue's
+            for item, _ in live:
+                failures = item.memory._embed_failed(item.meta)
+                item.next_try = time.time() + min(2.0 ** failures, self.max_backoff_s)
+            with self._cond:
+                self._items.extend(item for item, _ in live)
+            return
+        for (item, _), vec in zip(live, vectors):
+            item.memory._embedded(item.meta, vec)
+
+
+_EMBED_QUEUE = _EmbedQueue()
+
+
+def _summarize(texts: List[str]) -> str:
+    joined = "\n".join(f"- {t}" for t in texts)
+    prompt = f"""
+You compress a user's past messages to a personal planner into one short note.
+
+Messages (oldest first):
+{joined}
+
+Write ONE plain-text note (max 80 words) that keeps every stated preference:
+diet type, allergies, dislikes, likes, cuisines, spice level, travel style,
+plus any recurring plans or places. Drop small talk. No lists, no JSON.
+"""
+    with span("agent", agent="MemoryCompactor", texts=len(texts)):
+        out = generate(prompt, max_output_tokens=output_budget("summary")).strip()
+    return "" if generation_failed(out) else out
@@ -0,0 +1,142 @@
+# memory_benchmark.py
+"""
+Memory-per-user and recall@5 of quantized / reduced-dimension embedding
+storage (memory/embedding_store.py) against full precision.
+
+Fills one VectorMemory-sized corpus of preference-style texts, embeds it
+once at the native dimension, then for every precision x dimension pair
+converts the store (the same path as VectorMemory.reindex) and reports:
+  - embedding bytes per user and per entry
+  - recall@5: share of each query's top 5 that is also in the float32 /
+    native top 5 (entries tied with the 5th full-precision score count)
+
+The "list" row is the old layout (Python lists of floats) for reference.
+Runs on the fake backend unless GEN_BACKEND is set. Its hashed bag-of-words
+vectors spread tokens evenly over all dimensions, so the reduced-dimension
+rows there are a worst case; text-embedding-004 front-loads information
+(GEN_BACKEND=gemini gives the real numbers).
+
+Usage:
+    python memory_benchmark.py --entries 200 --queries 100 --dims 768,256,128
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from typing import Dict, List
+
+# The fake backend needs no API key; set before gen_client is imported.
+os.environ.setdefault("GEN_BACKEND", "fake")
+
+import numpy as np
+
+from gen_client import embed
+from memory.embedding_store import PRECISIONS, EmbeddingStore
+
+WORDS = {
+    "diet": ["vegetarian", "vegan", "eggetarian", "jain", "keto", "gluten free"],
+    "cuisine": ["south indian", "italian", "thai", "mexican", "punjabi", "japanese", "greek"],
+    "food": ["paneer", "tofu", "lentils", "mushrooms", "okra", "quinoa", "chickpeas", "eggplant"],
+    "place": ["austin", "dallas", "rome", "kyoto", "lisbon", "goa", "denver", "chicago"],
+    "style": ["with kids", "on a budget", "relaxed", "packed", "outdoorsy", "museum heavy"],
+}
+TEMPLATES = [
+    "I am {diet} and love {cuisine} food",
+    "Please avoid {food}, I really dislike it",
+    "I am allergic to {food}",
+    "Plan a trip to {place} {style}",
+    "We enjoyed {cuisine} restaurants in {place}",
+    "Make {food} dishes more often, {cuisine} style",
+    "Keep dinners {diet} and light, we travel {style}",
+]
+
+
+def make_corpus(n: int, rng: random.Random) -> List[str]:
+    out = []
+    for i in range(n):
+        template = rng.choice(TEMPLATES)
+        text = template.format(**{k: rng.choice(v) for k, v in WORDS.items()})
+        out.append(f"{text} (note {i})")
+    return out
+
+
+def make_queries(corpus: List[str], n: int, rng: random.Random) -> List[str]:
+    """Partial paraphrases of stored texts plus a few unrelated words."""
+    out = []
+    for _ in range(n):
+        words = rng.choice(corpus).split()
+        keep = rng.sample(words, max(2, len(words) // 2))
+        noise = [rng.choice(v) for v in rng.sample(list(WORDS.values()), 2)]
+        out.append(" ".join(keep + noise))
+    return out
+
+
+def top_k(store: EmbeddingStore, query_vecs: List[List[float]], k: int) -> List[set]:
+    return [set(np.argsort(-store.scores(q), kind="stable")[:k].tolist()) for q in query_vecs]
+
+
+def relevant(store: EmbeddingStore, query_vecs: List[List[float]], k: int) -> List[set]:
+    """Full-precision top k, widened to every entry tied with the k-th score."""
+    out = []
+    for q in query_vecs:
+        scores = store.scores(q)
+        kth = np.sort(scores)[::-1][min(k, len(scores)) - 1]
+        out.append(set(np.flatnonzero(scores >= kth - 1e-6).tolist()))
+    return out
+
+
+def list_bytes(vectors: List[List[float]]) -> int:
+    """Size of the old list-of-lists layout (list headers + boxed floats)."""
+    return sum(sys.getsizeof(v) + sum(sys.getsizeof(x) for x in v) for v in vectors)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Quantized embedding storage: memory vs recall@5.")
+    parser.add_argument("--entries", type=int, default=int(os.getenv("MEMORY_CAPACITY", "200")),
+                        help="memory entries per user")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dims", default="768,512,256,128", help="comma-separated dimensions")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = make_corpus(args.entries, rng)
+    queries = make_queries(corpus, args.queries, rng)
+    vectors = [list(embed(t)) for t in corpus]
+    query_vecs = [list(embed(q)) for q in queries]
+
+    full = EmbeddingStore.from_vectors(vectors, "float32")
+    truth = relevant(full, query_vecs, args.k)
+    dims = [d for d in (int(x) for x in args.dims.split(",")) if d <= full.dim]
+
+    report: List[Dict] = [{
+        "layout": "list", "dim": full.dim, "bytes_per_user": list_bytes(vectors),
+        "bytes_per_entry": list_bytes(vectors) // max(1, len(vectors)), "recall_at_k": 1.0,
+    }]
+    for dim in dims:
+        for precision in PRECISIONS:
+            store = full.converted(precision, dim)
+            found = top_k(store, query_vecs, args.k)
+            recall = sum(len(a & b) for a, b in zip(found, truth)) / max(1, sum(len(a) for a in found))
+            report.append({
+                "layout": precision, "dim": dim, "bytes_per_user": store.nbytes,
+                "bytes_per_entry": store.nbytes // max(1, len(store)), "recall_at_k": round(recall, 4),
+            })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.entries} entries/user, {args.queries} queries, recall@{args.k} vs float32/{full.dim}")
+        print(f"{'layout':<10}{'dim':>6}{'bytes/user':>14}{'bytes/entry':>13}{'recall':>9}")
+        for row in report:
+            print(f"{row['layout']:<10}{row['dim']:>6}{row['bytes_per_user']:>14,}"
+                  f"{row['bytes_per_entry']:>13,}{row['recall_at_k']:>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,56 @@
 # orchestrator.py
 
+import os
+import re
 import time
 import json
-from typing import Any, Dict, List, Tuple, Union
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 from agents.meal_agent import MealPlannerAgent
 from agents.shopping_agent import ShoppingAgent
 from agents.travel_agent import TravelAgent
+from agents.fused_agent import FusedPlannerAgent
+from gen_client import (
+    DeadlineExceeded,
+    deadline_in,
+    deadline_scope,
+    embed_circuit_open,
+    get_backend,
+    model_stats,
+)
+from memory.bm25_index import tokenize
 from memory.vector_memory import VectorMemory
-from memory.preference_extractor import extract_preferences
-from utils.validators import validate_meal_plan
+from memory.preference_extractor import extract_preferences, extract_preferences_batch
+from utils.plans import Itinerary, MealPlan
+from utils.validators import validate_meal_plan, violates_diet
+from tracing import current_span, span
+
+
+# Runs the travel agent alongside the meal → shopping chain (shared by all users)
+_AGENT_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AGENT_POOL_WORKERS", "8")),
+    thread_name_prefix="agent",
+)
+
+# Typical answer sizes in bytes, used by the fused-vs-parallel cost model
+SECTION_BYTES = {
+    "meal_per_day": 450,
+    "fallback_meal": 400,
+    "shopping": 1500,
+    "travel_per_day": 400,
+    "travel_skeleton_per_day": 80,
+}
+
+# A follow-up with one of these verbs and a day / meal slot edits the last
+# plan. Words like "without" / "different" / "change" also show up in plain
+# questions ("what can I make without onions?"), so they do not count.
+EDIT_VERBS = re.compile(r"\b(swap|swapping|replace|replacing|substitute|substituting)\b")
+# Questions are answered, not applied to the plan; polite requests
+# ("can you swap ...?") still are edits
+QUESTION_START = re.compile(r"^(what|which|how|why|where|when|who|is|are|do|does|should)\b")
+REQUEST_START = re.compile(r"^(please\b|(can|could|would|will) you\b)")
 
 
 class Orchestrator:
@@ -18,13 +59,28 @@ class Orchestrator:
     • Stores user queries in memory
     • Extracts preferences
     • Deterministically routes to meal / shopping / travel agents
+    • Runs them fused (one call), in parallel, or sequentially;
+      mode "auto" picks fused vs parallel with a latency cost model
     """
 
-    def __init__(self) -> None:
+    MODES = ("auto", "fused", "parallel", "sequential")
+
+    def __init__(self, user_id: str = "default", mode: Optional[str] = None) -> None:
+        self.user_id = user_id
+        self.mode = mode or os.getenv("ORCHESTRATOR_MODE", "auto")
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown orchestrator mode: {self.mode!r}")
         self.meal_agent = MealPlannerAgent()
         self.shopping_agent = ShoppingAgent()
         self.travel_agent = TravelAgent()
+        self.fused_agent = FusedPlannerAgent(
+            self.meal_agent, self.shopping_agent, self.travel_agent
+        )
         self.memory = VectorMemory()
+        # memory text -> extracted preferences (so each text is extracted once)
+        self._prefs_cache: Dict[str, Dict[str, Any]] = {}
+        # Last meal plan (parsed MealPlan + its shopping list) for edits
+        self._last_plan: Optional[Dict[str, Any]] = None
 
     # ---------------------------------------------------------
     # INTENT DETECTION (PURE RULE-BASED)
@@ -87,8 +143,31 @@ class Orchestrator:
             "likes": set(),
         }
 
-        for txt in getattr(self.memory, "texts", []):
-            p = extract_preferences(txt)
+        texts = list(getattr(self.memory, "texts", []))
+        missing = [t for t in texts if t not in self._prefs_cache]
+        try:
+            if len(missing) == 1:
+                extracted = [extract_preferences(missing[0])]
+            elif missing:
+                # Rebuild from scratch (restored session, cache loss): few batched calls
+                extracted = extract_preferences_batch(missing)
+            else:
+                extracted = []
+            for t, p in zip(missing, extracted):
+                # None = generation failed / unparsable: not cached, retried next request
+                if p is not None:
+                    self._prefs_cache[t] = p
+        except DeadlineExceeded:
+            pass  # use what is cached; the rest is extracted on a later request
+        # Forget texts that were evicted or compacted away
+        live = set(texts)
+        for t in [t for t in self._prefs_cache if t not in live]:
+            del self._prefs_cache[t]
+
+        for txt in texts:
+            p = self._prefs_cache.get(txt)
+            if p is None:
+                continue
 
             prefs["cuisines"].update(p.get("cuisines", []))
             prefs["dislikes"].update(p.get("dislikes", []))
@@ -113,12 +192,43 @@ class Orchestrator:
 
         return prefs
 
+    def memory_search_mode(self, query: str) -> Optional[str]:
+        """
+        "lexical" (BM25, no embedding call) for short queries, where a
+        query embedding adds little, and while the embedding circuit is
+        open; None keeps the memory's own mode otherwise.
+        """
+        max_words = int(os.getenv("MEMORY_LEXICAL_MAX_WORDS", "3"))
+        if embed_circuit_open() or len(tokenize(query)) <= max_words:
+            return "lexical"
+        return None
+
+    def fit_context(self, snippets: List[str], max_chars: Optional[int] = None) -> List[str]:
+        """
+        Keep the best-ranked memory snippets within a character budget
+        (MEMORY_CONTEXT_CHARS) so agent prompts stop growing with history.
+        """
+        if max_chars is None:
+            max_chars = int(os.getenv("MEMORY_CONTEXT_CHARS", "2000"))
+        out: List[str] = []
+        used = 0
+        for snippet in snippets:
+            if used + len(snippet) > max_chars:
+                if not out:
+                    out.append(snippet[:max_chars])
+                break
+            out.append(snippet)
+            used += len(snippet) + 1
+        return out
+
     # ---------------------------------------------------------
     # RESET HELPERS
     # ---------------------------------------------------------
     def reset_all(self):
         """Used by UI to clear all memory + embeddings."""
         self.memory.clear()
+        self._prefs_cache.clear()
+        self._last_plan = None
 
     def reset_preferences_only(self):
         """
@@ -126,6 +236,8 @@ class Orchestrator:
         you can refine this. For now, same as clear().
         """
         self.memory.clear()
+        self._prefs_cache.clear()
+        self._last_plan = None
 
     # ---------------------------------------------------------
     # MAIN HANDLE
@@ -133,32 +245,80 @@ class Orchestrator:
     def handle(
         self,
         user_query: str,
-        return_logs: bool = False
+        return_logs: bool = False,
+        on_result: Optional[Callable[[str, Any], None]] = None,
+        timeout_s: Optional[float] = None,
     ) -> Union[
         Tuple[Dict[str, Any], List[Dict[str, Any]]],
         Dict[str, Any]
     ]:
+        """
+        on_result(section, value) is called as soon as each of
+        "meal" / "shopping" / "travel" is ready (used for streaming).
+
+        timeout_s (default REQUEST_TIMEOUT_S, 0 = none) bounds the whole
+        request: every model call gets only the remaining budget, and
+        sections that run out of time are listed in results["timed_out"]
+        while the finished ones are still returned.
+        """
+        if timeout_s is None:
+            timeout_s = float(os.getenv("REQUEST_TIMEOUT_S", "0"))
+        deadline = deadline_in(timeout_s)
+        # Recording a cassette (GEN_RECORD): keep the query so replay.py can re-run it
+        record_request = getattr(get_backend(), "record_request", None)
+        if record_request is not None:
+            record_request(self.user_id, user_query, timeout_s or None)
+        with deadline_scope(deadline), span(
+            "request", agent="Orchestrator", user=self.user_id,
+            query_bytes=len((user_query or "").encode("utf-8")), timeout_s=timeout_s or None,
+        ):
+            results, logs = self._handle(user_query, on_result or (lambda section, value: None))
+            if results["timed_out"]:
+                current_span().set(timed_out=",".join(results["timed_out"]))
+        return (results, logs) if return_logs else results
+
+    def _handle(
+        self,
+        user_query: str,
+        on_result: Callable[[str, Any], None],
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
         logs: List[Dict[str, Any]] = []
-        results: Dict[str, Any] = {"meal": "", "shopping": [], "travel": ""}
+        results: Dict[str, Any] = {"meal": "", "shopping": [], "travel": "", "timed_out": []}
 
         if not user_query:
-            return (results, logs) if return_logs else results
+            return results, logs
 
         # Store the query in memory
-        self.memory.add(user_query)
-
-        prefs = self.build_preferences()
-
-        try:
-            memory_context = self.memory.search(user_query, k=5)
-        except Exception:
-            memory_context = []
+        with span("memory_add"):
+            try:
+                self.memory.add(user_query)
+            except DeadlineExceeded:
+                pass  # not remembered; the request itself can still be answered
+        # Fold old raw history into summaries off the request path
+        self.memory.maybe_compact()
+
+        # Runs inline (the agents need prefs), so at the caller's priority
+        with span("preferences", agent="PreferenceExtractor"):
+            prefs = self.build_preferences()
+
+        search_mode = self.memory_search_mode(user_query)
+        with span("memory_search", mode=search_mode or self.memory.search_mode):
+            try:
+                memory_context = self.memory.search(user_query, k=5, mode=search_mode)
+            except Exception:
+                memory_context = []
+        memory_context = self.fit_context(memory_context)
 
         intents = self.detect_intent(user_query)
         want_meal = intents["meal"]
         want_shopping = intents["shopping"]
         want_travel = intents["travel"]
 
+        # ---------- EDIT OF THE LAST PLAN (only changed slots) ----------
+        targets = self.detect_edit(user_query, intents)
+        if targets and self._handle_edit(user_query, targets, prefs, results, logs, on_result):
+            return results, logs
+
         if not (want_meal or want_shopping or want_travel):
             logs.append({
                 "agent": "Orchestrator",
@@ -166,74 +326,384 @@ class Orchestrator:
                 "output": "No actionable intent detected.",
                 "duration": "0.00s",
             })
-            return (results, logs) if return_logs else results
-
-        meal_text = ""
-
-        # ---------- MEAL ----------
-        if want_meal:
+            return results, logs
+
+        mode = self.choose_mode(user_query, want_meal, want_shopping, want_travel)
+        current_span().set(mode=mode)
+        meal_plan: Optional[MealPlan] = None
+
+        # ---------- FUSED (one call for all sections) ----------
+        if mode == "fused":
+            sections = [
+                sec for sec, wanted in
+                (("meal", want_meal), ("shopping", want_shopping), ("travel", want_travel))
+                if wanted
+            ]
             t0 = time.time()
-            meal_text = self.meal_agent.run(user_query, memory_context, prefs)
-            meal_text = validate_meal_plan(meal_text, prefs)
+            with span("agent", agent="FusedPlannerAgent", sections=",".join(sections)):
+                try:
+                    parts = self.fused_agent.run(user_query, memory_context, prefs, sections)
+                except DeadlineExceeded:
+                    parts = {}  # the per-section fallbacks below report the timeout
+                if "meal" in parts:
+                    meal_plan = MealPlan.parse(parts["meal"])
+                    try:
+                        with span("validation"):
+                            validated = validate_meal_plan(meal_plan, prefs)
+                    except DeadlineExceeded:
+                        validated = meal_plan  # keep the unvalidated plan
+                    if validated is not meal_plan:
+                        # Plan was regenerated → its grocery list must be rebuilt
+                        parts.pop("shopping", None)
+                    parts["meal"] = meal_plan = validated
+                if "travel" in parts:
+                    parts["travel"] = Itinerary.parse(parts["travel"])
             t1 = time.time()
 
-            results["meal"] = meal_text
             logs.append({
-                "agent": "MealPlannerAgent",
+                "agent": "FusedPlannerAgent",
                 "prompt": user_query,
-                "output": meal_text[:900],
+                "output": "\n".join(
+                    f"[{sec}] " + (f"{len(value)} items" if sec == "shopping" else f"\n{value.preview()}")
+                    for sec, value in parts.items()
+                ),
                 "duration": f"{t1 - t0:.2f}s",
             })
+            for sec, value in parts.items():
+                if sec == "meal":
+                    self._publish_meal(value, results, on_result)
+                elif sec == "travel":
+                    self._publish_travel(value, results, on_result)
+                else:
+                    results[sec] = value[:30]
+                    on_result(sec, results[sec])
+
+            # Anything the fused answer lacked falls back to its dedicated agent
+            want_meal = want_meal and "meal" not in parts
+            want_shopping = want_shopping and "shopping" not in parts
+            want_travel = want_travel and "travel" not in parts
+
+        # ---------- TRAVEL (in parallel with meal → shopping) ----------
+        travel_future = None
+        if want_travel and mode != "sequential" and (want_meal or want_shopping):
+            ctx = contextvars.copy_context()
+            travel_future = _AGENT_POOL.submit(
+                ctx.run, self._run_travel, user_query, memory_context, prefs, results, logs, on_result
+            )
+
+        # ---------- MEAL ----------
+        if want_meal:
+            t0 = time.time()
+            try:
+                with span("agent", agent="MealPlannerAgent"):
+                    # Parsed once here; validation, shopping, edits and
+                    # export all work on this MealPlan
+                    meal_plan = MealPlan.parse(self.meal_agent.run(user_query, memory_context, prefs))
+                    try:
+                        with span("validation"):
+                            meal_plan = validate_meal_plan(meal_plan, prefs)
+                    except DeadlineExceeded:
+                        pass  # keep the unvalidated plan rather than nothing
+            except DeadlineExceeded:
+                self._timed_out("MealPlannerAgent", "meal", user_query, t0, results, logs)
+            else:
+                t1 = time.time()
+
+                self._publish_meal(meal_plan, results, on_result)
+                logs.append({
+                    "agent": "MealPlannerAgent",
+                    "prompt": user_query,
+                    "output": meal_plan.preview(),
+                    "duration": f"{t1 - t0:.2f}s",
+                })
 
         # ---------- SHOPPING ----------
         if want_shopping:
             t0 = time.time()
+            try:
+                self._run_shopping(user_query, memory_context, prefs, meal_plan, results, logs, on_result)
+            except DeadlineExceeded:
+                self._timed_out("ShoppingAgent", "shopping", user_query, t0, results, logs)
 
-            if not meal_text:
-                fallback_prompt = (
-                    "Create a very short vegetarian meal description (2–3 meals) "
-                    "from this request and preferences, used only internally to "
-                    "generate a grocery list.\n\n"
-                    f"Request: {user_query}\n\n"
-                    f"Preferences: {json.dumps(prefs, indent=2)}"
-                )
-                meal_text = self.meal_agent.run(
-                    fallback_prompt, memory_context, prefs
-                )
-                meal_text = validate_meal_plan(meal_text, prefs)
+        # ---------- TRAVEL ----------
+        if travel_future is not None:
+            travel_future.result()
+        elif want_travel:
+            self._run_travel(user_query, memory_context, prefs, results, logs, on_result)
 
-                logs.append({
-                    "agent": "MealPlannerAgent (fallback-for-shopping)",
-                    "prompt": fallback_prompt,
-                    "output": meal_text[:900],
-                    "duration": "N/A",
-                })
+        if results["meal"]:
+            shopping = results["shopping"] if want_shopping and isinstance(results["shopping"], list) else None
+            self._last_plan = {"plan": meal_plan, "shopping": shopping}
 
-            items = self.shopping_agent.run(meal_text, prefs)
-            if isinstance(items, list):
-                items = items[:30]
-            results["shopping"] = items
+        return results, logs
 
-            t1 = time.time()
+    def _publish_meal(
+        self,
+        plan: MealPlan,
+        results: Dict[str, Any],
+        on_result: Callable[[str, Any], None],
+    ) -> None:
+        """Text for display / streaming plus the slotted form for export."""
+        results["meal"] = plan.text
+        results["meal_plan"] = plan.to_dict()
+        on_result("meal", results["meal"])
+
+    def _publish_travel(
+        self,
+        itinerary: Itinerary,
+        results: Dict[str, Any],
+        on_result: Callable[[str, Any], None],
+    ) -> None:
+        results["travel"] = itinerary.text
+        results["itinerary"] = itinerary.to_dict()
+        on_result("travel", results["travel"])
+
+    # ---------------------------------------------------------
+    # INCREMENTAL EDITS
+    # ---------------------------------------------------------
+
+    def restore_last_plan(self, results: Dict[str, Any]) -> bool:
+        """
+        Make an earlier handle() result the plan that follow-up edits
+        apply to (e.g. batch.py resuming from a checkpoint). False if
+        `results` holds no structured meal plan.
+        """
+        plan = MealPlan.from_dict(results.get("meal_plan") or {})
+        if not plan.structured:
+            return False
+        shopping = results.get("shopping")
+        self._last_plan = {"plan": plan, "shopping": shopping if isinstance(shopping, list) and shopping else None}
+        return True
+
+    def detect_edit(self, text: str, intents: Dict[str, bool]) -> List[Tuple[int, str]]:
+        """
+        (day, slot) pairs of the last plan that `text` asks to change;
+        [] for anything that is not an edit (new plan, trip, no plan yet).
+        """
+        if not self._last_plan or not self._last_plan["plan"].structured or intents["travel"]:
+            return []
+        q = (text or "").lower().strip()
+        if not EDIT_VERBS.search(q):
+            return []
+        if not REQUEST_START.match(q) and (q.endswith("?") or QUESTION_START.match(q)):
+            return []
+        if re.search(r"\d+\s*[- ]?\s*days?\b", q) or "new plan" in q or "new meal plan" in q:
+            return []  # asks for a fresh plan
+        return self._last_plan["plan"].find_targets(q)
+
+    def _handle_edit(
+        self,
+        user_query: str,
+        targets: List[Tuple[int, str]],
+        prefs: Dict[str, Any],
+        results: Dict[str, Any],
+        logs: List[Dict[str, Any]],
+        on_result: Callable[[str, Any], None],
+    ) -> bool:
+        """
+        Rewrite only the targeted slots and patch the shopping list with an
+        add / remove diff. False (nothing changed) → caller plans from scratch.
+        """
+        last = self._last_plan
+        t0 = time.time()
+        try:
+            with span("agent", agent="MealPlannerAgent (edit)", slots=len(targets)):
+                new = self.meal_agent.edit(user_query, last["plan"], targets, prefs)
+                bad = [k for k, dish in new.items() if violates_diet(dish, prefs)]
+                if bad:
+                    retry = self.meal_agent.edit(user_query, last["plan"], bad, prefs, use_cache=False)
+                    for k in bad:
+                        if k in retry and not violates_diet(retry[k], prefs):
+                            new[k] = retry[k]
+                        else:
+                            del new[k]
+        except DeadlineExceeded:
+            self._timed_out("MealPlannerAgent (edit)", "meal", user_query, t0, results, logs)
+            return True
+        if not new:
+            return False
+
+        removed = [last["plan"].days[day][slot] for day, slot in new]
+        added = list(new.values())
+        plan = last["plan"].with_changes(new)
+        t1 = time.time()
+
+        self._publish_meal(plan, results, on_result)
+        logs.append({
+            "agent": "MealPlannerAgent (edit)",
+            "prompt": user_query,
+            "output": "\n".join(f"Day {d} {s}: {dish}" for (d, s), dish in new.items()),
+            "duration": f"{t1 - t0:.2f}s",
+        })
+        edit = {
+            "slots": [f"Day {d} {s}" for d, s in new],
+            "shopping_added": [],
+            "shopping_removed": [],
+        }
+
+        items = last["shopping"]
+        if isinstance(items, list):
+            t0 = time.time()
+            try:
+                with span("agent", agent="ShoppingAgent (diff)"):
+                    add, remove = self.shopping_agent.diff(removed, added, items, prefs)
+            except DeadlineExceeded:
+                self._timed_out("ShoppingAgent (diff)", "shopping", user_query, t0, results, logs)
+                add, remove = [], []
+            items = self.shopping_agent.apply_diff(items, add, remove)
+            edit["shopping_added"] = [row["item"] for row in add]
+            edit["shopping_removed"] = remove
+            results["shopping"] = items
+            on_result("shopping", items)
             logs.append({
-                "agent": "ShoppingAgent",
-                "prompt": meal_text[:900],
-                "output": str(items)[:900],
-                "duration": f"{t1 - t0:.2f}s",
+                "agent": "ShoppingAgent (diff)",
+                "prompt": "; ".join(added)[:900],
+                "output": json.dumps({"add": edit["shopping_added"], "remove": remove}, ensure_ascii=False)[:900],
+                "duration": f"{time.time() - t0:.2f}s",
             })
 
-        # ---------- TRAVEL ----------
-        if want_travel:
-            t0 = time.time()
-            travel_text = self.travel_agent.run(user_query, memory_context, prefs)
-            t1 = time.time()
-            results["travel"] = travel_text
+        results["edit"] = edit
+        self._last_plan = {"plan": plan, "shopping": items}
+        return True
+
+    def _run_shopping(
+        self,
+        user_query: str,
+        memory_context: List[str],
+        prefs: Dict[str, Any],
+        meal_plan: Optional[MealPlan],
+        results: Dict[str, Any],
+        logs: List[Dict[str, Any]],
+        on_result: Callable[[str, Any], None],
+    ) -> None:
+        t0 = time.time()
+
+        if not meal_plan:
+            fallback_prompt = (
+                "Create a very short vegetarian meal description (2–3 meals) "
+                "from this request and preferences, used only internally to "
+                "generate a grocery list.\n\n"
+                f"Request: {user_query}\n\n"
+                f"Preferences: {json.dumps(prefs, indent=2)}"
+            )
+            with span("agent", agent="MealPlannerAgent (fallback-for-shopping)"):
+                meal_plan = MealPlan.parse(self.meal_agent.run(
+                    fallback_prompt, memory_context, prefs
+                ))
+                with span("validation"):
+                    meal_plan = validate_meal_plan(meal_plan, prefs)
 
             logs.append({
-                "agent": "TravelAgent",
-                "prompt": user_query,
-                "output": travel_text[:900],
-                "duration": f"{t1 - t0:.2f}s",
+                "agent": "MealPlannerAgent (fallback-for-shopping)",
+                "prompt": fallback_prompt,
+                "output": meal_plan.preview(),
+                "duration": "N/A",
             })
 
-        return (results, logs) if return_logs else results
+        with span("agent", agent="ShoppingAgent"):
+            items = self.shopping_agent.run(meal_plan, prefs)
+        if isinstance(items, list):
+            items = items[:30]
+        results["shopping"] = items
+        on_result("shopping", items)
+
+        t1 = time.time()
+        logs.append({
+            "agent": "ShoppingAgent",
+            "prompt": meal_plan.preview(),
+            "output": str(items)[:900],
+            "duration": f"{t1 - t0:.2f}s",
+        })
+
+    def _run_travel(
+        self,
+        user_query: str,
+        memory_context: List[str],
+        prefs: Dict[str, Any],
+        results: Dict[str, Any],
+        logs: List[Dict[str, Any]],
+        on_result: Callable[[str, Any], None],
+    ) -> None:
+        t0 = time.time()
+        try:
+            with span("agent", agent="TravelAgent"):
+                itinerary = Itinerary.parse(self.travel_agent.run(user_query, memory_context, prefs))
+        except DeadlineExceeded:
+            self._timed_out("TravelAgent", "travel", user_query, t0, results, logs)
+            return
+        t1 = time.time()
+        self._publish_travel(itinerary, results, on_result)
+
+        logs.append({
+            "agent": "TravelAgent",
+            "prompt": user_query,
+            "output": itinerary.preview(),
+            "duration": f"{t1 - t0:.2f}s",
+        })
+
+    def _timed_out(
+        self,
+        agent: str,
+        section: str,
+        user_query: str,
+        t0: float,
+        results: Dict[str, Any],
+        logs: List[Dict[str, Any]],
+    ) -> None:
+        results["timed_out"].append(section)
+        logs.append({
+            "agent": agent,
+            "prompt": user_query,
+            "output": "Timed out (request deadline exceeded).",
+            "duration": f"{time.time() - t0:.2f}s",
+        })
+
+    # ---------------------------------------------------------
+    # EXECUTION MODE (fused vs parallel cost model)
+    # ---------------------------------------------------------
+    def estimate_latency(
+        self,
+        user_query: str,
+        want_meal: bool,
+        want_shopping: bool,
+        want_travel: bool,
+    ) -> Dict[str, float]:
+        """
+        Predicted wall-clock seconds for each mode, from the primary
+        model's measured latency (base + per-byte) and typical answer sizes.
+        """
+        stats = model_stats()
+        meal_days = self.meal_agent.infer_days(user_query)
+        meal_bytes = SECTION_BYTES["meal_per_day"] * meal_days if want_meal else 0
+        shopping_bytes = SECTION_BYTES["shopping"] if want_shopping else 0
+        fallback_bytes = SECTION_BYTES["fallback_meal"] if want_shopping and not want_meal else 0
+        travel_days = self.travel_agent.infer_days(user_query) if want_travel else 0
+        travel_bytes = SECTION_BYTES["travel_per_day"] * travel_days
+
+        chain = sum(stats.estimate(b) for b in (meal_bytes, fallback_bytes, shopping_bytes) if b)
+        travel = stats.estimate(travel_bytes) if travel_bytes else 0.0
+        chunks = self.travel_agent.chunk_plan(travel_days) if want_travel else []
+        if chunks:
+            # Skeleton call, then the largest day group (groups run in parallel)
+            travel = stats.estimate(SECTION_BYTES["travel_skeleton_per_day"] * travel_days) + stats.estimate(
+                SECTION_BYTES["travel_per_day"] * max(len(c) for c in chunks)
+            )
+        return {
+            "parallel": max(chain, travel),
+            "fused": stats.estimate(meal_bytes + shopping_bytes + travel_bytes),
+        }
+
+    def choose_mode(
+        self,
+        user_query: str,
+        want_meal: bool,
+        want_shopping: bool,
+        want_travel: bool,
+    ) -> str:
+        if self.mode != "auto":
+            return self.mode
+        calls = want_meal + want_shopping + want_travel + (want_shopping and not want_meal)
+        if calls <= 1:
+            return "parallel"  # single agent call either way
+        est = self.estimate_latency(user_query, want_meal, want_shopping, want_travel)
+        return "fused" if est["fused"] < est["parallel"] else "parallel"
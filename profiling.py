@@ -0,0 +1,164 @@
+# profiling.py
+"""
+Opt-in per-request profiling of Orchestrator.handle.
+
+    results, logs, profile = profile_handle(orc, "Plan 3 days of meals")
+
+collects every span the request finishes (tracing.collect_spans) and turns
+them into a stage-by-stage breakdown: memory add / embeddings, preference
+extraction, memory search, each agent, validation, model attempts, PDF
+renders. The report also counts LLM calls, embed calls, generation cache
+hits / misses and prompt / response bytes for that request alone.
+
+Enabled with LIFEPILOT_PROFILE=1 (the Streamlit app also accepts
+?profile=1, server.py a "profile" body field). LIFEPILOT_PROFILE=cprofile
+additionally runs cProfile on the calling thread and writes
+<PROFILE_DIR>/<trace_id>.prof (work on the agent / hedge pools shows up
+in the stage breakdown, not in the cProfile dump).
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from tracing import Span, collect_spans
+
+PROFILE_MODES = ("0", "1", "cprofile")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+def profile_mode(override: Optional[str] = None) -> str:
+    """"0" (off), "1" (stages) or "cprofile"; `override` (e.g. a query param) wins over the env."""
+    mode = str(override if override is not None else os.getenv("LIFEPILOT_PROFILE", "0")).lower()
+    if mode in ("true", "yes", "on"):
+        mode = "1"
+    return mode if mode in PROFILE_MODES else "0"
+
+
+class RequestProfiler:
+    """
+    Context manager around one request: collects its spans and, with
+    cprofile=True, a cProfile of the calling thread.
+
+        with RequestProfiler() as prof:
+            orc.handle(query)
+        report = prof.report()
+    """
+
+    def __init__(self, cprofile: bool = False):
+        self.cprofile = cprofile
+        self.spans: List[Span] = []
+        self._collect = collect_spans()
+        self._profile: Optional[cProfile.Profile] = None
+        self._t0 = 0.0
+        self._t1 = 0.0
+
+    def __enter__(self) -> "RequestProfiler":
+        self.spans = self._collect.__enter__()
+        if self.cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._t1 = time.perf_counter()
+        if self._profile is not None:
+            self._profile.disable()
+        self._collect.__exit__(*exc)
+
+    def report(self, top: int = 25) -> Dict[str, Any]:
+        spans = sorted(list(self.spans), key=lambda s: s.start)
+        by_id = {s.span_id: s for s in spans}
+        roots = [s for s in spans if s.name == "request"] or spans[:1]
+        trace_id = roots[0].trace_id if roots else None
+
+        def depth(s: Span) -> int:
+            d = 0
+            while s.parent_id in by_id:
+                s = by_id[s.parent_id]
+                d += 1
+            return d
+
+        stages = [
+            {
+                "stage": _label(s),
+                "span": s.name,
+                "depth": depth(s),
+                "start_s": round(s.start - self._t0, 4),
+                "duration_s": round(s.duration, 4),
+                "error": s.error,
+                "cache": s.attrs.get("cache"),
+                "bytes_in": s.attrs.get("prompt_bytes") or s.attrs.get("text_bytes") or 0,
+                "bytes_out": s.attrs.get("response_bytes") or 0,
+            }
+            for s in spans
+        ]
+
+        totals: Dict[str, float] = {}
+        for st in stages:
+            if st["depth"] == 1:  # direct children of the request
+                totals[st["stage"]] = round(totals.get(st["stage"], 0.0) + st["duration_s"], 4)
+
+        attempts = [s for s in spans if s.name == "model_attempt"]
+        generates = [s for s in spans if s.name == "generate"]
+        out: Dict[str, Any] = {
+            "trace_id": trace_id,
+            "total_s": round(self._t1 - self._t0, 4),
+            "stages": stages,
+            "stage_totals_s": totals,
+            "llm_calls": len(attempts),
+            "embed_calls": sum(1 for s in spans if s.name == "embed"),
+            "cache_hits": sum(1 for s in generates if s.attrs.get("cache") == "hit"),
+            "cache_misses": sum(1 for s in generates if s.attrs.get("cache") == "miss"),
+            "prompt_bytes": sum(s.attrs.get("prompt_bytes") or 0 for s in attempts),
+            "response_bytes": sum(s.attrs.get("response_bytes") or 0 for s in attempts),
+        }
+        if self._profile is not None:
+            out.update(self._cprofile_output(trace_id, top))
+        return out
+
+    def _cprofile_output(self, trace_id: Optional[str], top: int) -> Dict[str, Any]:
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(top)
+        path = None
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{trace_id or int(time.time())}.prof")
+            stats.dump_stats(path)
+        except OSError:
+            path = None
+        return {"cprofile_path": path, "cprofile_top": stream.getvalue()}
+
+
+def _label(s: Span) -> str:
+    """Readable stage name: the span plus the agent / model / step it ran for."""
+    if s.name == "agent":
+        return s.attrs.get("agent") or "agent"
+    for key in ("model", "step", "kind", "prefix", "mode"):
+        if s.attrs.get(key):
+            return f"{s.name} ({s.attrs[key]})"
+    return s.name
+
+
+def profile_handle(
+    orc,
+    query: str,
+    mode: Optional[str] = None,
+    **handle_kwargs,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    orc.handle(query, return_logs=True, ...) plus the profile report
+    (None when profiling is off for this request).
+    """
+    mode = profile_mode(mode)
+    if mode == "0":
+        results, logs = orc.handle(query, return_logs=True, **handle_kwargs)
+        return results, logs, None
+    with RequestProfiler(cprofile=mode == "cprofile") as prof:
+        results, logs = orc.handle(query, return_logs=True, **handle_kwargs)
+    return results, logs, prof.report()
@@ -0,0 +1,145 @@
+# replay.py
+"""
+Re-run recorded traffic through Orchestrator.handle with the network
+unplugged: every model / embed call is answered from a cassette recorded
+with GEN_RECORD (see cassette.py).
+
+Each recorded user gets a fresh Orchestrator and replays their queries in
+recorded order; different users run concurrently. --pace also keeps the
+recorded arrival times. Reports latency percentiles, model / embed calls
+and cassette misses (calls this version makes that the recording did not
+contain, e.g. after a prompt change). --baseline compares with an earlier
+--json report, so two versions of the code can be compared on the same
+traffic.
+
+Usage:
+    GEN_RECORD=traffic.jsonl.gz python server.py             # record
+    python replay.py traffic.jsonl.gz --timing --json > v1.json
+    python replay.py traffic.jsonl.gz --timing --baseline v1.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# No API key needed (the cassette backend is swapped in by main()), and a
+# replay must not record itself; set before gen_client is imported.
+os.environ["GEN_BACKEND"] = "fake"
+os.environ.pop("GEN_RECORD", None)
+
+import gen_client
+from benchmark import percentile
+from cassette import ReplayBackend
+from orchestrator import Orchestrator
+
+
+def run_replay(backend: ReplayBackend, pace: bool, time_scale: float) -> Dict[str, Any]:
+    by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for req in backend.requests:
+        by_user.setdefault(str(req.get("user") or "default"), []).append(req)
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    t0 = time.perf_counter()
+
+    def session(user: str, requests: List[Dict[str, Any]]) -> None:
+        orc = Orchestrator(user_id=user)
+        for req in requests:
+            if pace:
+                delay = float(req.get("t") or 0.0) * time_scale - (time.perf_counter() - t0)
+                if delay > 0:
+                    time.sleep(delay)
+            start = time.perf_counter()
+            try:
+                orc.handle(req["query"], timeout_s=req.get("timeout_s") or 0)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    gen_client.clear_cache()
+    gen_client.reset_stats()
+    threads = [
+        threading.Thread(target=session, args=(user, reqs), name=f"replay-{user}")
+        for user, reqs in by_user.items()
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    stats = gen_client.get_stats()
+    return {
+        "cassette": backend.path,
+        "users": len(by_user),
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_s": round(wall, 4),
+        "p50_s": round(percentile(latencies, 50), 4),
+        "p95_s": round(percentile(latencies, 95), 4),
+        "p99_s": round(percentile(latencies, 99), 4),
+        "llm_calls": stats["llm_calls"],
+        "embed_calls": stats["embed_calls"],
+        "cache_hits": stats["cache_hits"],
+        "misses": backend.calls["misses"],
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    keys = ("requests", "errors", "wall_s", "p50_s", "p95_s", "p99_s", "llm_calls", "embed_calls", "misses")
+    print(f"{report['cassette']}: {report['users']} users")
+    print(f"{'metric':<12}{'this run':>12}" + (f"{'baseline':>12}{'change':>10}" if baseline else ""))
+    for key in keys:
+        line = f"{key:<12}{report[key]:>12}"
+        if baseline and key in baseline:
+            old = baseline[key]
+            change = f"{100.0 * (report[key] - old) / old:+.1f}%" if old else "-"
+            line += f"{old:>12}{change:>10}"
+        print(line)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded LifePilot traffic from a cassette.")
+    parser.add_argument("cassette", help="file recorded with GEN_RECORD")
+    parser.add_argument("--timing", action="store_true", help="sleep the recorded latency of every call")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply recorded latencies / arrival times")
+    parser.add_argument("--pace", action="store_true", help="issue requests at their recorded arrival times")
+    parser.add_argument("--fallback-fake", action="store_true",
+                        help="answer calls missing from the cassette with the fake backend instead of failing")
+    parser.add_argument("--baseline", help="earlier --json report to compare with")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    fallback = None
+    if args.fallback_fake:
+        from fake_backend import FakeBackend
+        fallback = FakeBackend(latency="const:0", embed_latency="const:0")
+    backend = ReplayBackend(args.cassette, timing=args.timing, time_scale=args.time_scale, fallback=fallback)
+    if not backend.requests:
+        print(f"{args.cassette} has no recorded requests", file=sys.stderr)
+        return 1
+    gen_client.set_backend(backend)
+
+    report = run_replay(backend, args.pace, args.time_scale)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        print_report(report, baseline)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
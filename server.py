@@ -0,0 +1,379 @@
+# server.py
+"""
+Headless JSON API for LifePilot (runs alongside the Streamlit UI).
+
+Endpoints (user_id scopes memory and preferences):
+    POST   /v1/intent                         {"query": ...}
+    POST   /v1/users/{user_id}/handle         {"query": ..., "stream": false, "timeout_s": 30, "profile": false}
+    GET    /v1/users/{user_id}/memory
+    POST   /v1/users/{user_id}/memory         {"text": ...}
+    GET    /v1/users/{user_id}/memory/search?q=...&k=5&mode=hybrid|vector|lexical
+    DELETE /v1/users/{user_id}/memory
+    GET    /v1/usage?by=agent,model,user         (token usage since start)
+    GET    /v1/scheduler                       (model call slots: in flight, queue depth, waits)
+    GET    /healthz
+    GET    /metrics                           (Prometheus text)
+
+With "stream": true (or ?stream=1) /handle answers with server-sent events:
+one "result" event per agent section as soon as it is ready, then "done".
+"timeout_s" (default REQUEST_TIMEOUT_S) bounds the whole request; sections
+that miss it are listed in results["timed_out"].
+"profile": true / "cprofile" (or ?profile=1, or LIFEPILOT_PROFILE) adds a
+per-stage "profile" report to the response (see profiling.py).
+
+Requests for one user run one at a time. A request that finds the work
+queue full gets 503 before it waits on its session; at most
+SERVER_SESSION_MAX_WAITING requests wait per session (429 beyond that),
+each for at most SERVER_SESSION_WAIT_S seconds (then 503).
+
+Usage:
+    python server.py --port 8081 --workers 4 --queue-size 32
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+
+import gen_client
+from memory.vector_memory import SEARCH_MODES
+from orchestrator import Orchestrator
+from profiling import profile_handle, profile_mode
+from tracing import REGISTRY
+from warmup import warmup
+
+
+SESSION_MAX_WAITING = int(os.getenv("SERVER_SESSION_MAX_WAITING", "4"))
+SESSION_WAIT_S = float(os.getenv("SERVER_SESSION_WAIT_S", "30"))
+
+
+def _busy(error_cls: type, message: str) -> web.HTTPException:
+    return error_cls(
+        text=json.dumps({"error": message}),
+        content_type="application/json",
+        headers={"Retry-After": "2"},
+    )
+
+
+class SessionLock:
+    """
+    Per-user asyncio.Lock with a bounded, timed wait.
+    hold() refuses with 429 when max_waiting requests already wait on the
+    session, and with 503 when the lock is not acquired within wait_s.
+    """
+
+    def __init__(self, max_waiting: int = SESSION_MAX_WAITING, wait_s: float = SESSION_WAIT_S):
+        self.max_waiting = max_waiting
+        self.wait_s = wait_s
+        self.waiting = 0
+        self._lock = asyncio.Lock()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    @asynccontextmanager
+    async def hold(self) -> AsyncIterator[None]:
+        if self.waiting >= self.max_waiting:
+            raise _busy(web.HTTPTooManyRequests, "too many requests for this user, retry later")
+        self.waiting += 1
+        acquire = asyncio.ensure_future(self._lock.acquire())
+        try:
+            await asyncio.wait({acquire}, timeout=self.wait_s)
+        finally:
+            self.waiting -= 1
+            if not acquire.done():
+                acquire.cancel()
+                # The acquire may still win before the cancel lands; hand the lock back
+                acquire.add_done_callback(
+                    lambda f: self._lock.release() if not f.cancelled() and f.exception() is None else None
+                )
+        if not acquire.done() or acquire.cancelled():
+            raise _busy(web.HTTPServiceUnavailable, "user session busy, retry later")
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+
+class SessionStore:
+    """LRU of per-user Orchestrators, each guarded by a SessionLock."""
+
+    def __init__(self, max_users: int = 1000):
+        self.max_users = max_users
+        self._sessions: "OrderedDict[str, Tuple[Orchestrator, SessionLock]]" = OrderedDict()
+
+    def get(self, user_id: str) -> Tuple[Orchestrator, SessionLock]:
+        entry = self._sessions.get(user_id)
+        if entry is None:
+            entry = (Orchestrator(user_id=user_id), SessionLock())
+            self._sessions[user_id] = entry
+            self._evict()
+        self._sessions.move_to_end(user_id)
+        return entry
+
+    def _evict(self) -> None:
+        while len(self._sessions) > self.max_users:
+            for uid, (_, lock) in self._sessions.items():
+                if not lock.locked():
+                    del self._sessions[uid]
+                    break
+            else:
+                return  # every session is busy; allow temporary overshoot
+
+
+class WorkQueue:
+    """
+    Bounded queue in front of a fixed pool of worker threads.
+    submit() fails fast with 503 when the queue is full (backpressure);
+    check_capacity() applies the same test before a handler waits on its session.
+    """
+
+    def __init__(self, workers: int = 4, maxsize: int = 32):
+        self.workers = workers
+        self.queue: "asyncio.Queue[Tuple[Callable[[], Any], asyncio.Future]]" = asyncio.Queue(maxsize)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self._tasks = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    def check_capacity(self) -> None:
+        if self.queue.full():
+            raise _busy(web.HTTPServiceUnavailable, "server busy, retry later")
+
+    def submit(self, fn: Callable[[], Any]) -> "asyncio.Future":
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((fn, fut))
+        except asyncio.QueueFull:
+            raise _busy(web.HTTPServiceUnavailable, "server busy, retry later")
+        return fut
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            fn, fut = await self.queue.get()
+            try:
+                if not fut.cancelled():
+                    result = await loop.run_in_executor(self.executor, fn)
+                    if not fut.cancelled():
+                        fut.set_result(result)
+            except Exception as e:
+                if not fut.cancelled():
+                    fut.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+
+# ==========================================================
+# HANDLERS
+# ==========================================================
+async def _json_body(request: web.Request) -> Dict[str, Any]:
+    try:
+        body = await request.json()
+    except Exception:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "invalid JSON body"}), content_type="application/json")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text=json.dumps({"error": "expected a JSON object"}), content_type="application/json")
+    return body
+
+
+async def intent(request: web.Request) -> web.Response:
+    body = await _json_body(request)
+    # Rule-based and stateless: no need to touch a user session or the pool
+    return web.json_response(request.app["intent_orc"].detect_intent(body.get("query", "")))
+
+
+async def handle(request: web.Request) -> web.StreamResponse:
+    user_id = request.match_info["user_id"]
+    body = await _json_body(request)
+    query = (body.get("query") or "").strip()
+    if not query:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "query is required"}), content_type="application/json")
+
+    stream = bool(body.get("stream")) or request.query.get("stream") in ("1", "true")
+    timeout_s = body.get("timeout_s")
+    if timeout_s is not None and (isinstance(timeout_s, bool) or not isinstance(timeout_s, (int, float)) or timeout_s < 0):
+        raise web.HTTPBadRequest(text=json.dumps({"error": "timeout_s must be a non-negative number"}), content_type="application/json")
+    profile = body.get("profile", request.query.get("profile"))
+    mode = profile_mode(None if profile is None else str(profile))
+    orc, lock = request.app["sessions"].get(user_id)
+    work: WorkQueue = request.app["work"]
+
+    work.check_capacity()
+    if not stream:
+        async with lock.hold():
+            results, logs, report = await work.submit(
+                lambda: profile_handle(orc, query, mode, timeout_s=timeout_s)
+            )
+        payload = {"user_id": user_id, "results": results, "logs": logs}
+        if report is not None:
+            payload["profile"] = report
+        return web.json_response(payload)
+
+    # ---------- Server-sent events ----------
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Optional[Tuple[str, Any]]]" = asyncio.Queue()
+
+    def on_result(section: str, value: Any) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, (section, value))
+
+    async with lock.hold():
+        fut = work.submit(lambda: profile_handle(orc, query, mode, on_result=on_result, timeout_s=timeout_s))
+        fut.add_done_callback(lambda _: events.put_nowait(None))
+
+        resp = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+        })
+        await resp.prepare(request)
+
+        while True:
+            item = await events.get()
+            if item is None:
+                break
+            section, value = item
+            payload = json.dumps({"section": section, "value": value}, ensure_ascii=False)
+            await resp.write(f"event: result\ndata: {payload}\n\n".encode("utf-8"))
+
+        try:
+            _, logs, report = fut.result()
+            done = {"logs": logs} if report is None else {"logs": logs, "profile": report}
+            await resp.write(f"event: done\ndata: {json.dumps(done, ensure_ascii=False)}\n\n".encode("utf-8"))
+        except Exception as e:
+            await resp.write(f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n".encode("utf-8"))
+    await resp.write_eof()
+    return resp
+
+
+async def memory_list(request: web.Request) -> web.Response:
+    orc, _ = request.app["sessions"].get(request.match_info["user_id"])
+    return web.json_response({"texts": list(orc.memory.texts)})
+
+
+async def memory_add(request: web.Request) -> web.Response:
+    body = await _json_body(request)
+    text = (body.get("text") or "").strip()
+    if not text:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "text is required"}), content_type="application/json")
+    orc, lock = request.app["sessions"].get(request.match_info["user_id"])
+    work: WorkQueue = request.app["work"]
+    work.check_capacity()
+    async with lock.hold():
+        await work.submit(lambda: orc.memory.add(text))
+    return web.json_response({"ok": True, "size": len(orc.memory.texts)}, status=201)
+
+
+async def memory_search(request: web.Request) -> web.Response:
+    q = request.query.get("q", "")
+    try:
+        k = int(request.query.get("k", "5"))
+    except ValueError:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "k must be an integer"}), content_type="application/json")
+    mode = request.query.get("mode") or None
+    if mode is not None and mode not in SEARCH_MODES:
+        raise web.HTTPBadRequest(
+            text=json.dumps({"error": f"mode must be one of {list(SEARCH_MODES)}"}), content_type="application/json",
+        )
+    orc, lock = request.app["sessions"].get(request.match_info["user_id"])
+    work: WorkQueue = request.app["work"]
+    work.check_capacity()
+    async with lock.hold():
+        hits = await work.submit(lambda: orc.memory.search(q, k=k, mode=mode))
+    return web.json_response({"results": hits})
+
+
+async def memory_clear(request: web.Request) -> web.Response:
+    orc, lock = request.app["sessions"].get(request.match_info["user_id"])
+    async with lock.hold():
+        orc.reset_all()
+    return web.json_response({"ok": True})
+
+
+async def usage(request: web.Request) -> web.Response:
+    by = tuple(f for f in request.query.get("by", "agent,model,user").split(",") if f)
+    unknown = [f for f in by if f not in ("agent", "model", "user")]
+    if unknown:
+        raise web.HTTPBadRequest(text=json.dumps({"error": f"unknown group field(s): {unknown}"}), content_type="application/json")
+    return web.json_response({"usage": gen_client.token_usage(by)})
+
+
+async def scheduler(request: web.Request) -> web.Response:
+    return web.json_response(gen_client.scheduler_stats())
+
+
+async def healthz(request: web.Request) -> web.Response:
+    work: WorkQueue = request.app["work"]
+    return web.json_response({"ok": True, "queued": work.queue.qsize(), "queue_size": work.queue.maxsize})
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(text=REGISTRY.render(), content_type="text/plain")
+
+
+# ==========================================================
+# APP
+# ==========================================================
+def create_app(workers: int = 4, queue_size: int = 32, max_users: int = 1000) -> web.Application:
+    app = web.Application()
+    app["sessions"] = SessionStore(max_users=max_users)
+    app["intent_orc"] = Orchestrator(user_id="intent")
+
+    async def on_startup(app: web.Application) -> None:
+        # Cold-start costs (clients, TLS, PDF renderer) before the first request
+        probe = os.getenv("WARMUP_PROBE", "0") == "1"
+        await asyncio.get_running_loop().run_in_executor(None, lambda: warmup(probe=probe))
+        app["work"] = WorkQueue(workers=workers, maxsize=queue_size)
+        app["work"].start()
+
+    async def on_cleanup(app: web.Application) -> None:
+        await app["work"].stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    app.router.add_post("/v1/intent", intent)
+    app.router.add_post("/v1/users/{user_id}/handle", handle)
+    app.router.add_get("/v1/users/{user_id}/memory", memory_list)
+    app.router.add_post("/v1/users/{user_id}/memory", memory_add)
+    app.router.add_get("/v1/users/{user_id}/memory/search", memory_search)
+    app.router.add_delete("/v1/users/{user_id}/memory", memory_clear)
+    app.router.add_get("/v1/usage", usage)
+    app.router.add_get("/v1/scheduler", scheduler)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="LifePilot HTTP API server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8081")))
+    parser.add_argument("--workers", type=int, default=4, help="concurrent orchestrator runs")
+    parser.add_argument("--queue-size", type=int, default=32, help="queued requests before 503")
+    parser.add_argument("--max-users", type=int, default=1000, help="in-memory user sessions (LRU)")
+    args = parser.parse_args()
+
+    web.run_app(
+        create_app(args.workers, args.queue_size, args.max_users),
+        host=args.host,
+        port=args.port,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
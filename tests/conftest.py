@@ -0,0 +1,25 @@
+# tests/conftest.py
+import os
+import sys
+
+# Tests never talk to the real API; set before gen_client is imported.
+os.environ["GEN_BACKEND"] = "fake"
+os.environ.pop("GEN_RECORD", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import gen_client
+from fake_backend import FakeBackend
+
+
+@pytest.fixture
+def fake_backend():
+    """Instant fake backend; restores the previous one afterwards."""
+    previous = gen_client.get_backend()
+    backend = FakeBackend(latency="const:0", embed_latency="const:0")
+    gen_client.set_backend(backend)
+    gen_client.clear_cache()
+    yield backend
+    gen_client.set_backend(previous)
+    gen_client.clear_cache()
@@ -0,0 +1,53 @@
+# tests/test_batch_checkpoint.py
+import json
+
+from batch import load_checkpoint
+
+
+def test_missing_file_means_nothing_done(tmp_path):
+    assert load_checkpoint(str(tmp_path / "none.jsonl")) == set()
+
+
+def test_only_ok_records_count(tmp_path):
+    path = tmp_path / "out.jsonl"
+    records = [
+        {"id": "q1", "status": "ok"},
+        {"id": "q2", "status": "error"},
+        {"id": 3, "status": "ok"},
+        {"id": "q1", "status": "ok"},
+    ]
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+    assert load_checkpoint(str(path)) == {"q1", "3"}
+
+
+def test_partial_last_line_is_ignored(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"id": "q1", "status": "ok"}\n{"id": "q2", "sta', encoding="utf-8")
+    assert load_checkpoint(str(path)) == {"q1"}
+
+
+def test_checkpoint_plans_keep_structured_meal_plans(tmp_path):
+    from batch import load_checkpoint_plans
+
+    plan = {"days": {"1": {"Dinner": "Dal"}}}
+    records = [
+        {"id": "q1", "status": "ok", "results": {"meal_plan": plan, "shopping": [{"item": "Dal"}]}},
+        {"id": "q2", "status": "ok", "results": {"meal_plan": {"raw": "free text"}, "shopping": []}},
+        {"id": "q3", "status": "error", "results": {"meal_plan": plan}},
+        {"id": "q4", "status": "ok", "results": {"travel": "Day 1 ..."}},
+    ]
+    path = tmp_path / "out.jsonl"
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+    assert load_checkpoint_plans(str(path)) == {"q1": {"meal_plan": plan, "shopping": [{"item": "Dal"}]}}
+
+
+def test_restored_plan_takes_edits(fake_backend):
+    from orchestrator import Orchestrator
+
+    orc = Orchestrator(user_id="resume-test")
+    intents = {"meal": True, "shopping": False, "travel": False}
+    assert orc.detect_edit("swap day 2 dinner", intents) == []
+    plan = {"days": {"1": {"Lunch": "Dal", "Dinner": "Curry"}, "2": {"Lunch": "Wrap", "Dinner": "Pasta"}}}
+    assert orc.restore_last_plan({"meal_plan": plan, "shopping": []})
+    assert orc.detect_edit("swap day 2 dinner", intents) == [(2, "Dinner")]
+    assert not orc.restore_last_plan({"meal_plan": {"raw": "no days"}})
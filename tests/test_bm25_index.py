@@ -0,0 +1,47 @@
+# tests/test_bm25_index.py
+from memory.bm25_index import BM25Index, tokenize
+
+
+def test_tokenize_lowercases_and_drops_stopwords():
+    assert tokenize("I am allergic to Peanuts, and the shellfish!") == ["am", "allergic", "peanuts", "shellfish"]
+
+
+def test_scores_only_documents_sharing_a_term():
+    index = BM25Index()
+    index.add(1, "vegetarian dinner ideas")
+    index.add(2, "allergic to peanuts")
+    index.add(3, "spicy vegetarian curry")
+    scores = index.scores("vegetarian curry")
+    assert set(scores) == {1, 3}
+    assert scores[3] > scores[1]
+
+
+def test_rare_terms_weigh_more():
+    index = BM25Index()
+    for doc in range(5):
+        index.add(doc, "dinner plan")
+    index.add(9, "dinner peanuts")
+    scores = index.scores("dinner peanuts")
+    assert max(scores, key=scores.get) == 9
+
+
+def test_remove_and_re_add():
+    index = BM25Index()
+    index.add(1, "thai food")
+    index.add(2, "thai curry")
+    index.remove(1)
+    assert 1 not in index and len(index) == 1
+    assert set(index.scores("food")) == set()
+    assert index.terms == 2  # "thai", "curry"
+    index.add(2, "pizza")  # re-adding replaces the old text
+    assert set(index.scores("thai")) == set()
+    assert set(index.scores("pizza")) == {2}
+
+
+def test_empty_index_and_clear():
+    index = BM25Index()
+    assert index.scores("anything") == {}
+    index.add(1, "thai food")
+    index.clear()
+    assert len(index) == 0 and index.terms == 0
+    index.remove(1)  # unknown docs are ignored
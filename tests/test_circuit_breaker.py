@@ -0,0 +1,64 @@
+# tests/test_circuit_breaker.py
+import pytest
+
+import gen_client
+from gen_client import CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(gen_client.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_threshold_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", threshold=3, cooldown_s=30)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()  # resets the streak
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("test", threshold=1, cooldown_s=30)
+    breaker.failure()
+    clock[0] += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # probe already out
+
+
+def test_probe_success_closes(clock):
+    breaker = CircuitBreaker("test", threshold=1, cooldown_s=30)
+    breaker.failure()
+    clock[0] += 30
+    breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_probe_failure_reopens(clock):
+    breaker = CircuitBreaker("test", threshold=5, cooldown_s=30)
+    for _ in range(5):
+        breaker.failure()
+    clock[0] += 30
+    breaker.allow()
+    breaker.failure()  # one failed probe is enough
+    assert breaker.state == "open"
+    clock[0] += 29
+    assert not breaker.allow()
+
+
+def test_lost_probe_is_replaced_after_another_cooldown(clock):
+    breaker = CircuitBreaker("test", threshold=1, cooldown_s=30)
+    breaker.failure()
+    clock[0] += 30
+    assert breaker.allow()
+    clock[0] += 30  # the probe never reported back
+    assert breaker.allow()
@@ -0,0 +1,43 @@
+# tests/test_context_cache.py
+import pytest
+
+import gen_client
+from agents import fused_agent, meal_agent, shopping_agent, travel_agent
+from memory import preference_extractor
+
+SHIPPED_PREFIXES = [
+    v
+    for module in (meal_agent, travel_agent, shopping_agent, fused_agent, preference_extractor)
+    for v in vars(module).values()
+    if isinstance(v, gen_client.PromptPrefix)
+]
+
+
+@pytest.fixture
+def cache_on(monkeypatch):
+    monkeypatch.setattr(gen_client, "CONTEXT_CACHE_MIN_TOKENS", 0)
+    previous = gen_client.CONTEXT_CACHE
+    gen_client.set_context_cache(True)
+    yield
+    gen_client.set_context_cache(previous)
+
+
+def test_shipped_prefixes_are_below_the_cache_minimum():
+    # Documented as inert: if a prefix grows past the minimum, update README / .env.example
+    assert len(SHIPPED_PREFIXES) >= 9
+    for prefix in SHIPPED_PREFIXES:
+        assert not gen_client._cacheable(prefix, gen_client.PRIMARY_MODEL), prefix.key
+
+
+def test_shipped_prefix_is_sent_inline_without_a_create_call(fake_backend, cache_on):
+    assert gen_client._cached_prefix(meal_agent.MEAL_PREFIX, gen_client.PRIMARY_MODEL, 0) is None
+    assert fake_backend.calls["caches"] == 0
+
+
+def test_prefix_over_the_minimum_is_registered_once(fake_backend, cache_on):
+    big = gen_client.PromptPrefix("test_big", "Follow these rules. " * 300)
+    assert gen_client._cacheable(big, gen_client.PRIMARY_MODEL)
+    name = gen_client._cached_prefix(big, gen_client.PRIMARY_MODEL, 0)
+    assert name is not None
+    assert gen_client._cached_prefix(big, gen_client.PRIMARY_MODEL, 0) == name
+    assert fake_backend.calls["caches"] == 1
@@ -0,0 +1,63 @@
+# tests/test_embedding_store.py
+import numpy as np
+import pytest
+
+from memory.embedding_store import EmbeddingStore
+
+VECTORS = [
+    [3.0, 4.0, 0.0, 0.0],
+    [0.0, 1.0, 1.0, 0.0],
+    [-1.0, 0.5, 0.25, 2.0],
+]
+TOLERANCE = {"float32": 1e-6, "float16": 1e-3, "int8": 1e-2}
+
+
+def _unit(vec):
+    vec = np.asarray(vec, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+@pytest.mark.parametrize("precision", ["float32", "float16", "int8"])
+def test_round_trip_is_normalised_within_precision(precision):
+    store = EmbeddingStore.from_vectors(VECTORS, precision)
+    assert len(store) == 3 and store.dim == 4
+    for i, vec in enumerate(VECTORS):
+        np.testing.assert_allclose(store.vector(i), _unit(vec), atol=TOLERANCE[precision])
+
+
+@pytest.mark.parametrize("precision", ["float32", "float16", "int8"])
+def test_scores_are_cosine_similarities(precision):
+    store = EmbeddingStore.from_vectors(VECTORS, precision)
+    expected = [float(_unit(v) @ _unit(VECTORS[0])) for v in VECTORS]
+    np.testing.assert_allclose(store.scores(VECTORS[0]), expected, atol=2 * TOLERANCE[precision])
+
+
+@pytest.mark.parametrize("precision", ["float32", "int8"])
+def test_setitem_and_delitem(precision):
+    store = EmbeddingStore.from_vectors(VECTORS, precision)
+    store[1] = [0.0, 0.0, 0.0, 5.0]
+    np.testing.assert_allclose(store.vector(1), [0, 0, 0, 1], atol=TOLERANCE[precision])
+    del store[0]
+    assert len(store) == 2
+    np.testing.assert_allclose(store.vector(0), [0, 0, 0, 1], atol=TOLERANCE[precision])
+    with pytest.raises(IndexError):
+        store[5] = VECTORS[0]
+
+
+def test_other_sizes_are_truncated_or_padded():
+    store = EmbeddingStore("float32", dim=2)
+    store.append([0.0, 2.0, 9.0])
+    store.append([1.0])
+    np.testing.assert_allclose(store.vectors(), [[0, 1], [1, 0]])
+
+
+def test_zero_vector_stays_zero_and_nbytes():
+    store = EmbeddingStore.from_vectors([[0.0] * 4, VECTORS[0]], "int8")
+    assert not store.vector(0).any()
+    assert store.scores(VECTORS[0])[0] == 0
+    assert store.nbytes == 2 * (4 + 4)  # int8 rows + one float32 scale each
+
+
+def test_unknown_precision():
+    with pytest.raises(ValueError):
+        EmbeddingStore("float8")
@@ -0,0 +1,23 @@
+# tests/test_logs.py
+from logs import AgentLog
+
+
+def test_retention_is_capacity_in_total():
+    log = AgentLog(capacity=4)
+    for i in range(3):
+        log.add("meal", f"m{i}")
+    for i in range(3):
+        log.add("travel", f"t{i}")
+    assert len(log) == 4
+    # The oldest meal entry fell off the shared ring, so per-agent reads lose it too
+    assert [e["message"] for e in log.by_agent("meal")] == ["m2"]
+    assert log.agents() == ["meal", "travel"]
+
+
+def test_tail_filters_newest_first_and_returns_oldest_first():
+    log = AgentLog(capacity=10)
+    for i in range(5):
+        log.add("meal" if i % 2 else "travel", str(i))
+    assert [e["message"] for e in log.tail(2, agent="travel")] == ["2", "4"]
+    assert [e["message"] for e in log.tail(3)] == ["2", "3", "4"]
+    assert log.tail(5, agent="shopping") == []
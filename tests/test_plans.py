@@ -0,0 +1,40 @@
+# tests/test_plans.py
+from utils.plans import MealPlan
+
+PLAN = MealPlan({
+    1: {"Breakfast": "Oats", "Lunch": "Dal", "Dinner": "Curry"},
+    2: {"Breakfast": "Toast", "Lunch": "Salad", "Dinner": "Pasta"},
+    3: {"Breakfast": "Idli", "Lunch": "Wrap", "Dinner": "Soup"},
+})
+
+
+def test_find_targets_day_and_slot():
+    assert PLAN.find_targets("swap day 2 dinner") == [(2, "Dinner")]
+
+
+def test_find_targets_weekday_is_day_number():
+    assert PLAN.find_targets("replace Wednesday lunch") == [(3, "Lunch")]
+
+
+def test_find_targets_slot_only_means_every_day():
+    assert PLAN.find_targets("replace the dinners") == [(1, "Dinner"), (2, "Dinner"), (3, "Dinner")]
+
+
+def test_find_targets_day_only_means_every_slot():
+    assert PLAN.find_targets("swap day 1") == [(1, "Breakfast"), (1, "Lunch"), (1, "Dinner")]
+
+
+def test_find_targets_ignores_missing_days_and_slots():
+    assert PLAN.find_targets("swap day 9 dinner") == []
+    assert PLAN.find_targets("swap day 1 snack") == []
+
+
+def test_find_targets_needs_a_day_or_slot():
+    assert PLAN.find_targets("make it spicier") == []
+
+
+def test_with_changes_shares_untouched_days():
+    changed = PLAN.with_changes({(2, "Dinner"): "Risotto"})
+    assert changed.days[2]["Dinner"] == "Risotto"
+    assert PLAN.days[2]["Dinner"] == "Pasta"
+    assert changed.days[1] is PLAN.days[1]
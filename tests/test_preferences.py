@@ -0,0 +1,41 @@
+# tests/test_preferences.py
+import pytest
+
+import gen_client
+from memory.preference_extractor import extract_preferences, extract_preferences_batch
+from orchestrator import Orchestrator
+
+MESSAGE = "I am vegetarian and allergic to peanuts"
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(gen_client, "_retry_delay", lambda attempt: 0.0)
+
+
+def test_extract_preferences_parses_the_answer(fake_backend):
+    prefs = extract_preferences(MESSAGE)
+    assert prefs["diet_type"] == "veg" and prefs["allergies"] == ["peanuts"]
+
+
+def test_failed_or_unparsable_extraction_is_none(fake_backend, no_backoff):
+    fake_backend.responder = lambda model, prompt: "no JSON here"
+    assert extract_preferences(MESSAGE) is None
+    assert extract_preferences_batch([MESSAGE, ""], max_retries=0)[0] is None
+    fake_backend.error_rate = 1.0
+    gen_client.clear_cache()
+    assert extract_preferences(MESSAGE) is None
+
+
+def test_preferences_recover_after_an_outage(fake_backend, no_backoff):
+    orc = Orchestrator(user_id="prefs-test")
+    orc.memory.add(MESSAGE)
+
+    fake_backend.error_rate = 1.0
+    prefs = orc.build_preferences()
+    assert not prefs["diet_type"] and prefs["allergies"] == []
+
+    fake_backend.error_rate = 0.0
+    prefs = orc.build_preferences()
+    assert prefs["diet_type"] == "veg"
+    assert prefs["allergies"] == ["peanuts"]
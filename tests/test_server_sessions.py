@@ -0,0 +1,79 @@
+# tests/test_server_sessions.py
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+from aiohttp import web
+
+from server import SessionLock, WorkQueue
+
+
+async def _until(cond):
+    while not cond():
+        await asyncio.sleep(0)
+
+
+def test_waiters_beyond_limit_get_429():
+    async def run():
+        lock = SessionLock(max_waiting=1, wait_s=5)
+        release = asyncio.Event()
+
+        async def holder():
+            async with lock.hold():
+                await release.wait()
+
+        async def waiter():
+            async with lock.hold():
+                return "ran"
+
+        t1 = asyncio.create_task(holder())
+        await _until(lambda: lock.locked() and lock.waiting == 0)
+        t2 = asyncio.create_task(waiter())
+        await _until(lambda: lock.waiting == 1)
+        with pytest.raises(web.HTTPTooManyRequests):
+            async with lock.hold():
+                pass
+        release.set()
+        await t1
+        assert await t2 == "ran"
+        assert not lock.locked() and lock.waiting == 0
+
+    asyncio.run(run())
+
+
+def test_wait_times_out_with_503_and_lock_stays_usable():
+    async def run():
+        lock = SessionLock(max_waiting=4, wait_s=0.01)
+        release = asyncio.Event()
+
+        async def holder():
+            async with lock.hold():
+                await release.wait()
+
+        t1 = asyncio.create_task(holder())
+        await _until(lock.locked)
+        with pytest.raises(web.HTTPServiceUnavailable) as exc:
+            async with lock.hold():
+                pass
+        assert exc.value.headers["Retry-After"] == "2"
+        release.set()
+        await t1
+        await asyncio.sleep(0)
+        assert not lock.locked() and lock.waiting == 0
+        async with lock.hold():
+            assert lock.locked()
+
+    asyncio.run(run())
+
+
+def test_check_capacity_rejects_when_queue_full():
+    async def run():
+        work = WorkQueue(workers=1, maxsize=1)  # not started: nothing drains the queue
+        work.check_capacity()
+        work.submit(lambda: None)
+        with pytest.raises(web.HTTPServiceUnavailable):
+            work.check_capacity()
+        work.executor.shutdown(wait=False)
+
+    asyncio.run(run())
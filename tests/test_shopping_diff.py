@@ -0,0 +1,42 @@
+# tests/test_shopping_diff.py
+import json
+
+from agents.shopping_agent import ShoppingAgent
+
+ITEMS = [
+    {"category": "Produce", "item": "Tomatoes", "quantity": "4", "notes": ""},
+    {"category": "Dairy", "item": "Paneer", "quantity": "200 g", "notes": ""},
+]
+
+
+def test_apply_diff_removes_by_name_case_insensitively():
+    out = ShoppingAgent().apply_diff(ITEMS, [], [" paneer "])
+    assert [row["item"] for row in out] == ["Tomatoes"]
+
+
+def test_apply_diff_appends_without_duplicates():
+    add = [
+        {"category": "Produce", "item": "tomatoes"},
+        {"category": "Grains", "item": "Rice", "quantity": 1},
+    ]
+    out = ShoppingAgent().apply_diff(ITEMS, add, [])
+    assert [row["item"] for row in out] == ["Tomatoes", "Paneer", "Rice"]
+    assert out[-1] == {"category": "Grains", "item": "Rice", "quantity": "1", "notes": ""}
+
+
+def test_apply_diff_caps_the_list():
+    add = [{"category": "Misc", "item": f"Item {i}"} for i in range(40)]
+    assert len(ShoppingAgent().apply_diff(ITEMS, add, [])) == 30
+
+
+def test_diff_parses_the_model_answer(fake_backend):
+    answer = {"add": [{"category": "Grains", "item": "Arborio rice"}, {"item": ""}, "junk"], "remove": ["Paneer", ""]}
+    fake_backend.responder = lambda model, prompt: "Here you go:\n" + json.dumps(answer)
+    add, remove = ShoppingAgent().diff(["Paneer curry"], ["Risotto"], ITEMS, {})
+    assert add == [{"category": "Grains", "item": "Arborio rice"}]
+    assert remove == ["Paneer"]
+
+
+def test_diff_returns_nothing_on_unparsable_answer(fake_backend):
+    fake_backend.responder = lambda model, prompt: "sorry, no JSON today {"
+    assert ShoppingAgent().diff(["Paneer curry"], ["Risotto"], ITEMS, {}) == ([], [])
@@ -0,0 +1,39 @@
+# tests/test_validators.py
+from utils.plans import MealPlan
+from utils.validators import validate_meal_plan
+
+VEG = {"diet_type": "vegetarian"}
+CLEAN = """Day 1
+Breakfast: Poha
+Lunch: Dal rice
+Dinner: Paneer tikka
+"""
+STRICT = """Day 1
+Breakfast: Upma
+Lunch: Rajma rice
+Dinner: Veg pulao
+"""
+
+
+def test_clean_plan_is_kept(fake_backend):
+    plan = MealPlan.parse(CLEAN)
+    assert validate_meal_plan(plan, VEG) is plan
+    assert fake_backend.calls["generate"] == 0
+
+
+def test_nonveg_dish_is_regenerated(fake_backend):
+    fake_backend.responder = lambda model, prompt: STRICT
+    plan = MealPlan.parse(CLEAN.replace("Paneer tikka", "Chicken curry"))
+    assert validate_meal_plan(plan, VEG).dishes() == ["Upma", "Rajma rice", "Veg pulao"]
+
+
+def test_nonveg_text_outside_slot_lines_is_caught(fake_backend):
+    fake_backend.responder = lambda model, prompt: STRICT
+    plan = MealPlan.parse("Add a boiled egg each morning for protein.\n\n" + CLEAN)
+    assert plan.dishes() == ["Poha", "Dal rice", "Paneer tikka"]  # the preamble is not a slot
+    assert validate_meal_plan(plan, VEG).dishes() == ["Upma", "Rajma rice", "Veg pulao"]
+
+
+def test_nothing_enforced_without_a_veg_diet(fake_backend):
+    plan = MealPlan.parse(CLEAN.replace("Paneer tikka", "Chicken curry"))
+    assert validate_meal_plan(plan, {"diet_type": ""}) is plan
@@ -0,0 +1,294 @@
+# tracing.py
+
+import contextvars
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from logs import GLOBAL_LOG
+
+# Print every finished span to stdout (debugging aid)
+TRACE_ECHO = os.getenv("TRACE_ECHO", "0") == "1"
+
+
+# ==========================================================
+# METRICS
+# ==========================================================
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_fmt_labels(k)} {v:g}" for k, v in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label key -> [bucket counts..., sum, count]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, row in items:
+            for upper, n in zip(self.buckets, row):
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', f'{upper:g}'))} {n:g}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {row[-1]:g}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {row[-2]:.6f}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {row[-1]:g}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text)
+            return self._metrics[name]
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, buckets)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+    "lifepilot_span_seconds", "Duration of traced spans by span name and agent."
+)
+SPAN_ERRORS = REGISTRY.counter(
+    "lifepilot_span_errors_total", "Spans that ended with an exception."
+)
+
+
+# ==========================================================
+# SPANS
+# ==========================================================
+INHERITED_ATTRS = ("agent", "user")
+
+
+class Span:
+    """
+    One timed unit of work (request, agent, model attempt, embed, ...).
+    Attributes are free-form; "agent" and "user" are inherited from the
+    parent span (INHERITED_ATTRS).
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "start", "end", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        inherited = (
+            {k: parent.attrs[k] for k in INHERITED_ATTRS if k in parent.attrs} if parent else {}
+        )
+        self.attrs: Dict[str, Any] = {**inherited, **attrs}
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration_s": round(self.duration, 6),
+            "error": self.error,
+            **self.attrs,
+        }
+
+
+_CURRENT: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "lifepilot_current_span", default=None
+)
+
+# Set by collect_spans(); spans finishing in this context (and in context
+# copies handed to worker threads) are appended to the list
+_COLLECTOR: contextvars.ContextVar[Optional[List[Span]]] = contextvars.ContextVar(
+    "lifepilot_span_collector", default=None
+)
+
+
+def current_span() -> Optional[Span]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """
+    Time a block of work as a child of the current span.
+
+        with span("model_attempt", model=model, slot=slot) as s:
+            ...
+            s.set(response_bytes=len(out))
+
+    Finished spans are written to logs.GLOBAL_LOG and aggregated into
+    lifepilot_span_seconds.
+    """
+    s = Span(name, _CURRENT.get(), attrs)
+    token = _CURRENT.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _CURRENT.reset(token)
+        s.end = time.perf_counter()
+        _finish(s)
+
+
+@contextmanager
+def collect_spans() -> Iterator[List[Span]]:
+    """Gather every span finished inside the block (used by profiling.py)."""
+    spans: List[Span] = []
+    token = _COLLECTOR.set(spans)
+    try:
+        yield spans
+    finally:
+        _COLLECTOR.reset(token)
+
+
+def _finish(s: Span) -> None:
+    collector = _COLLECTOR.get()
+    if collector is not None:
+        collector.append(s)
+    agent = s.attrs.get("agent") or "LifePilot"
+    SPAN_SECONDS.observe(s.duration, span=s.name, agent=agent)
+    if s.error:
+        SPAN_ERRORS.inc(span=s.name, agent=agent)
+
+    record = s.to_dict()
+    GLOBAL_LOG.add(
+        agent,
+        f"{s.name} {s.duration * 1000:.1f}ms",
+        level="ERROR" if s.error else "DEBUG",
+        meta=record,
+    )
+    if TRACE_ECHO:
+        print(f"[TRACE] {record}")
+
+
+# ==========================================================
+# PROMETHEUS ENDPOINT
+# ==========================================================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # keep stdout quiet
+        pass
+
+
+_SERVER: Optional[ThreadingHTTPServer] = None
+_SERVER_LOCK = threading.Lock()
+
+
+def start_metrics_server(port: Optional[int] = None, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """
+    Serve REGISTRY at http://host:port/metrics in a daemon thread.
+    Port defaults to $METRICS_PORT; does nothing if neither is set.
+    Safe to call repeatedly (e.g. on every Streamlit rerun).
+    """
+    global _SERVER
+    port = port or int(os.getenv("METRICS_PORT", "0") or 0)
+    if not port:
+        return None
+    with _SERVER_LOCK:
+        if _SERVER is None:
+            _SERVER = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_SERVER.serve_forever, name="metrics-http", daemon=True).start()
+        return _SERVER
@@ -1,10 +1,11 @@
 # ui/app.py
 
-import io
 import os
-import base64
 import json
 import sys
+import uuid
+from concurrent.futures import wait
+from contextlib import nullcontext
 from typing import Any
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,11 +15,12 @@ if PROJECT_ROOT not in sys.path:
 
 import streamlit as st
 import pandas as pd
+import altair as alt
 from orchestrator import Orchestrator
-
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
+from profiling import RequestProfiler, profile_mode
+from tracing import start_metrics_server
+from utils import assets, pdf_export
+from warmup import warmup
 
 
 # ---------------------------------------------------------
@@ -31,31 +33,43 @@ st.set_page_config(
 )
 
 
+# ---------------------------------------------------------
+# PROCESS WARM-UP (clients, PDF renderer, logo) – once per process
+# Streamlit runs this script only when a session connects, so the first
+# visitor waits for it (behind the spinner); every later session reuses it.
+# ---------------------------------------------------------
+@st.cache_resource(show_spinner="Warming up…")
+def _warmup() -> dict:
+    return warmup(probe=os.getenv("WARMUP_PROBE", "0") == "1")
+
+
+_warmup()
+
+
 # ---------------------------------------------------------
 # SESSION-STATE INITIALIZATION
 # ---------------------------------------------------------
+if "user_id" not in st.session_state:
+    # Stable per browser session: the scheduler's fair queues and token
+    # usage are keyed by it
+    st.session_state["user_id"] = f"ui-{uuid.uuid4().hex[:12]}"
+
 if "orc" not in st.session_state:
-    st.session_state["orc"] = Orchestrator()
+    st.session_state["orc"] = Orchestrator(user_id=st.session_state["user_id"])
 
 if "ready" not in st.session_state:
     st.session_state["ready"] = False
 
 orc: Orchestrator = st.session_state["orc"]
 
+# Prometheus /metrics on $METRICS_PORT (no-op when unset, started once per process)
+start_metrics_server()
+
 
 # ---------------------------------------------------------
-# UTIL: LOAD LOGO
+# LOGO (encoded once per process)
 # ---------------------------------------------------------
-def load_image_base64(path: str) -> str | None:
-    try:
-        with open(path, "rb") as f:
-            return base64.b64encode(f.read()).decode()
-    except Exception:
-        return None
-
-
-LOGO_PATH = os.path.join(BASE_DIR, "..", "docs", "lifepilot_logo.png")
-logo_b64 = load_image_base64(LOGO_PATH)
+logo_b64 = assets.logo_base64()
 
 
 # ---------------------------------------------------------
@@ -345,33 +359,27 @@ with btn_right:
 
 
 # ---------------------------------------------------------
-# PDF HELPERS
+# PDF DOWNLOADS (rendered lazily, cached by content hash)
 # ---------------------------------------------------------
-def build_pdf(text: str) -> bytes:
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = [Paragraph(text.replace("\n", "<br/>"), styles["Normal"])]
-    doc.build(story)
-    buffer.seek(0)
-    return buffer.read()
-
-
-def build_shopping_pdf(df: pd.DataFrame) -> bytes:
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    lines: list[str] = []
-    for _, row in df.iterrows():
-        lines.append(
-            f"{row.get('category', '')}: {row.get('item', '')} — "
-            f"{row.get('quantity', '')} {row.get('notes', '')}"
-        )
-    text = "<br/>".join(lines) if lines else "No items."
-    story = [Paragraph(text, styles["Normal"])]
-    doc.build(story)
-    buffer.seek(0)
-    return buffer.read()
+def pdf_download(kind: str, content: Any, label: str, file_name: str, key: str) -> None:
+    pdf = pdf_export.peek(kind, content)
+    if pdf is None:
+        # Background render not finished yet (or evicted) → render on click
+        if not st.button(f"📄 Prepare {label}", key=f"prepare_{key}"):
+            return
+        with st.spinner("Rendering PDF…"):
+            try:
+                pdf = pdf_export.get_pdf(kind, content)
+            except Exception:
+                st.warning("Could not render this PDF.")
+                return
+    st.download_button(
+        f"⬇️ Download {label}",
+        pdf,
+        file_name,
+        "application/pdf",
+        key=f"download_{key}",
+    )
 
 
 # ---------------------------------------------------------
@@ -381,33 +389,45 @@ if run_clicked:
     if not query.strip():
         st.warning("Please type a request before running LifePilot.")
     else:
-        with st.spinner("✨ Orchestrating agents…"):
-            results, logs = orc.handle(query, return_logs=True)
-
-        st.session_state["meal"] = results.get("meal")
-        st.session_state["shopping"] = results.get("shopping")
-        st.session_state["travel"] = results.get("travel")
-        st.session_state["logs"] = logs
-
-        st.session_state["meal_pdf"] = (
-            build_pdf(st.session_state["meal"]) if st.session_state.get("meal") else None
-        )
-
-        shopping_data: Any = st.session_state.get("shopping")
-        if isinstance(shopping_data, list):
-            try:
-                st.session_state["shopping_pdf"] = build_shopping_pdf(
-                    pd.DataFrame(shopping_data)
+        # ?profile=1 (or LIFEPILOT_PROFILE=1) records a stage breakdown of this run
+        profiling = profile_mode(st.query_params.get("profile"))
+        profiler = RequestProfiler(cprofile=profiling == "cprofile") if profiling != "0" else None
+        with profiler or nullcontext():
+            with st.spinner("✨ Orchestrating agents…"):
+                results, logs = orc.handle(query, return_logs=True)
+
+            st.session_state["meal"] = results.get("meal")
+            st.session_state["shopping"] = results.get("shopping")
+            st.session_state["travel"] = results.get("travel")
+            # Slotted forms parsed by the orchestrator; PDFs render from these
+            st.session_state["meal_plan"] = results.get("meal_plan")
+            st.session_state["itinerary"] = results.get("itinerary")
+            st.session_state["logs"] = logs
+            if results.get("edit"):
+                changed = results["edit"]
+                st.info(
+                    "Updated " + ", ".join(changed["slots"])
+                    + (f" · groceries +{len(changed['shopping_added'])} / -{len(changed['shopping_removed'])}"
+                       if changed["shopping_added"] or changed["shopping_removed"] else "")
+                )
+            if results.get("timed_out"):
+                st.warning(
+                    "Ran out of time for: " + ", ".join(results["timed_out"])
+                    + ". Showing what finished — try again for the rest."
                 )
-            except Exception:
-                st.session_state["shopping_pdf"] = None
-        else:
-            st.session_state["shopping_pdf"] = None
-
-        st.session_state["travel_pdf"] = (
-            build_pdf(st.session_state["travel"]) if st.session_state.get("travel") else None
-        )
 
+            # Warm the PDF cache off the request path; results show immediately
+            renders = []
+            if st.session_state.get("meal_plan"):
+                renders.append(pdf_export.prefetch("meal_plan", st.session_state["meal_plan"]))
+            if isinstance(st.session_state.get("shopping"), list):
+                renders.append(pdf_export.prefetch("shopping", st.session_state["shopping"]))
+            if st.session_state.get("itinerary"):
+                renders.append(pdf_export.prefetch("itinerary", st.session_state["itinerary"]))
+            if profiler is not None:
+                wait(renders)  # profiling only: include the PDF renders in the waterfall
+
+        st.session_state["profile"] = profiler.report() if profiler is not None else None
         st.session_state["ready"] = True
 
 
@@ -420,7 +440,7 @@ if st.session_state.get("ready"):
         <div class="lp-card">
             <div class="lp-section-title">📊 Planner Output</div>
             <div class="lp-section-caption">
-                Switch between Meal Plan, Shopping List, Travel Itinerary, and raw JSON logs.
+                Switch between Meal Plan, Shopping List, Travel Itinerary, raw JSON logs and performance.
             </div>
         </div>
         """,
@@ -433,6 +453,7 @@ if st.session_state.get("ready"):
             "🛒 Shopping List",
             "✈ Travel Itinerary",
             "📜 Logs",
+            "⏱ Performance",
         ]
     )
 
@@ -442,13 +463,7 @@ if st.session_state.get("ready"):
         meal = st.session_state.get("meal")
         if meal:
             st.markdown(f"```text\n{meal}\n```")
-            if st.session_state.get("meal_pdf"):
-                st.download_button(
-                    "⬇️ Download Meal Plan PDF",
-                    st.session_state["meal_pdf"],
-                    "meal_plan.pdf",
-                    "application/pdf",
-                )
+            pdf_download("meal_plan", st.session_state["meal_plan"], "Meal Plan PDF", "meal_plan.pdf", "meal")
         else:
             st.info("No meal plan generated for this query.")
 
@@ -463,13 +478,7 @@ if st.session_state.get("ready"):
                 except Exception:
                     st.write(shopping)
 
-            if st.session_state.get("shopping_pdf"):
-                st.download_button(
-                    "⬇️ Download Shopping List PDF",
-                    st.session_state["shopping_pdf"],
-                    "shopping_list.pdf",
-                    "application/pdf",
-                )
+                pdf_download("shopping", shopping, "Shopping List PDF", "shopping_list.pdf", "shopping")
         else:
             st.info("No shopping list generated.")
 
@@ -479,13 +488,8 @@ if st.session_state.get("ready"):
         travel = st.session_state.get("travel")
         if travel:
             st.markdown(f"```text\n{travel}\n```")
-            if st.session_state.get("travel_pdf"):
-                st.download_button(
-                    "⬇️ Download Travel Itinerary PDF",
-                    st.session_state["travel_pdf"],
-                    "travel_itinerary.pdf",
-                    "application/pdf",
-                )
+            pdf_download("itinerary", st.session_state["itinerary"], "Travel Itinerary PDF",
+                         "travel_itinerary.pdf", "travel")
         else:
             st.info("No travel itinerary generated.")
 
@@ -494,6 +498,49 @@ if st.session_state.get("ready"):
         st.markdown("#### 📜 Raw JSON Logs")
         st.json(st.session_state.get("logs"))
 
+    # -------- Performance Tab --------
+    with tabs[4]:
+        st.markdown("#### ⏱ Performance")
+        profile = st.session_state.get("profile")
+        if not profile:
+            st.info("Profiling is off. Add `?profile=1` to the URL (or set LIFEPILOT_PROFILE=1) and run again.")
+        else:
+            cols = st.columns(5)
+            cols[0].metric("Total", f"{profile['total_s']:.2f}s")
+            cols[1].metric("LLM calls", profile["llm_calls"])
+            cols[2].metric("Embed calls", profile["embed_calls"])
+            cols[3].metric("Cache hits", f"{profile['cache_hits']} / {profile['cache_hits'] + profile['cache_misses']}")
+            cols[4].metric("Bytes in / out", f"{profile['prompt_bytes']:,} / {profile['response_bytes']:,}")
+
+            stages = pd.DataFrame(profile["stages"])
+            max_depth = int(stages["depth"].max()) if not stages.empty else 0
+            depth = st.slider("Span depth", 0, max(1, max_depth), min(2, max(1, max_depth)), key="profile_depth")
+            shown = stages[stages["depth"] <= depth].copy()
+            shown["end_s"] = shown["start_s"] + shown["duration_s"]
+            shown["row"] = [f"{i:02d} {'  ' * d}{label}" for i, (d, label) in enumerate(zip(shown["depth"], shown["stage"]))]
+            chart = (
+                alt.Chart(shown)
+                .mark_bar()
+                .encode(
+                    x=alt.X("start_s:Q", title="seconds"),
+                    x2="end_s:Q",
+                    y=alt.Y("row:N", sort=None, title=None),
+                    color=alt.Color("span:N", legend=alt.Legend(title="span")),
+                    tooltip=["stage", "duration_s", "cache", "bytes_in", "bytes_out", "error"],
+                )
+                .properties(height=max(160, 22 * len(shown)))
+            )
+            st.altair_chart(chart, use_container_width=True)
+            st.dataframe(
+                shown[["stage", "start_s", "duration_s", "cache", "bytes_in", "bytes_out", "error"]],
+                use_container_width=True,
+                hide_index=True,
+            )
+            if profile.get("cprofile_top"):
+                with st.expander("cProfile (calling thread, top functions by cumulative time)"):
+                    st.caption(profile.get("cprofile_path") or "")
+                    st.code(profile["cprofile_top"])
+
 
 # ---------------------------------------------------------
 # FOOTER
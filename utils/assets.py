@@ -0,0 +1,23 @@
+# utils/assets.py
+
+import base64
+import os
+from functools import lru_cache
+from typing import Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGO_PATH = os.path.join(PROJECT_ROOT, "docs", "lifepilot_logo.png")
+
+
+@lru_cache(maxsize=16)
+def image_base64(path: str) -> Optional[str]:
+    """Base64 of a static image, read and encoded once per process."""
+    try:
+        with open(path, "rb") as f:
+            return base64.b64encode(f.read()).decode()
+    except Exception:
+        return None
+
+
+def logo_base64() -> Optional[str]:
+    return image_base64(LOGO_PATH)
@@ -0,0 +1,152 @@
+# utils/pdf_export.py
+
+import contextvars
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from xml.sax.saxutils import escape
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate
+
+from tracing import span
+from utils.plans import Itinerary, MealPlan
+
+
+# ==========================================================
+# RENDERERS
+# ==========================================================
+def build_pdf(text: str) -> bytes:
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = [Paragraph(text.replace("\n", "<br/>"), styles["Normal"])]
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def build_shopping_pdf(items: List[Dict[str, Any]]) -> bytes:
+    """Render the shopping list straight from the item dicts (no DataFrame)."""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    lines = [
+        f"{row.get('category', '')}: {row.get('item', '')} — "
+        f"{row.get('quantity', '')} {row.get('notes', '')}"
+        for row in items
+        if isinstance(row, dict)
+    ]
+    text = "<br/>".join(lines) if lines else "No items."
+    story = [Paragraph(text, styles["Normal"])]
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def _build_plan_pdf(plan) -> bytes:
+    """One heading per day and one paragraph per slot, straight from the slots."""
+    if not plan.structured:
+        return build_pdf(plan.raw)
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+    for day, slots in plan.days.items():
+        story.append(Paragraph(f"Day {day}", styles["Heading3"]))
+        story.extend(
+            Paragraph(f"<b>{escape(slot)}:</b> {escape(value)}", styles["Normal"])
+            for slot, value in slots.items()
+        )
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def build_meal_plan_pdf(plan: Dict[str, Any]) -> bytes:
+    """Render a MealPlan from its to_dict() form."""
+    return _build_plan_pdf(MealPlan.from_dict(plan))
+
+
+def build_itinerary_pdf(itinerary: Dict[str, Any]) -> bytes:
+    """Render an Itinerary from its to_dict() form."""
+    return _build_plan_pdf(Itinerary.from_dict(itinerary))
+
+
+_RENDERERS = {
+    "text": build_pdf,
+    "shopping": build_shopping_pdf,
+    "meal_plan": build_meal_plan_pdf,
+    "itinerary": build_itinerary_pdf,
+}
+
+
+# ==========================================================
+# CONTENT-ADDRESSED CACHE + BACKGROUND WORKER
+# ==========================================================
+MAX_CACHED_PDFS = 128
+
+_LOCK = threading.Lock()
+_CACHE: "OrderedDict[str, bytes]" = OrderedDict()  # content hash -> pdf bytes
+_INFLIGHT: Dict[str, Future] = {}
+_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf")
+
+
+def content_key(kind: str, content: Any) -> str:
+    raw = content if isinstance(content, str) else json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(f"{kind}\0{raw}".encode("utf-8")).hexdigest()
+
+
+def _render(key: str, kind: str, content: Any) -> bytes:
+    try:
+        with span("pdf", kind=kind) as s:
+            pdf = _RENDERERS[kind](content)
+            s.set(response_bytes=len(pdf))
+        with _LOCK:
+            _CACHE[key] = pdf
+            _CACHE.move_to_end(key)
+            while len(_CACHE) > MAX_CACHED_PDFS:
+                _CACHE.popitem(last=False)
+        return pdf
+    finally:
+        with _LOCK:
+            _INFLIGHT.pop(key, None)
+
+
+def peek(kind: str, content: Any) -> Optional[bytes]:
+    """Cached PDF bytes if already rendered, else None (never renders)."""
+    key = content_key(kind, content)
+    with _LOCK:
+        pdf = _CACHE.get(key)
+        if pdf is not None:
+            _CACHE.move_to_end(key)
+        return pdf
+
+
+def prefetch(kind: str, content: Any) -> Future:
+    """
+    Queue a background render. Identical content is rendered at most once:
+    cache hits and in-flight renders return the existing result / future.
+    """
+    key = content_key(kind, content)
+    with _LOCK:
+        if key in _CACHE:
+            done: Future = Future()
+            done.set_result(_CACHE[key])
+            return done
+        fut = _INFLIGHT.get(key)
+        if fut is None:
+            # Context copy: the render span joins the caller's trace / profile
+            ctx = contextvars.copy_context()
+            fut = _INFLIGHT[key] = _EXECUTOR.submit(ctx.run, _render, key, kind, content)
+        return fut
+
+
+def get_pdf(kind: str, content: Any, timeout: Optional[float] = None) -> bytes:
+    """Render on demand (or wait for the background render) and return bytes."""
+    cached = peek(kind, content)
+    if cached is not None:
+        return cached
+    return prefetch(kind, content).result(timeout)
@@ -0,0 +1,176 @@
+# utils/plans.py
+"""
+Compact typed plans: days → slots → dish / activity.
+
+Agent answers are parsed ONCE right after generation; validation,
+shopping, edits, logs and PDF export work on these objects instead of
+re-scanning or copying the raw text. Dish / activity strings are shared,
+never copied, and the rendered text is built lazily and cached.
+"""
+
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+MEAL_SLOTS = ("Breakfast", "Lunch", "Snack", "Dinner")
+TRAVEL_SLOTS = ("Morning", "Afternoon", "Evening")
+TRAVEL_ICONS = {"Morning": "🌅", "Afternoon": "🌞", "Evening": "🌙"}
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+DAY_HEADER = re.compile(r"^\W*Day\s*(\d+)\b[^A-Za-z0-9]*(.*)$", re.IGNORECASE)
+MEAL_LINE = re.compile(r"^\W*(Breakfast|Lunch|Dinner|Snacks?)\b\W*?[:\-–—]\s*(.+)$", re.IGNORECASE)
+TRAVEL_LINE = re.compile(r"^\W*(Morning|Afternoon|Evening)\b\W*?[:\-–—]\s*(.+)$", re.IGNORECASE)
+
+
+def _slot_name(raw: str) -> str:
+    name = raw.capitalize()
+    return "Snack" if name.startswith("Snack") else name
+
+
+def _parse_days(text: str, line_re: "re.Pattern[str]") -> Dict[int, Dict[str, str]]:
+    """Shared single pass over "Day N" headers and "Slot: value" lines."""
+    days: Dict[int, Dict[str, str]] = {}
+    day: Optional[int] = None
+    last: Optional[Tuple[int, str]] = None
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        header = DAY_HEADER.match(line)
+        if header:
+            day = int(header.group(1))
+            days.setdefault(day, {})
+            last = None
+            line = header.group(2).strip()
+            if not line:
+                continue
+        slot = line_re.match(line)
+        if slot:
+            if day is None:
+                day = 1  # no headers → a single day
+            last = (day, _slot_name(slot.group(1)))
+            days.setdefault(day, {})[last[1]] = slot.group(2).strip()
+        elif last is not None:
+            days[last[0]][last[1]] += " " + line
+    return {d: slots for d, slots in sorted(days.items()) if slots}
+
+
+class _Plan:
+    """Base for MealPlan / Itinerary: {day: {slot: value}} plus the answer text."""
+
+    __slots__ = ("days", "raw", "_text")
+
+    def __init__(self, days: Dict[int, Dict[str, str]], raw: str = ""):
+        self.days = days
+        # The model's answer as shown to the user; plans built from slots
+        # (edits, from_dict) have none and render on demand
+        self.raw = (raw or "").strip()
+        self._text: Optional[str] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.days or self.raw)
+
+    @property
+    def structured(self) -> bool:
+        return bool(self.days)
+
+    def slots(self) -> Iterator[Tuple[int, str, str]]:
+        for day, slots in self.days.items():
+            for slot, value in slots.items():
+                yield day, slot, value
+
+    def _line(self, slot: str, value: str) -> str:
+        return f"{slot}: {value}"
+
+    @property
+    def text(self) -> str:
+        """Canonical plain text (built once)."""
+        if self._text is None:
+            self._text = self.raw or "\n\n".join(
+                f"Day {day}\n" + "\n".join(self._line(s, v) for s, v in slots.items())
+                for day, slots in self.days.items()
+            )
+        return self._text
+
+    def preview(self, limit: int = 900) -> str:
+        """Short one-line-per-slot summary for logs (stops once `limit` is reached)."""
+        if not self.days:
+            return self.raw[:limit]
+        out: List[str] = []
+        used = 0
+        for day, slot, value in self.slots():
+            line = f"Day {day} {slot}: {value}"
+            if used + len(line) > limit:
+                out.append("…")
+                break
+            out.append(line)
+            used += len(line) + 1
+        return "\n".join(out)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly form (day keys as strings); shares the value strings."""
+        if not self.days:
+            return {"raw": self.raw}
+        return {"days": {str(d): slots for d, slots in self.days.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        days = {int(d): dict(s) for d, s in (data.get("days") or {}).items()}
+        return cls(days, "" if days else data.get("raw", ""))
+
+
+class MealPlan(_Plan):
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, text: str) -> "MealPlan":
+        return cls(_parse_days(text, MEAL_LINE), text)
+
+    def dishes(self) -> List[str]:
+        return [dish for _, _, dish in self.slots()] if self.days else [self.raw]
+
+    def dish_counts(self) -> List[Tuple[str, int]]:
+        """Distinct dishes with how often they appear (plan order)."""
+        counts: Dict[str, int] = {}
+        for dish in self.dishes():
+            counts[dish] = counts.get(dish, 0) + 1
+        return list(counts.items())
+
+    def with_changes(self, changes: Dict[Tuple[int, str], str]) -> "MealPlan":
+        """New plan with some (day, slot) dishes replaced; other days are shared."""
+        days = dict(self.days)
+        for (day, slot), dish in changes.items():
+            days[day] = {**days[day], slot: dish}
+        return MealPlan(days)
+
+    def find_targets(self, text: str) -> List[Tuple[int, str]]:
+        """
+        (day, slot) pairs an edit request refers to. Days come from "day 3"
+        or weekday names (Monday = Day 1), slots from meal names; a missing
+        part means "all" of it. [] when the request names neither.
+        """
+        q = (text or "").lower()
+        days = sorted({int(n) for n in re.findall(r"\bday\s*(\d+)\b", q)})
+        days += [i + 1 for i, name in enumerate(WEEKDAYS) if re.search(rf"\b{name}\b", q)]
+        slots = [s for s in MEAL_SLOTS if re.search(rf"\b{s.lower()}", q)]
+        if not days and not slots:
+            return []
+
+        targets = []
+        for day in sorted(set(days) or self.days):
+            for slot in slots or list(self.days.get(day, {})):
+                if slot in self.days.get(day, {}):
+                    targets.append((day, slot))
+        return targets
+
+
+class Itinerary(_Plan):
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, text: str) -> "Itinerary":
+        return cls(_parse_days(text, TRAVEL_LINE), text)
+
+    def _line(self, slot: str, value: str) -> str:
+        icon = TRAVEL_ICONS.get(slot)
+        return f"{icon} {slot}: {value}" if icon else f"{slot}: {value}"
@@ -3,7 +3,8 @@
 import re
 from typing import Dict, Any
 
-from gen_client import generate
+from gen_client import generate, output_budget
+from utils.plans import MealPlan
 
 
 NON_VEG_WORDS = [
@@ -24,6 +25,12 @@ def _safe_lower(val) -> str:
     return val.lower() if isinstance(val, str) else ""
 
 
+def violates_diet(text: str, prefs: Dict[str, Any]) -> bool:
+    """True if prefs ask for veg / vegan and `text` names a non-veg food."""
+    diet = _safe_lower(prefs.get("diet_type", ""))
+    return any(key in diet for key in ["veg", "vegan"]) and _contains_nonveg(text or "")
+
+
 def regenerate_strict_meals(prefs: Dict[str, Any]) -> str:
     """
     Ask the LLM to regenerate a strictly vegetarian plan,
@@ -41,14 +48,16 @@ Only vegetarian meals allowed.
 Output ONLY the meal plan as plain text.
 No JSON, no bullet symbols, no code fences.
 """
-    return generate(prompt).strip()
+    return generate(prompt, max_output_tokens=output_budget("meal", 5)).strip()
 
 
-def validate_meal_plan(text: str, prefs: Dict[str, Any]) -> str:
+def validate_meal_plan(plan: MealPlan, prefs: Dict[str, Any]) -> MealPlan:
     """
     Enforce vegetarian / vegan constraints based on prefs.
-    If diet_type indicates veg/vegan and the text contains
-    non-veg keywords, regenerate once with a strict prompt.
+    If diet_type indicates veg/vegan and any dish of the parsed plan, or
+    the text shown to the user (preamble / tips outside the slot lines
+    included), contains non-veg keywords, regenerate once with a strict
+    prompt. Returns `plan` itself when it passes, else the regenerated plan.
     """
 
     diet = _safe_lower(prefs.get("diet_type", ""))
@@ -59,10 +68,10 @@ def validate_meal_plan(text: str, prefs: Dict[str, Any]) -> str:
 
     if not is_strict_veg:
         # Nothing special to enforce
-        return text or ""
+        return plan
 
-    if _contains_nonveg(text or ""):
+    if any(_contains_nonveg(dish) for dish in plan.dishes()) or _contains_nonveg(plan.text):
         # Regenerate a strictly veg plan
-        return regenerate_strict_meals(prefs)
+        return MealPlan.parse(regenerate_strict_meals(prefs))
 
-    return text or ""
+    return plan
@@ -0,0 +1,81 @@
+# warmup.py
+"""
+Process warm-up: pay cold-start costs before the first user request.
+
+  - imports the orchestrator, agents and PDF renderer
+  - opens a connection per configured API key (SDK client + TLS)
+  - optionally (--probe / WARMUP_PROBE=1) sends one tiny generate per
+    model to seed latency stats and 429 health
+  - renders a throwaway PDF (loads reportlab fonts / styles)
+  - base64-encodes the logo for the UI header
+
+server.py calls warmup() once at startup, before it accepts requests. The
+Streamlit app calls it once per process too, but Streamlit only runs the
+app script when a session connects, so there the first visitor's page load
+pays for it. Run it standalone to check keys and connectivity from a new
+container:
+
+    python warmup.py --probe
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from tracing import span
+
+
+@contextmanager
+def _step(report: Dict[str, Any], name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    with span("warmup", step=name):
+        yield
+    report["steps_s"][name] = round(time.perf_counter() - t0, 3)
+
+
+def warmup(probe: bool = False) -> Dict[str, Any]:
+    """Run every warm-up step; returns per-step timings and outcomes."""
+    t0 = time.perf_counter()
+    report: Dict[str, Any] = {"steps_s": {}}
+
+    with _step(report, "imports"):
+        import gen_client
+        import orchestrator  # noqa: F401  (agents, memory, validators)
+        from utils import assets, pdf_export
+
+    with _step(report, "clients"):
+        report["clients"] = gen_client.connect_clients()
+
+    if probe:
+        with _step(report, "probe"):
+            report["models"] = gen_client.probe_models()
+
+    with _step(report, "pdf"):
+        pdf_export.build_pdf("LifePilot warm-up")
+
+    with _step(report, "assets"):
+        report["logo"] = assets.logo_base64() is not None
+
+    report["total_s"] = round(time.perf_counter() - t0, 3)
+    print(f"[warmup] done in {report['total_s']:.2f}s {report['steps_s']}", file=sys.stderr)
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Warm up LifePilot before serving.")
+    parser.add_argument("--probe", action="store_true", default=os.getenv("WARMUP_PROBE", "0") == "1",
+                        help="send one tiny generate per model")
+    args = parser.parse_args()
+
+    report = warmup(probe=args.probe)
+    print(json.dumps(report, indent=2))
+    failed = [s for s, outcome in report["clients"].items() if outcome != "ok"]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())